@@ -0,0 +1,142 @@
+"""
+Request-count, wall-time and peak-memory benchmarks of FmcApiHandler
+against the local mock FMC (fmc_auto_modules.mockfmc).
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --workload list_50k_objects --latency 0.02
+    python benchmarks/run_benchmarks.py --json results.json
+
+The mock runs in a separate process so peak memory only covers the client.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import tracemalloc
+
+import requests
+
+# Run from a checkout without installing the package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fmc_auto_modules.fmc_baseapi import FmcApiHandler
+from fmc_auto_modules.mockfmc import STATS_PATH, MockFmcServer
+from fmc_auto_modules.ratelimit import configure_rate_limiter
+
+
+def _serve(queue, kwargs):
+    server = MockFmcServer(**kwargs)
+    queue.put(server.address)
+    server.httpd.serve_forever()
+
+
+class MockProcess(object):
+    """
+    Mock FMC running in a child process
+    """
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.process = None
+        self.address = None
+
+    def __enter__(self):
+        queue = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=_serve, args=(queue, self.kwargs),
+                                               daemon=True)
+        self.process.start()
+        self.address = queue.get(timeout=600)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.process.terminate()
+        self.process.join()
+
+    def stats(self, reset=False):
+        url = 'http://{}{}'.format(self.address, STATS_PATH)
+        return (requests.post(url) if reset else requests.get(url)).json()
+
+
+def create_1k_hosts(fmc, scale):
+    payloads = [{"name": "bench-host-{}".format(index), "type": "hosts",
+                 "value": "192.168.{}.{}".format(index >> 8 & 255, index & 255)}
+                for index in range(int(1000 * scale))]
+    results = fmc.create_objects_bulk("hosts", payloads)
+    return sum(1 for payload, rcode, rval in results if rcode == 201)
+
+
+def add_500_nat_rules(fmc, scale):
+    rules = [{"targetNatPolicy": "nat-policy-0",
+              "originalNetwork": "host-{}".format(index),
+              "translatedNetwork": "host-{}".format(index),
+              "sourceInterface": "inside-zone",
+              "destinationInterface": "outside-zone",
+              "natType": "STATIC"}
+             for index in range(int(500 * scale))]
+    results = fmc.create_autonatrules_bulk(rules)
+    return sum(1 for rule, rcode, rval in results if rcode == 201)
+
+
+def list_50k_objects(fmc, scale):
+    return sum(1 for item in fmc.iter_objects("hosts"))
+
+
+# workload -> (function, mock dataset size)
+WORKLOADS = {
+    'create_1k_hosts': (create_1k_hosts, 0),
+    'add_500_nat_rules': (add_500_nat_rules, 500),
+    'list_50k_objects': (list_50k_objects, 50000),
+}
+
+
+def run(name, latency, scale):
+    """
+    Run one workload against a fresh mock and return its measurements
+    """
+    func, dataset_size = WORKLOADS[name]
+    with MockProcess(latency=latency, dataset_size=int(dataset_size * scale)) as mock:
+        configure_rate_limiter(mock.address, requests_per_minute=10 ** 9, burst=10 ** 6)
+        with FmcApiHandler(mock.address, 'admin', 'admin', scheme='http') as fmc:
+            mock.stats(reset=True)
+            tracemalloc.start()
+            started = time.perf_counter()
+            items = func(fmc, scale)
+            elapsed = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        stats = mock.stats()
+    return {
+        'workload': name,
+        'items': items,
+        'requests': stats['total'],
+        'requests_by_endpoint': stats['requests'],
+        'wall_time_s': round(elapsed, 3),
+        'peak_memory_kib': peak // 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FmcApiHandler against a mock FMC")
+    parser.add_argument('--workload', choices=sorted(WORKLOADS), action='append',
+                        help="Workload to run (repeatable), all by default.")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="Seconds of latency the mock adds to every request.")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="Multiply workload sizes, e.g. 0.1 for a quick run.")
+    parser.add_argument('--json', type=str, help="Write the results to this file.")
+    args = parser.parse_args()
+    results = [run(name, args.latency, args.scale)
+               for name in (args.workload or sorted(WORKLOADS))]
+    print("{:<20} {:>8} {:>9} {:>12} {:>16}".format(
+        "workload", "items", "requests", "wall time s", "peak memory KiB"))
+    for result in results:
+        print("{workload:<20} {items:>8} {requests:>9} {wall_time_s:>12} "
+              "{peak_memory_kib:>16}".format(**result))
+    if args.json:
+        with open(args.json, 'w') as fd:
+            json.dump(results, fd, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+from fmc_auto_modules.fmc_baseapi import (
+    AUTONATRULE_INTERFACE_TYPE,
+    NATPOLICY_INDEX,
+    OBJECTS_TYPE_ALLOWED,
+    _LOG
+)
+from fmc_auto_modules.snapshot import (
+    AUTONATRULES,
+    SnapshotStore
+)
+
+DEFAULT_CHANGEFEED_STATE = os.path.join(
+    os.path.expanduser('~'), '.fmc_automation', 'changefeed.json')
+
+# Seconds between two polls of the audit log
+DEFAULT_CHANGEFEED_INTERVAL = 60
+
+# Audit messages of the REST API name the method and the path
+API_CHANGE = re.compile(
+    r'\b(?P<method>POST|PUT|DELETE)\b\s+\S*?/api/fmc_config/v1/domain/[^/\s]+/'
+    r'(?P<path>[^\s?]+)')
+API_OBJECT = re.compile(r'^object/(?P<objtype>[a-z]+)(/(?P<uuid>[^/]+))?$')
+API_NATPOLICY = re.compile(
+    r'^policy/ftdnatpolicies(/(?P<policy>[^/]+))?(?P<rules>/autonatrules(/(?P<rule>[^/]+))?)?$')
+
+# GUI changes are only described: words of the message or subsystem -> collections
+CHANGE_WORDS = re.compile(r'\b(save[ds]?|modif(y|ied)|creat(e|ed)|delet(e|ed)|add(ed)?|'
+                          r'remov(e|ed)|edit(ed)?|updat(e|ed))\b', re.IGNORECASE)
+KEYWORD_COLLECTIONS = (
+    (re.compile(r'\bnat\b', re.IGNORECASE), (NATPOLICY_INDEX, AUTONATRULES)),
+    (re.compile(r'\bfqdn', re.IGNORECASE), ('fqdns',)),
+    (re.compile(r'\bhosts?\b', re.IGNORECASE), ('hosts',)),
+    (re.compile(r'\branges?\b', re.IGNORECASE), ('ranges',)),
+    (re.compile(r'\bsecurity zones?\b|\binterface (groups?|objects?)\b', re.IGNORECASE),
+     (AUTONATRULE_INTERFACE_TYPE,)),
+    (re.compile(r'\bnetworks?\b', re.IGNORECASE), ('networks',)),
+)
+OBJECT_COLLECTIONS = tuple(OBJECTS_TYPE_ALLOWED) + (AUTONATRULE_INTERFACE_TYPE,)
+
+
+class ChangeEvent(object):
+    """
+    A collection that changed in FMC: an object type, 'ftdnatpolicies' or
+    'autonatrules' (parent is then the policy UUID, None for any policy).
+    uuid is the changed item when the audit record names it.
+    """
+    __slots__ = ('collection', 'parent', 'uuid', 'time', 'username')
+
+    def __init__(self, collection, parent=None, uuid=None, time=None, username=None):
+        self.collection = collection
+        self.parent = parent
+        self.uuid = uuid
+        self.time = time
+        self.username = username
+
+    def key(self):
+        return (self.collection, self.parent, self.uuid)
+
+    def as_dict(self):
+        return {
+            'collection': self.collection,
+            'parent': self.parent,
+            'uuid': self.uuid,
+            'time': self.time,
+            'username': self.username,
+        }
+
+    def __repr__(self):
+        return 'ChangeEvent({!r}, parent={!r}, uuid={!r})'.format(self.collection, self.parent,
+                                                                  self.uuid)
+
+
+def record_time(record):
+    """
+    Time of an audit record in epoch seconds (FMC may send milliseconds)
+    """
+    value = float(record.get('time') or 0)
+    return value / 1000.0 if value > 1e11 else value
+
+
+def record_key(record):
+    return record.get('id') or hashlib.sha256(
+        json.dumps(record, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def events_for(record):
+    """
+    ChangeEvents of an audit record, none for logins, reads and the like.
+    API changes map to exact collections and UUIDs; GUI changes are mapped
+    from the words of their message, every object type when unclear.
+    """
+    message = record.get('message') or ''
+    when, username = record_time(record), record.get('username')
+    api = API_CHANGE.search(message)
+    if api:
+        path = api.group('path').rstrip('/')
+        objchange = API_OBJECT.match(path)
+        if objchange:
+            return [ChangeEvent(objchange.group('objtype'), None, objchange.group('uuid'),
+                                when, username)]
+        natchange = API_NATPOLICY.match(path)
+        if natchange and natchange.group('rules'):
+            return [ChangeEvent(AUTONATRULES, natchange.group('policy'), natchange.group('rule'),
+                                when, username)]
+        if natchange:
+            return [ChangeEvent(NATPOLICY_INDEX, None, natchange.group('policy'), when,
+                                username)]
+        return []
+    text = '{} {}'.format(record.get('subsystem') or '', message)
+    if not CHANGE_WORDS.search(text):
+        return []
+    for keyword, collections in KEYWORD_COLLECTIONS:
+        if keyword.search(text):
+            return [ChangeEvent(collection, time=when, username=username)
+                    for collection in collections]
+    if re.search(r'\bobjects?\b', text, re.IGNORECASE):
+        return [ChangeEvent(collection, time=when, username=username)
+                for collection in OBJECT_COLLECTIONS]
+    return []
+
+
+class ChangeFeed(object):
+    """
+    Follows the FMC audit log and tells subscribers which collections
+    changed, so caches and indexes can drop or refresh only those instead
+    of listing everything again. The time of the last record read (the
+    high-water mark) is kept in a JSON file per host and domain, so the
+    next run starts where this one stopped.
+
+        feed = ChangeFeed(fmc)
+        feed.subscribe(fmc.invalidate_changes)
+        feed.subscribe(fmc.refresh_snapshot_changes)   # with a snapshot
+        feed.start()
+    """
+    def __init__(self, fmc, state_path=DEFAULT_CHANGEFEED_STATE,
+                 interval=DEFAULT_CHANGEFEED_INTERVAL, since=None):
+        """
+        param:: fmc: FmcApiHandler reading the audit records.
+        param:: state_path: file keeping the high-water mark, None to keep it in memory.
+        param:: since: epoch seconds to start from when no mark is stored, now by default.
+        """
+        self.fmc = fmc
+        self.state_path = state_path
+        self.interval = interval
+        self.scope = SnapshotStore.scope(fmc.fmcserver, fmc.domain)
+        self.subscribers = []
+        state = self._read().get(self.scope) or {}
+        self.mark = state.get('mark', int(time.time()) if since is None else since)
+        # Records at the mark second, already reported
+        self.seen = set(state.get('seen', []))
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, callback):
+        """
+        param:: callback: callable(events) given the ChangeEvents of each
+                poll that found changes.
+        """
+        self.subscribers.append(callback)
+
+    def _read(self):
+        if not self.state_path:
+            return {}
+        try:
+            with open(self.state_path) as fd:
+                return json.load(fd)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _save(self):
+        if not self.state_path:
+            return
+        states = self._read()
+        states[self.scope] = {'mark': self.mark, 'seen': sorted(self.seen)}
+        dirname = os.path.dirname(self.state_path) or '.'
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname, mode=0o700, exist_ok=True)
+        fd, tmppath = tempfile.mkstemp(dir=dirname)
+        try:
+            os.fchmod(fd, 0o600)
+            with os.fdopen(fd, 'w') as tmpfd:
+                json.dump(states, tmpfd)
+            os.replace(tmppath, self.state_path)
+        except Exception:
+            os.unlink(tmppath)
+            raise
+
+    def poll(self):
+        """
+        Read the audit records since the mark, notify the subscribers and
+        move the mark. Returns the ChangeEvents, one per changed item.
+        """
+        records = self.fmc.get_audit_records(int(self.mark))
+        events, keys = [], set()
+        mark, seen = self.mark, set(self.seen)
+        for record in sorted(records, key=record_time):
+            when, key = record_time(record), record_key(record)
+            # Records of the mark's second may come late: seen tells them apart
+            if int(when) < int(self.mark) or key in self.seen:
+                continue
+            if int(when) > int(mark):
+                mark, seen = when, set()
+            seen.add(key)
+            for event in events_for(record):
+                if event.key() not in keys:
+                    keys.add(event.key())
+                    events.append(event)
+        if events:
+            _LOG("{} changes in FMC since {}.".format(
+                len(events), time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.mark))))
+            for callback in self.subscribers:
+                callback(events)
+        if mark != self.mark or seen != self.seen:
+            self.mark, self.seen = mark, seen
+            self._save()
+        return events
+
+    def run(self):
+        """
+        Poll every interval until stop() is called
+        """
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as exp:
+                _LOG("Change feed poll failed: {}".format(exp), "warning")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """
+        Poll in a background thread
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name='fmc-changefeed', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
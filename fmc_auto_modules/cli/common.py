@@ -0,0 +1,156 @@
+from fmc_auto_modules.daemon import (
+    DEFAULT_DAEMON_SOCKET,
+    DaemonHandlerProxy
+)
+from fmc_auto_modules.deploy import DEFAULT_DEPLOY_TIMEOUT
+from fmc_auto_modules.fmc_baseapi import (
+    FmcApiHandler as FAH,
+    ConsoleEcho
+)
+from fmc_auto_modules.logsetup import (
+    DEFAULT_LOGFILE,
+    DEFAULT_LOG_LEVEL,
+    LOG_LEVELS
+)
+from fmc_auto_modules.response_cache import (
+    DEFAULT_RESPONSE_CACHE,
+    ResponseCache
+)
+from fmc_auto_modules.ratelimit import (
+    DEFAULT_REQUESTS_PER_MINUTE,
+    configure_rate_limiter
+)
+from fmc_auto_modules.token_store import (
+    DEFAULT_TOKEN_STORE,
+    TokenStore
+)
+
+
+def add_connection_arguments(parser, fmchost_required=True):
+    """
+    FMC host, credentials, domain and SSL verification
+    """
+    parser.add_argument('--fmchost',
+                        type=str,
+                        required=fmchost_required,
+                        help="FMC host/ip")
+    parser.add_argument('-u', '--username',
+                        type=str,
+                        required=True,
+                        help="FMC username")
+    parser.add_argument('-p', '--password',
+                        type=str,
+                        required=True,
+                        help="FMC password")
+    parser.add_argument('--domain',
+                        type=str,
+                        default="Global",
+                        nargs='?',
+                        help="Target domain in FMC.")
+    parser.add_argument('--sslverify',
+                        type=str,
+                        nargs='?',
+                        help="Path to certificate to verify SSL - /path/to/ssl_certificate")
+
+
+def add_client_arguments(parser, daemon=False):
+    """
+    Token cache, response cache and rate limit of the handler, and with
+    daemon the option sending the calls to avi-fmc-daemon instead
+    """
+    parser.add_argument('--token-store',
+                        type=str,
+                        default=DEFAULT_TOKEN_STORE,
+                        help="File caching FMC tokens across invocations.")
+    parser.add_argument('--no-token-cache',
+                        action='store_true',
+                        help="Always generate a new token.")
+    parser.add_argument('--response-cache',
+                        type=str,
+                        nargs='?',
+                        const='',
+                        help="Cache GET responses in memory, and in this SQLite file if given "
+                             "(e.g. {}) so later runs revalidate them instead of fetching "
+                             "them again.".format(DEFAULT_RESPONSE_CACHE))
+    parser.add_argument('--rate-limit',
+                        type=int,
+                        default=DEFAULT_REQUESTS_PER_MINUTE,
+                        help="Maximum requests per minute sent to the FMC host.")
+    if daemon:
+        parser.add_argument('--daemon',
+                            type=str,
+                            nargs='?',
+                            const=DEFAULT_DAEMON_SOCKET,
+                            help="Send the calls to a running avi-fmc-daemon (optionally at "
+                                 "this socket) instead of authenticating here.")
+
+
+def add_deploy_arguments(parser):
+    parser.add_argument('--deploy',
+                        action='store_true',
+                        help="Deploy the changes once done, with one deployment per group of "
+                             "affected devices, and wait for it.")
+    parser.add_argument('--deploy-timeout',
+                        type=int,
+                        default=DEFAULT_DEPLOY_TIMEOUT,
+                        help="Seconds to wait for the deployment.")
+
+
+def add_output_arguments(parser):
+    """
+    Log file, log level and request statistics
+    """
+    parser.add_argument('--log-file',
+                        type=str,
+                        default=DEFAULT_LOGFILE,
+                        help="File the log is appended to, empty for none.")
+    parser.add_argument('--log-level',
+                        type=str,
+                        choices=LOG_LEVELS,
+                        default=DEFAULT_LOG_LEVEL,
+                        help="Lowest level logged.")
+    parser.add_argument('--stats',
+                        action='store_true',
+                        help="Print per-endpoint request statistics when done.")
+    parser.add_argument('--metrics-file',
+                        type=str,
+                        help="Dump request statistics to this file "
+                             "(Prometheus textfile for *.prom, JSON otherwise).")
+
+
+def token_store_from_args(args):
+    return None if args.no_token_cache else TokenStore(args.token_store)
+
+
+def response_cache_from_args(args):
+    if args.response_cache is None:
+        return None
+    return ResponseCache(path=args.response_cache or None)
+
+
+def handler_from_args(args, snapshot=None, offline=False):
+    """
+    FmcApiHandler configured from the arguments, or with --daemon a proxy
+    sending its calls to the daemon. The host's rate limiter is set up too.
+    param:: snapshot: SnapshotStore of the handler.
+    """
+    token_store = token_store_from_args(args)
+    configure_rate_limiter(args.fmchost, requests_per_minute=args.rate_limit)
+    if getattr(args, 'daemon', None):
+        return DaemonHandlerProxy(
+            args.fmchost, args.username, args.password, args.domain, args.sslverify or False,
+            token_store=token_store and token_store.path, rate_limit=args.rate_limit,
+            snapshot=snapshot and snapshot.path, socket_path=args.daemon)
+    return FAH(args.fmchost, args.username, args.password, args.domain,
+               args.sslverify or False, token_store=token_store, snapshot=snapshot,
+               offline=offline, response_cache=response_cache_from_args(args))
+
+
+def report_stats(args, fmc_instance):
+    """
+    Print/dump the request statistics of the run if asked to.
+    """
+    if args.stats:
+        ConsoleEcho(fmc_instance.metrics.summary())
+    if args.metrics_file:
+        fmc_instance.metrics.write(args.metrics_file)
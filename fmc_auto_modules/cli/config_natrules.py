@@ -1,8 +1,43 @@
 import argparse
 import json
+import sys
+from functools import partial
+from fmc_auto_modules.cli.common import (
+    add_client_arguments,
+    add_connection_arguments,
+    add_deploy_arguments,
+    add_output_arguments,
+    handler_from_args,
+    report_stats,
+    token_store_from_args
+)
+from fmc_auto_modules.deploy import DeploymentManager
+from fmc_auto_modules.exceptions import FmcError
 from fmc_auto_modules.fmc_baseapi import (
     FmcApiHandler as FAH,
-    _LOG
+    _LOG,
+    ConsoleEcho,
+    BULK_CHUNK_SIZE
+)
+from fmc_auto_modules.fanout import (
+    DEFAULT_FANOUT_WORKERS,
+    DEFAULT_PER_HOST,
+    FanoutExecutor,
+    targets_from_rows
+)
+from fmc_auto_modules.journal import (
+    DEFAULT_BATCH_RETRIES,
+    BatchJournal,
+    autonatrule_lookup,
+    run_batch
+)
+from fmc_auto_modules.fastjson import write_ndjson
+from fmc_auto_modules.loaders import load_rows
+from fmc_auto_modules.logsetup import configure_logging
+from fmc_auto_modules.ratelimit import configure_rate_limiter
+from fmc_auto_modules.snapshot import (
+    DEFAULT_SNAPSHOT,
+    SnapshotStore
 )
 
 
@@ -12,32 +47,22 @@ def parse_args():
     """
     parser = argparse.ArgumentParser(description="Configure NAT policy/rule in "
                                      "Cisco Firepower Management Console")
-    parser.add_argument('--fmchost',
-                        type=str,
-                        required=True,
-                        help="FMC host/ip")
-    parser.add_argument('-u', '--username',
-                        type=str,
-                        required=True,
-                        help="FMC username")
-    parser.add_argument('-p', '--password',
-                        type=str,
-                        required=True,
-                        help="FMC password")
-    parser.add_argument('--domain',
-                        type=str,
-                        default="Global",
-                        nargs='?',
-                        help="Target domain in FMC.")
+    add_connection_arguments(parser, fmchost_required=False)
+    add_client_arguments(parser, daemon=True)
+    add_deploy_arguments(parser)
+    add_output_arguments(parser)
     parser.add_argument('--description',
                         type=str,
                         default="created by automation script",
                         nargs='?',
                         help="Description")
-    parser.add_argument('--sslverify',
+    parser.add_argument('--ndjson',
                         type=str,
                         nargs='?',
-                        help="Path to certificate to verify SSL - /path/to/ssl_certificate")
+                        const='-',
+                        help="Write the policies, rules or --targets results one JSON record "
+                             "per line to this file (stdout by default, the log then goes to "
+                             "stderr), each as soon as it is fetched.")
     parser.add_argument('--get-autonatrules',
                         type=str,
                         nargs='?',
@@ -54,13 +79,97 @@ def parse_args():
                                "translatedNetwork": <name-of-network>, \
                                "sourceInterface": <name-of-SecurityZone>, \
                                "destinationInterface": <name-of-SecurityZone>}')
+    parser.add_argument('--preflight',
+                        action='store_true',
+                        help="With --create-autonatrule, refuse rules that duplicate, "
+                             "conflict with or overlap existing rules of the policy.")
+    parser.add_argument('--provision',
+                        action='store_true',
+                        help="With --create-autonatrule/--from-file, create the missing network "
+                             "objects first: networks given as an address, prefix or range, or "
+                             "as {\"name\": ..., \"value\": ...}.")
+    parser.add_argument('--analyze',
+                        type=str,
+                        help="Report duplicated, conflicting and overlapping auto NAT "
+                             "rules of this NAT policy.")
+    parser.add_argument('--from-file',
+                        type=str,
+                        nargs='?',
+                        help="CSV/JSONL/YAML file of auto NAT rules (same fields as "
+                             "--create-autonatrule) to create in bulk.")
+    parser.add_argument('--skip-invalid',
+                        action='store_true',
+                        help="With --from-file, create the valid rules even if "
+                             "others reference unknown names.")
+    parser.add_argument('--bulk-chunk-size',
+                        type=int,
+                        default=BULK_CHUNK_SIZE,
+                        help="Rules per bulk request (max {}).".format(BULK_CHUNK_SIZE))
+    parser.add_argument('--journal',
+                        type=str,
+                        help="With --from-file, journal of the run: a rerun with the same "
+                             "journal skips the rules already created and retries the others.")
+    parser.add_argument('--batch-retries',
+                        type=int,
+                        default=DEFAULT_BATCH_RETRIES,
+                        help="With --journal, times rules failing with a transient error "
+                             "are sent again.")
     parser.add_argument('--get-ftdnatpolicies',
                         action='store_true',
                         help="Get all configured FTD NAT policies.")
+    parser.add_argument('--natpolicy',
+                        type=str,
+                        action='append',
+                        help="With --get-ftdnatpolicies, only this NAT policy (repeatable).")
+    parser.add_argument('--rule-id',
+                        type=str,
+                        action='append',
+                        help="With --get-autonatrules --verbose, only expand this rule "
+                             "(repeatable).")
+    parser.add_argument('--snapshot',
+                        type=str,
+                        default=DEFAULT_SNAPSHOT,
+                        help="SQLite snapshot used by --refresh-snapshot and --offline.")
+    parser.add_argument('--refresh-snapshot',
+                        action='store_true',
+                        help="Update the snapshot with the objects, NAT policies and "
+                             "auto NAT rules of FMC.")
+    parser.add_argument('--full-refresh',
+                        action='store_true',
+                        help="With --refresh-snapshot, rewrite every item instead of "
+                             "only those whose modification timestamp changed.")
+    parser.add_argument('--quick-refresh',
+                        action='store_true',
+                        help="With --refresh-snapshot, list only ids and names: new, renamed "
+                             "and deleted items are updated, values edited in place are not.")
+    parser.add_argument('--offline',
+                        action='store_true',
+                        help="Answer --get-ftdnatpolicies/--get-autonatrules from the "
+                             "snapshot without contacting FMC.")
+    parser.add_argument('--targets',
+                        type=str,
+                        help="CSV/JSONL/YAML file of FMC hosts/domains (columns: fmchost, "
+                             "domain, optionally username and password) to run "
+                             "--get-ftdnatpolicies/--get-autonatrules against in parallel.")
+    parser.add_argument('--fanout-workers',
+                        type=int,
+                        default=DEFAULT_FANOUT_WORKERS,
+                        help="With --targets, targets worked on at once.")
+    parser.add_argument('--per-host',
+                        type=int,
+                        default=DEFAULT_PER_HOST,
+                        help="With --targets, targets of the same FMC host worked on at once.")
     parser.add_argument('--verbose', '-v',
                         action='store_true',
                         help="Verbosity for GET operation.")
-    return parser.parse_args()
+    args = parser.parse_args()
+    if not args.fmchost and not args.targets:
+        parser.error("--fmchost is required unless --targets is given.")
+    if args.daemon and (args.offline or args.targets):
+        parser.error("--daemon cannot be combined with --offline or --targets.")
+    if args.deploy and (args.daemon or args.offline or args.targets):
+        parser.error("--deploy cannot be combined with --daemon, --offline or --targets.")
+    return args
 
 
 def show_example():
@@ -93,19 +202,42 @@ def get_ftdnatpolicies(args, fmc_instance):
     """
     Get FTD NAT Policies.
     """
-    return fmc_instance.get_ftdnatpolicies(expanded=args.verbose)
+    return fmc_instance.get_ftdnatpolicies(
+        expanded=args.verbose,
+        natpolicies=args.natpolicy
+    )
 
 
-def get_autonatrules(args, fmc_instance):
+def get_autonatrules(args, fmc_instance, stream=False):
     """
     GET AutoNat rules in a target NatPolicy
+    param:: stream: return an iterator over the pages as they are fetched.
     """
-    return fmc_instance.get_autonatrules(
+    method = fmc_instance.iter_autonatrules if stream else fmc_instance.get_autonatrules
+    return method(
         args.get_autonatrules,
-        expanded=args.verbose
+        expanded=args.verbose,
+        rule_ids=args.rule_id
     )
 
 
+def write_records(args, records):
+    """
+    Log the records as one JSON list, or with --ndjson write them one per
+    line as they come.
+    """
+    if not args.ndjson:
+        _LOG(json.dumps(records))
+        return
+    if args.ndjson == '-':
+        count = write_ndjson(records, sys.stdout)
+        sys.stdout.flush()
+    else:
+        with open(args.ndjson, 'w') as fd:
+            count = write_ndjson(records, fd)
+    _LOG("{} records written.".format(count), "debug")
+
+
 def create_ftdnatpolicy(args, fmc_instance):
     """
     Create NAT policy.
@@ -121,30 +253,157 @@ def create_autonatrule(args, fmc_instance):
     """
     Create Auto NAT rule
     """
-    return(fmc_instance.create_autonatrule(args.create_autonatrule))
+    return(fmc_instance.create_autonatrule(args.create_autonatrule,
+                                           preflight=args.preflight,
+                                           provision=args.provision))
 
 
-def main():
+def analyze_autonatrules(args, fmc_instance):
     """
-    Main function
+    Report the conflicts between the auto NAT rules of a policy.
     """
-    args = parse_args()
-    if args.sslverify:
-        fmc_instance = FAH(args.fmchost, args.username, args.password, args.domain, args.sslverify)
+    conflicts = fmc_instance.analyze_autonatrules(args.analyze)
+    for conflict in conflicts:
+        ConsoleEcho("{kind}: {rules[0]} {rules[1]} - {detail}".format(**conflict))
+    _LOG("{} conflicts found in {}.".format(len(conflicts), args.analyze))
+
+
+# CSV cells are strings, these fields are not
+INT_RULE_FIELDS = ("originalPort", "translatedPort")
+BOOL_RULE_FIELDS = ("interfaceIpv6", "fallThrough", "dns", "routeLookup",
+                    "noProxyArp", "netToNet", "interfaceInTranslatedNetwork")
+
+
+def rule_from_row(row):
+    """
+    Auto NAT rule payload of a row read from --from-file.
+    """
+    rule = dict(row)
+    for field in INT_RULE_FIELDS:
+        if isinstance(rule.get(field), str):
+            rule[field] = int(rule[field])
+    for field in BOOL_RULE_FIELDS:
+        if isinstance(rule.get(field), str):
+            rule[field] = rule[field].lower() in ("true", "yes", "1")
+    return rule
+
+
+def create_autonatrules_from_file(args, fmc_instance):
+    """
+    Create every auto NAT rule listed in a file in bulk.
+    """
+    try:
+        rules = [rule_from_row(row) for row in load_rows(args.from_file)]
+    except (IOError, OSError, ValueError) as exp:
+        _LOG(exp)
+        sys.exit(1)
+    chunk_size = min(args.bulk_chunk_size, BULK_CHUNK_SIZE)
+    if args.journal:
+        with BatchJournal(args.journal, '{}|{}'.format(args.fmchost, args.domain)) as journal:
+            results = run_batch(journal, 'autonatrule', rules,
+                                partial(fmc_instance.create_autonatrules_bulk,
+                                        chunk_size=chunk_size, skip_invalid=args.skip_invalid,
+                                        provision=args.provision),
+                                lookup=autonatrule_lookup(fmc_instance), chunk_size=chunk_size,
+                                retries=args.batch_retries)
     else:
-        fmc_instance = FAH(args.fmchost, args.username, args.password, args.domain)
+        results = fmc_instance.create_autonatrules_bulk(
+            rules,
+            chunk_size=chunk_size,
+            skip_invalid=args.skip_invalid,
+            provision=args.provision
+        )
+    created = 0
+    journaled = 0
+    for lineno, (rule, rcode, rval) in enumerate(results, 1):
+        if rcode in (200, 201) and rval.get("journaled"):
+            journaled += 1
+        elif rcode == 201:
+            created += 1
+            _LOG("Rule {}: {}: {}".format(lineno, rcode, rval["id"]))
+        else:
+            _LOG("Rule {}: {}: {}".format(lineno, rcode, rval))
+    _LOG("Created {} auto NAT rules, {} done by earlier runs, {} failed.".format(
+        created, journaled, len(results) - created - journaled))
+
+
+def fanout(args):
+    """
+    Run --get-ftdnatpolicies/--get-autonatrules against every target of
+    --targets in parallel and print the results by target.
+    """
+    try:
+        targets = targets_from_rows(load_rows(args.targets), args.username, args.password)
+    except (IOError, OSError, ValueError, KeyError) as exp:
+        _LOG("Invalid targets file: {}".format(exp))
+        sys.exit(1)
     if args.get_ftdnatpolicies:
-        _LOG(json.dumps(get_ftdnatpolicies(args, fmc_instance)))
+        operation = partial(get_ftdnatpolicies, args)
     elif args.get_autonatrules:
-        _LOG(json.dumps(get_autonatrules(args, fmc_instance)))
-    elif args.create_autonatrule:
-        rcode, rval = create_autonatrule(args, fmc_instance)
-        _LOG("{}: {}".format(rcode, rval))
-    elif args.create_ftdnatpolicy:
-        rcode, rval = create_ftdnatpolicy(args, fmc_instance)
-        _LOG("{}: {}".format(rcode, rval))
+        operation = partial(get_autonatrules, args)
     else:
-        _LOG("Done nothing. Aborting!")
+        _LOG("--targets needs --get-ftdnatpolicies or --get-autonatrules. Aborting!")
+        sys.exit(1)
+    token_store = token_store_from_args(args)
+    for target in targets:
+        configure_rate_limiter(target.fmchost, requests_per_minute=args.rate_limit)
+    options = {'token_store': token_store}
+    if args.sslverify:
+        options['sslverify'] = args.sslverify
+    executor = FanoutExecutor(args.fanout_workers, args.per_host, FAH, **options)
+    results = executor.run(targets, operation)
+    write_records(args, [result.as_dict() for result in results])
+    failed = sum(1 for result in results if not result.ok)
+    _LOG("{} targets done, {} failed.".format(len(results) - failed, failed))
+
+
+def main():
+    """
+    Main function
+    """
+    args = parse_args()
+    configure_logging(args.log_file, args.log_level,
+                      console_stream=sys.stderr if args.ndjson == '-' else None)
+    if args.targets:
+        fanout(args)
+        return
+    snapshot = SnapshotStore(args.snapshot) if args.offline or args.refresh_snapshot else None
+    try:
+        fmc_instance = handler_from_args(args, snapshot=snapshot, offline=args.offline)
+        deployer = DeploymentManager(fmc_instance, timeout=args.deploy_timeout) \
+            if args.deploy else None
+        with fmc_instance:
+            if args.refresh_snapshot:
+                for collection, (written, removed) in sorted(
+                        fmc_instance.refresh_snapshot(
+                            full=args.full_refresh, ids_only=args.quick_refresh).items()):
+                    _LOG("Snapshot {}: {} written, {} removed.".format(collection, written,
+                                                                       removed))
+            elif args.analyze:
+                analyze_autonatrules(args, fmc_instance)
+            elif args.get_ftdnatpolicies:
+                write_records(args, get_ftdnatpolicies(args, fmc_instance))
+            elif args.get_autonatrules:
+                # The daemon answers with whole lists
+                write_records(args, get_autonatrules(
+                    args, fmc_instance, stream=bool(args.ndjson) and not args.daemon))
+            elif args.from_file:
+                create_autonatrules_from_file(args, fmc_instance)
+            elif args.create_autonatrule:
+                rcode, rval = create_autonatrule(args, fmc_instance)
+                _LOG("{}: {}".format(rcode, rval))
+            elif args.create_ftdnatpolicy:
+                rcode, rval = create_ftdnatpolicy(args, fmc_instance)
+                _LOG("{}: {}".format(rcode, rval))
+            else:
+                _LOG("Done nothing. Aborting!")
+            if deployer:
+                deployer.close()
+                deployer.deploy()
+    except FmcError as exp:
+        _LOG(exp)
+        sys.exit(1)
+    report_stats(args, fmc_instance)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,31 @@
 import argparse
+import json
+import sys
+from functools import partial
+from fmc_auto_modules.cli.common import (
+    add_client_arguments,
+    add_connection_arguments,
+    add_output_arguments,
+    handler_from_args,
+    report_stats
+)
+from fmc_auto_modules.exceptions import FmcError
 from fmc_auto_modules.fmc_baseapi import (
-    FmcApiHandler as FAH,
     _LOG,
+    ConsoleEcho,
+    BULK_CHUNK_SIZE,
     OBJECTS_TYPE_ALLOWED
 )
+from fmc_auto_modules.ipindex import IP_OBJECT_TYPES
+from fmc_auto_modules.journal import (
+    DEFAULT_BATCH_RETRIES,
+    BatchJournal,
+    object_lookup,
+    run_batch
+)
+from fmc_auto_modules.fastjson import write_ndjson
+from fmc_auto_modules.loaders import load_rows
+from fmc_auto_modules.logsetup import configure_logging
 
 
 def parse_args():
@@ -12,30 +34,14 @@ def parse_args():
     """
     parser = argparse.ArgumentParser(description="Create Host object in "
                                      "Cisco Firepower Management Console")
-    parser.add_argument('--fmchost',
-                        type=str,
-                        required=True,
-                        help="FMC host/ip")
-    parser.add_argument('-u', '--username',
-                        type=str,
-                        required=True,
-                        help="FMC username")
-    parser.add_argument('-p', '--password',
-                        type=str,
-                        required=True,
-                        help="FMC password")
-    parser.add_argument('--domain',
-                        type=str,
-                        default="Global",
-                        nargs='?',
-                        help="Target domain in FMC.")
+    add_connection_arguments(parser)
+    add_client_arguments(parser, daemon=True)
+    add_output_arguments(parser)
     parser.add_argument('--name',
                         type=str,
-                        required=True,
                         help="Name of object")
     parser.add_argument('--object-type',
                         type=str,
-                        required=True,
                         choices=OBJECTS_TYPE_ALLOWED,
                         help="Object type - Host, networks, ports. "
                              "These are real type available in FMC")
@@ -54,17 +60,62 @@ def parse_args():
                         default="IPV4_ONLY",
                         choices=["IPV4_ONLY", "IPV6_ONLY", "IPV4_AND_IPV6"],
                         help="DNS resolution type.")
-    parser.add_argument('--sslverify',
+    parser.add_argument('--get-objects',
+                        type=str,
+                        help="List the objects of this type (hosts, networks, "
+                             "interfaceobjects...) as JSON.")
+    parser.add_argument('--ndjson',
                         type=str,
                         nargs='?',
-                        help="Path to certificate to verify SSL - /path/to/ssl_certificate")
-    return parser.parse_args()
+                        const='-',
+                        help="Write the --get-objects objects one JSON record per line to this "
+                             "file (stdout by default, the log then goes to stderr), each "
+                             "as soon as it is fetched.")
+    parser.add_argument('--from-file',
+                        type=str,
+                        help="CSV/JSONL/YAML file of objects to create in bulk. Columns: "
+                             "name, type, value and optionally description, dnsResolution.")
+    parser.add_argument('--bulk-chunk-size',
+                        type=int,
+                        default=BULK_CHUNK_SIZE,
+                        help="Objects per bulk request (max {}).".format(BULK_CHUNK_SIZE))
+    parser.add_argument('--journal',
+                        type=str,
+                        help="With --from-file, journal of the run: a rerun with the same "
+                             "journal skips the objects already created and retries the others.")
+    parser.add_argument('--batch-retries',
+                        type=int,
+                        default=DEFAULT_BATCH_RETRIES,
+                        help="With --journal, times objects failing with a transient error "
+                             "are sent again.")
+    parser.add_argument('--reuse-existing',
+                        action='store_true',
+                        help="Do not create host/network/range objects when an object "
+                             "covering exactly the same addresses already exists.")
+    parser.add_argument('--dedup-report',
+                        action='store_true',
+                        help="List the host/network/range objects covering the same addresses.")
+    args = parser.parse_args()
+    if not (args.from_file or args.dedup_report or args.get_objects) and \
+            not (args.name and args.object_type):
+        parser.error("--name and --object-type are required unless --from-file, "
+                     "--dedup-report or --get-objects is given.")
+    if args.get_objects and args.daemon:
+        parser.error("--get-objects cannot be combined with --daemon.")
+    return args
 
 
-def create_object(fmc_instance, payload):
+def create_object(fmc_instance, payload, reuse_existing=False):
     """
     Creat Host object in FMC.
+    param:: reuse_existing: return an existing object covering the same addresses instead.
     """
+    if reuse_existing and payload["type"] in IP_OBJECT_TYPES:
+        existing = fmc_instance.find_equal_objects([payload["value"]])[0]
+        if existing:
+            _LOG("Reusing {} ({}) instead of creating {}".format(
+                existing[0]["name"], existing[0]["value"], payload["name"]))
+            return 200, existing[0]
     return fmc_instance.create_object(payload)
 
 
@@ -79,7 +130,7 @@ def create_host(args, fmc_instance):
         "type": args.object_type,
         "description": args.description
     }
-    rcode, rval = create_object(fmc_instance, payload)
+    rcode, rval = create_object(fmc_instance, payload, args.reuse_existing)
     _LOG("{}: {}".format(rcode, rval))
 
 
@@ -94,7 +145,7 @@ def create_fqdn(args, fmc_instance):
         "dnsResolution": args.dnsresolution,
         "description": args.description
     }
-    rcode, rval = create_object(fmc_instance, payload)
+    rcode, rval = create_object(fmc_instance, payload, args.reuse_existing)
     _LOG("{}: {}".format(rcode, rval))
 
 
@@ -113,7 +164,7 @@ def create_network(args, fmc_instance, overridable=False):
         "overridable": overridable,
         "description": args.description
     }
-    rcode, rval = create_object(fmc_instance, payload)
+    rcode, rval = create_object(fmc_instance, payload, args.reuse_existing)
     _LOG("{}: {}".format(rcode, rval))
 
 
@@ -126,30 +177,168 @@ def create_ranges(args, fmc_instance):
         "value": args.network,
         "description": args.description
     }
-    rcode, rval = create_object(fmc_instance, payload)
+    rcode, rval = create_object(fmc_instance, payload, args.reuse_existing)
     _LOG("{}: {}".format(rcode, rval))
 
 
+def payload_from_row(row, args):
+    """
+    Build the object payload of a row read from --from-file.
+    """
+    objtype = row.get("type", "").lower()
+    payload = {
+        "name": row["name"],
+        "type": objtype,
+        "value": row["value"],
+        "description": row.get("description", args.description)
+    }
+    if objtype == "fqdns":
+        payload["dnsResolution"] = row.get("dnsResolution", args.dnsresolution)
+    return payload
+
+
+def create_from_file(args, fmc_instance):
+    """
+    Create every object listed in a file, grouped by type and sent in bulk.
+    """
+    try:
+        rows = load_rows(args.from_file)
+    except (IOError, OSError, ValueError) as exp:
+        _LOG(exp)
+        sys.exit(1)
+    grouped = {}
+    failed = 0
+    for lineno, row in enumerate(rows, 1):
+        try:
+            payload = payload_from_row(row, args)
+        except KeyError as exp:
+            _LOG("Row {}: missing {}".format(lineno, exp))
+            failed += 1
+            continue
+        if payload["type"] not in OBJECTS_TYPE_ALLOWED:
+            _LOG("Row {}: {} is not supported object type.".format(lineno, payload["type"]))
+            failed += 1
+            continue
+        grouped.setdefault(payload["type"], []).append(payload)
+    journal = BatchJournal(args.journal, '{}|{}'.format(args.fmchost, args.domain)) \
+        if args.journal else None
+    reused = 0
+    if args.reuse_existing:
+        for objtype in IP_OBJECT_TYPES:
+            payloads = []
+            candidates = []
+            for payload in grouped.get(objtype, []):
+                # Journaled objects are not looked up again
+                if journal and journal.completed(objtype, payload):
+                    payloads.append(payload)
+                else:
+                    candidates.append(payload)
+            equal = fmc_instance.find_equal_objects(
+                [payload["value"] for payload in candidates]) if candidates else []
+            for payload, existing in zip(candidates, equal):
+                if existing is None:
+                    failed += 1
+                    _LOG("{}: {} is not an address, prefix or range.".format(
+                        payload["name"], payload["value"]))
+                elif existing:
+                    reused += 1
+                    _LOG("Reusing {} for {}".format(existing[0]["name"], payload["name"]))
+                else:
+                    payloads.append(payload)
+            if objtype in grouped:
+                grouped[objtype] = payloads
+    created = 0
+    journaled = 0
+    chunk_size = min(args.bulk_chunk_size, BULK_CHUNK_SIZE)
+    try:
+        for objtype, payloads in grouped.items():
+            if journal:
+                results = run_batch(journal, objtype, payloads,
+                                    partial(fmc_instance.create_objects_bulk, objtype,
+                                            chunk_size=chunk_size),
+                                    lookup=object_lookup(fmc_instance), chunk_size=chunk_size,
+                                    retries=args.batch_retries)
+            else:
+                results = fmc_instance.create_objects_bulk(objtype, payloads,
+                                                           chunk_size=chunk_size)
+            for payload, rcode, rval in results:
+                if rcode in (200, 201) and rval.get("journaled"):
+                    journaled += 1
+                elif rcode == 201:
+                    created += 1
+                    _LOG("{}: {} {}".format(rcode, payload["name"], rval["id"]))
+                else:
+                    failed += 1
+                    _LOG("{}: {} {}".format(rcode, payload["name"], rval))
+    finally:
+        if journal:
+            journal.close()
+    _LOG("Created {} objects, {} done by earlier runs, reused {}, {} failed.".format(
+        created, journaled, reused, failed))
+
+
+def get_objects(args, fmc_instance):
+    """
+    Log the objects of a type as one JSON list, or with --ndjson write them
+    one per line, page by page as they are fetched.
+    """
+    objects = fmc_instance.iter_objects(args.get_objects, expanded=True)
+    if not args.ndjson:
+        _LOG(json.dumps(list(objects)))
+        return
+    if args.ndjson == '-':
+        count = write_ndjson(objects, sys.stdout)
+        sys.stdout.flush()
+    else:
+        with open(args.ndjson, 'w') as fd:
+            count = write_ndjson(objects, fd)
+    _LOG("{} {} written.".format(count, args.get_objects), "debug")
+
+
+def dedup_report(fmc_instance):
+    """
+    Print the groups of objects covering the same addresses.
+    """
+    groups, indexed, unparsed = fmc_instance.duplicate_objects()
+    for group in groups:
+        ConsoleEcho("{}: {}".format(group[0]["value"], ", ".join(
+            "{} ({})".format(item["name"], item["type"]) for item in group)))
+    _LOG("{} objects indexed, {} groups of duplicates covering {} objects, "
+         "{} values not parsed.".format(indexed, len(groups),
+                                        sum(len(group) for group in groups), unparsed))
+
+
 def main():
     """
     Main function
     """
     args = parse_args()
-    if args.sslverify:
-        fmc_instance = FAH(args.fmchost, args.username, args.password, args.domain, args.sslverify)
-    else:
-        fmc_instance = FAH(args.fmchost, args.username, args.password, args.domain)
-    # Call target functions depending on object type
-    if args.object_type == "hosts":
-        create_host(args, fmc_instance)
-    elif args.object_type == "fqdns":
-        create_fqdn(args, fmc_instance)
-    elif args.object_type == "networks":
-        create_network(args, fmc_instance)
-    elif args.object_type == "ranges":
-        create_ranges(args, fmc_instance)
-    else:
-        _LOG("Done nothing. Aborting!")
+    configure_logging(args.log_file, args.log_level,
+                      console_stream=sys.stderr if args.ndjson == '-' else None)
+    try:
+        fmc_instance = handler_from_args(args)
+        # Call target functions depending on object type
+        with fmc_instance:
+            if args.get_objects:
+                get_objects(args, fmc_instance)
+            elif args.dedup_report:
+                dedup_report(fmc_instance)
+            elif args.from_file:
+                create_from_file(args, fmc_instance)
+            elif args.object_type == "hosts":
+                create_host(args, fmc_instance)
+            elif args.object_type == "fqdns":
+                create_fqdn(args, fmc_instance)
+            elif args.object_type == "networks":
+                create_network(args, fmc_instance)
+            elif args.object_type == "ranges":
+                create_ranges(args, fmc_instance)
+            else:
+                _LOG("Done nothing. Aborting!")
+    except FmcError as exp:
+        _LOG(exp)
+        sys.exit(1)
+    report_stats(args, fmc_instance)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,92 @@
+import argparse
+import sys
+from fmc_auto_modules.cli.common import (
+    add_client_arguments,
+    add_connection_arguments,
+    add_output_arguments,
+    handler_from_args,
+    report_stats
+)
+from fmc_auto_modules.exceptions import FmcError
+from fmc_auto_modules.export import (
+    DEFAULT_CHUNK_ROWS,
+    EXPORT_COLLECTIONS,
+    EXPORT_FORMATS,
+    Exporter
+)
+from fmc_auto_modules.fmc_baseapi import (
+    _LOG,
+    ConsoleEcho
+)
+from fmc_auto_modules.logsetup import configure_logging
+
+
+def parse_args():
+    """
+    Parse CLI
+    """
+    parser = argparse.ArgumentParser(description="Export the objects, NAT policies and auto "
+                                     "NAT rules of Cisco Firepower Management Console to "
+                                     "CSV or Parquet files")
+    add_connection_arguments(parser)
+    add_client_arguments(parser)
+    add_output_arguments(parser)
+    parser.add_argument('--output-dir', '-o',
+                        type=str,
+                        required=True,
+                        help="Directory the files are written to. Running the export again "
+                             "with the same directory resumes it.")
+    parser.add_argument('--format',
+                        type=str,
+                        choices=EXPORT_FORMATS,
+                        default='csv',
+                        help="File format, parquet needs pyarrow.")
+    parser.add_argument('--chunk-rows',
+                        type=int,
+                        default=DEFAULT_CHUNK_ROWS,
+                        help="Rows per file.")
+    parser.add_argument('--collections',
+                        type=str,
+                        nargs='+',
+                        choices=EXPORT_COLLECTIONS,
+                        default=list(EXPORT_COLLECTIONS),
+                        help="What to export, everything by default.")
+    parser.add_argument('--restart',
+                        action='store_true',
+                        help="Start over instead of resuming an export to the same directory.")
+    args = parser.parse_args()
+    if args.chunk_rows < 1:
+        parser.error("--chunk-rows must be positive.")
+    return args
+
+
+def export(args, fmc_instance):
+    """
+    Export the collections and print what was written.
+    """
+    exporter = Exporter(fmc_instance, args.output_dir, args.format, args.chunk_rows,
+                        restart=args.restart)
+    summary = exporter.export(args.collections)
+    ConsoleEcho("\n".join("{}: {} rows in {} files".format(collection, state['rows'],
+                                                           state['chunks'])
+                          for collection, state in summary.items()))
+
+
+def main():
+    """
+    Main function
+    """
+    args = parse_args()
+    configure_logging(args.log_file, args.log_level)
+    try:
+        fmc_instance = handler_from_args(args)
+        with fmc_instance:
+            export(args, fmc_instance)
+    except (FmcError, IOError, OSError) as exp:
+        _LOG(exp)
+        sys.exit(1)
+    report_stats(args, fmc_instance)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import sys
+from fmc_auto_modules.cli.common import (
+    add_client_arguments,
+    add_connection_arguments,
+    add_deploy_arguments,
+    add_output_arguments,
+    handler_from_args,
+    report_stats
+)
+from fmc_auto_modules.deploy import DeploymentManager
+from fmc_auto_modules.exceptions import FmcError
+from fmc_auto_modules.fmc_baseapi import (
+    _LOG,
+    ConsoleEcho,
+    BULK_CHUNK_SIZE
+)
+from fmc_auto_modules.logsetup import configure_logging
+from fmc_auto_modules.sync import (
+    apply_plan,
+    load_desired_state,
+    plan_sync
+)
+
+
+def parse_args():
+    """
+    Parse CLI
+    """
+    parser = argparse.ArgumentParser(description="Bring objects, NAT policies and auto NAT "
+                                     "rules of Cisco Firepower Management Console to the "
+                                     "state described in a file")
+    add_connection_arguments(parser)
+    add_client_arguments(parser)
+    add_deploy_arguments(parser)
+    add_output_arguments(parser)
+    parser.add_argument('--desired-state', '-f',
+                        type=str,
+                        required=True,
+                        help="JSON/YAML file with objects, natpolicies and/or "
+                             "autonatrules sections.")
+    parser.add_argument('--dry-run',
+                        action='store_true',
+                        help="Only print the plan.")
+    parser.add_argument('--prune',
+                        action='store_true',
+                        help="Also delete what the sections of the file do not list "
+                             "(objects of the listed types, rules of the listed policies).")
+    parser.add_argument('--bulk-chunk-size',
+                        type=int,
+                        default=BULK_CHUNK_SIZE,
+                        help="Items per bulk request (max {}).".format(BULK_CHUNK_SIZE))
+    return parser.parse_args()
+
+
+def sync(args, fmc_instance, desired):
+    """
+    Print the plan and apply it unless --dry-run, then deploy it with --deploy.
+    """
+    plan = plan_sync(fmc_instance, desired, prune=args.prune)
+    ConsoleEcho(plan.describe())
+    if plan.errors:
+        _LOG("Plan has errors. Nothing was changed.", "error")
+        return False
+    if args.dry_run or not len(plan):
+        return True
+    deployer = DeploymentManager(fmc_instance, timeout=args.deploy_timeout) \
+        if args.deploy else None
+    results = apply_plan(fmc_instance, plan,
+                         chunk_size=min(args.bulk_chunk_size, BULK_CHUNK_SIZE))
+    ok = True
+    for action, rcode, rval in results:
+        if rcode not in (200, 201):
+            ok = False
+            _LOG("{}: {}: {}".format(action.describe(), rcode, rval), "warning")
+    if deployer:
+        # What was applied is deployed even if some calls failed
+        deployer.close()
+        ok = all([task.ok for task in deployer.deploy()]) and ok
+    return ok
+
+
+def main():
+    """
+    Main function
+    """
+    args = parse_args()
+    configure_logging(args.log_file, args.log_level)
+    try:
+        desired = load_desired_state(args.desired_state)
+    except (IOError, OSError, ValueError) as exp:
+        _LOG(exp)
+        sys.exit(1)
+    try:
+        fmc_instance = handler_from_args(args)
+        with fmc_instance:
+            ok = sync(args, fmc_instance, desired)
+    except FmcError as exp:
+        _LOG(exp)
+        sys.exit(1)
+    report_stats(args, fmc_instance)
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
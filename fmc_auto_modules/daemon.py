@@ -0,0 +1,387 @@
+import argparse
+import hashlib
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+from fmc_auto_modules import exceptions
+from fmc_auto_modules.changefeed import ChangeFeed
+from fmc_auto_modules.exceptions import FmcError
+from fmc_auto_modules.fmc_baseapi import (
+    FmcApiHandler,
+    _LOG
+)
+from fmc_auto_modules.models import FmcModel
+from fmc_auto_modules.ratelimit import configure_rate_limiter
+from fmc_auto_modules.response_cache import ResponseCache
+from fmc_auto_modules.snapshot import SnapshotStore
+from fmc_auto_modules.token_store import TokenStore
+
+DEFAULT_DAEMON_SOCKET = os.path.join(
+    os.path.expanduser('~'), '.fmc_automation', 'daemon.sock')
+
+# Handler methods clients may call
+ALLOWED_METHODS = frozenset([
+    'get_version',
+    'get_ftdnatpolicies',
+    'get_natpolicy_uuids',
+    'lookup_natpolicy_uuid',
+    'expand_ftdnatpolicies',
+    'get_autonatrules',
+    'expand_autonatrules',
+    'get_objects',
+    'expand_objects',
+    'lookup_object_uuid',
+    'find_equal_objects',
+    'duplicate_objects',
+    'resolve_autonatrule',
+    'analyze_autonatrules',
+    'preflight_autonatrule',
+    'create_ftdnatpolicy',
+    'update_ftdnatpolicy',
+    'delete_ftdnatpolicy',
+    'create_autonatrule',
+    'create_autonatrules_bulk',
+    'update_autonatrule',
+    'delete_autonatrule',
+    'create_object',
+    'create_objects_bulk',
+    'update_object',
+    'delete_object',
+    'refresh_snapshot',
+    'metrics.summary',
+    'metrics.snapshot',
+    'metrics.to_prometheus',
+])
+
+
+class DaemonError(FmcError):
+    """
+    The daemon could not be reached or the call failed on its side
+    """
+
+
+class FmcDaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Unix socket server holding authenticated handlers, one per
+    host/user/domain/password, reused across client calls.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path=DEFAULT_DAEMON_SOCKET, idle_timeout=None,
+                 changefeed_interval=None):
+        """
+        param:: changefeed_interval: follow the audit log of each FMC every
+                this many seconds and drop what the handlers cached about
+                the collections changed by others.
+        """
+        dirname = os.path.dirname(socket_path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname, mode=0o700, exist_ok=True)
+        if os.path.exists(socket_path):
+            self._remove_stale_socket(socket_path)
+        self.socket_path = socket_path
+        self.idle_timeout = idle_timeout
+        self.handlers = {}
+        self.handler_locks = {}
+        self.changefeed_interval = changefeed_interval
+        self.feeds = []
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.last_call = time.time()
+        # Only the owner may talk to the daemon
+        umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, FmcDaemonRequestHandler)
+        finally:
+            os.umask(umask)
+
+    @staticmethod
+    def _remove_stale_socket(socket_path):
+        """
+        Remove the socket a stopped daemon left behind; refuse to take over
+        the socket of a daemon still answering on it.
+        """
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(socket_path)
+            except (IOError, OSError):
+                os.unlink(socket_path)
+                return
+        raise DaemonError("A daemon is already running on {}.".format(socket_path))
+
+    @staticmethod
+    def handler_key(spec):
+        password = hashlib.sha256((spec.get('password') or '').encode()).hexdigest()
+        return (spec['fmchost'], spec.get('username'), spec.get('domain', 'Global'),
+                spec.get('sslverify') or False, spec.get('scheme', 'https'),
+                spec.get('snapshot'), password)
+
+    def handler_for(self, spec):
+        """
+        Warm handler of a spec, created (and authenticated) on first use
+        """
+        key = self.handler_key(spec)
+        with self.lock:
+            if key in self.handlers:
+                return self.handlers[key]
+            key_lock = self.handler_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in self.handlers:
+                if spec.get('rate_limit'):
+                    configure_rate_limiter(spec['fmchost'],
+                                           requests_per_minute=spec['rate_limit'])
+                token_store = TokenStore(spec['token_store']) if spec.get('token_store') \
+                    else None
+                snapshot = SnapshotStore(spec['snapshot']) if spec.get('snapshot') else None
+                # The change feed keeps cached responses in step with FMC
+                response_cache = ResponseCache() if self.changefeed_interval else None
+                self.handlers[key] = FmcApiHandler(
+                    spec['fmchost'], spec['username'], spec['password'],
+                    spec.get('domain', 'Global'), spec.get('sslverify') or False,
+                    token_store=token_store, scheme=spec.get('scheme', 'https'),
+                    snapshot=snapshot, response_cache=response_cache)
+                if self.changefeed_interval:
+                    feed = ChangeFeed(self.handlers[key], state_path=None,
+                                      interval=self.changefeed_interval)
+                    feed.subscribe(self.handlers[key].invalidate_changes)
+                    feed.start()
+                    self.feeds.append(feed)
+        return self.handlers[key]
+
+    def status(self):
+        return {
+            'pid': os.getpid(),
+            'uptime': round(time.time() - self.started_at, 1),
+            'handlers': ['{}/{}@{}'.format(key[1], key[2], key[0]) for key in self.handlers],
+        }
+
+    def call(self, request):
+        """
+        Run one request and return the value to send back
+        """
+        self.last_call = time.time()
+        method = request.get('method')
+        if method == 'daemon.ping':
+            return 'pong'
+        if method == 'daemon.status':
+            return self.status()
+        if method == 'daemon.shutdown':
+            threading.Thread(target=self.shutdown, daemon=True).start()
+            return 'stopping'
+        if method not in ALLOWED_METHODS:
+            raise DaemonError("Method {} is not allowed.".format(method))
+        target = self.handler_for(request['handler'])
+        for name in method.split('.'):
+            target = getattr(target, name)
+        return target(*request.get('args', []), **request.get('kwargs', {}))
+
+    def watch_idle(self):
+        """
+        Stop the daemon after idle_timeout seconds without calls
+        """
+        while True:
+            time.sleep(min(self.idle_timeout, 30))
+            if time.time() - self.last_call > self.idle_timeout:
+                _LOG("Daemon idle for {}s. Stopping.".format(self.idle_timeout))
+                self.shutdown()
+                return
+
+    def serve(self):
+        if self.idle_timeout:
+            threading.Thread(target=self.watch_idle, daemon=True).start()
+        try:
+            self.serve_forever()
+        finally:
+            self.server_close()
+            for feed in self.feeds:
+                feed.stop()
+            for handler in list(self.handlers.values()):
+                handler.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+def _json_default(value):
+    if isinstance(value, FmcModel):
+        return value.to_dict()
+    return str(value)
+
+
+class FmcDaemonRequestHandler(socketserver.StreamRequestHandler):
+    """
+    One JSON request line in, one JSON response line out
+    """
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            response = {'ok': True, 'result': self.server.call(json.loads(line.decode()))}
+        except Exception as exp:
+            response = {'ok': False, 'error': str(exp) or repr(exp),
+                        'error_type': type(exp).__name__}
+        self.wfile.write(json.dumps(response, default=_json_default).encode() + b'\n')
+
+
+def remote_error(response):
+    """
+    Exception to raise for a call that failed in the daemon: the FmcError
+    it raised there, DaemonError for any other error.
+    """
+    error_class = getattr(exceptions, response.get('error_type') or '', None)
+    if isinstance(error_class, type) and issubclass(error_class, FmcError):
+        return error_class(response['error'])
+    return DaemonError(response['error'])
+
+
+class DaemonClient(object):
+    """
+    Sends calls to a running daemon
+    """
+    def __init__(self, socket_path=DEFAULT_DAEMON_SOCKET, timeout=None):
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def request(self, method, handler=None, args=(), kwargs=None):
+        payload = {'method': method, 'handler': handler, 'args': list(args),
+                   'kwargs': kwargs or {}}
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.timeout)
+                sock.connect(self.socket_path)
+                sock.sendall(json.dumps(payload).encode() + b'\n')
+                with sock.makefile('rb') as stream:
+                    line = stream.readline()
+        except (IOError, OSError) as exp:
+            raise DaemonError("Daemon at {} is not reachable: {}".format(self.socket_path, exp))
+        if not line:
+            raise DaemonError("Daemon closed the connection.")
+        response = json.loads(line.decode())
+        if not response['ok']:
+            raise remote_error(response)
+        return response['result']
+
+
+class _RemoteMethod(object):
+    def __init__(self, proxy, name):
+        self._proxy = proxy
+        self._name = name
+
+    def __getattr__(self, name):
+        return _RemoteMethod(self._proxy, '{}.{}'.format(self._name, name))
+
+    def __call__(self, *args, **kwargs):
+        return self._proxy.client.request(self._name, self._proxy.spec, args, kwargs)
+
+
+class _RemoteMetrics(object):
+    """
+    ApiMetrics of the daemon's handler, written to files on the client side
+    """
+    def __init__(self, proxy):
+        self._proxy = proxy
+
+    def __getattr__(self, name):
+        return _RemoteMethod(self._proxy, 'metrics.{}'.format(name))
+
+    def write(self, path):
+        with open(path, 'w') as fd:
+            if path.endswith('.prom'):
+                fd.write(self.to_prometheus())
+            else:
+                json.dump(self.snapshot(), fd, indent=2)
+
+
+class DaemonHandlerProxy(object):
+    """
+    Stand-in for FmcApiHandler forwarding its calls (ALLOWED_METHODS) to the
+    daemon, which runs them on a warm handler. Results come back as JSON,
+    so tuples are lists and exceptions are strings.
+    """
+    def __init__(self, fmchost, username, password, domain='Global', sslverify=False,
+                 token_store=None, rate_limit=None, scheme='https', snapshot=None,
+                 socket_path=DEFAULT_DAEMON_SOCKET):
+        """
+        param:: token_store, snapshot: paths of the stores the daemon's handler uses.
+        param:: rate_limit: requests per minute, applied when the daemon first
+                sees the host.
+        """
+        self.client = DaemonClient(socket_path)
+        self.metrics = _RemoteMetrics(self)
+        self.spec = {
+            'fmchost': fmchost,
+            'username': username,
+            'password': password,
+            'domain': domain,
+            'sslverify': sslverify,
+            'token_store': token_store,
+            'rate_limit': rate_limit,
+            'scheme': scheme,
+            'snapshot': snapshot,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        return _RemoteMethod(self, name)
+
+
+def main():
+    """
+    Run the daemon in the foreground, or control a running one
+    """
+    parser = argparse.ArgumentParser(description="Keep authenticated FMC handlers warm "
+                                     "for avi-nat/avi-create-object --daemon")
+    parser.add_argument('--socket',
+                        type=str,
+                        default=DEFAULT_DAEMON_SOCKET,
+                        help="Unix socket to listen on.")
+    parser.add_argument('--idle-timeout',
+                        type=int,
+                        help="Stop after this many seconds without calls.")
+    parser.add_argument('--changefeed-interval',
+                        type=int,
+                        help="Cache GET responses, poll the FMC audit log every this many "
+                             "seconds and drop the cached listings of what others changed.")
+    parser.add_argument('--status',
+                        action='store_true',
+                        help="Print the status of the running daemon.")
+    parser.add_argument('--stop',
+                        action='store_true',
+                        help="Stop the running daemon.")
+    args = parser.parse_args()
+    if args.status or args.stop:
+        client = DaemonClient(args.socket, timeout=10)
+        try:
+            print(json.dumps(client.request('daemon.shutdown' if args.stop else
+                                            'daemon.status')))
+        except DaemonError as exp:
+            _LOG(exp)
+            sys.exit(1)
+        return
+    try:
+        server = FmcDaemonServer(args.socket, args.idle_timeout, args.changefeed_interval)
+    except DaemonError as exp:
+        _LOG(exp)
+        sys.exit(1)
+    _LOG("FMC daemon listening on {}".format(args.socket))
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+from fmc_auto_modules.fmc_baseapi import _LOG
+
+# Seconds between two polls of a deployment task, growing while nothing changes
+DEFAULT_POLL_INTERVAL = 2.0
+MAX_POLL_INTERVAL = 30.0
+POLL_BACKOFF = 1.5
+DEFAULT_DEPLOY_TIMEOUT = 3600
+
+# Task statuses FMC reports once a deployment is over
+DEPLOY_SUCCESS = ('deployed', 'success', 'succeeded', 'completed')
+DEPLOY_FAILURE = ('failed', 'failure', 'error', 'aborted', 'cancelled')
+
+# Changes made through the handler that need a deployment
+NATPOLICY_CHANGE = re.compile(r'/policy/ftdnatpolicies/(?P<policy>[^/]+)')
+OBJECT_CHANGE = re.compile(r'/object/[^/]+/[^/]+$')
+
+
+class DeploymentTask(object):
+    """
+    One deployment request: the devices it covers and the state of its task
+    """
+    def __init__(self, devices, version, task_id=None, status=None):
+        """
+        param:: devices: deployable device entries (see get_deployable_devices).
+        """
+        self.devices = devices
+        self.version = version
+        self.task_id = task_id
+        self.status = status
+        self.started = time.time()
+        self.elapsed = 0.0
+
+    @property
+    def device_names(self):
+        return [device["device"].get("name", device["device"]["id"]) for device in self.devices]
+
+    @property
+    def ok(self):
+        return (self.status or '').lower() in DEPLOY_SUCCESS
+
+    @property
+    def done(self):
+        return self.task_id is None or self.ok or \
+            (self.status or '').lower() in DEPLOY_FAILURE
+
+    def as_dict(self):
+        return {
+            'task': self.task_id,
+            'devices': self.device_names,
+            'version': self.version,
+            'status': self.status,
+            'ok': self.ok,
+            'elapsed': round(self.elapsed, 1),
+        }
+
+
+class DeploymentManager(object):
+    """
+    Deploys the changes of a batch once, at the end, instead of once per
+    change. The NAT policies and objects the batch changes are collected
+    from the requests the handler sends; when the batch is over, the
+    deployable devices they affect get one deployment request per group of
+    devices at the same version, and the tasks are polled until they finish.
+
+        with DeploymentManager(fmc) as deployer:
+            ... create/update rules and objects ...
+        deployer.tasks
+    """
+    def __init__(self, fmc, poll_interval=DEFAULT_POLL_INTERVAL,
+                 max_poll_interval=MAX_POLL_INTERVAL, timeout=DEFAULT_DEPLOY_TIMEOUT,
+                 force=False):
+        """
+        param:: fmc: FmcApiHandler making the changes.
+        param:: timeout: seconds to wait for the deployment tasks.
+        param:: force: deploy even the devices FMC considers up to date.
+        """
+        self.fmc = fmc
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.timeout = timeout
+        self.force = force
+        self.natpolicies = set()
+        self.objects_changed = False
+        self.tasks = []
+        self._lock = threading.Lock()
+        fmc.add_request_hook(self._on_request)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        if exc_type is None:
+            self.deploy()
+        elif self.pending:
+            _LOG("Batch failed, changes were not deployed.", "warning")
+
+    def close(self):
+        """
+        Stop collecting changes
+        """
+        self.fmc.remove_request_hook(self._on_request)
+
+    def _on_request(self, method, url, status_code, latency, bytes_out, bytes_in):
+        if method not in ('POST', 'PUT', 'DELETE') or not status_code or status_code >= 300:
+            return
+        path = urlparse(url).path
+        natpolicy = NATPOLICY_CHANGE.search(path)
+        if natpolicy:
+            self.touch_natpolicy(natpolicy.group('policy'))
+        # New objects are not used by anything yet, changed ones may be used anywhere
+        elif method != 'POST' and OBJECT_CHANGE.search(path):
+            with self._lock:
+                self.objects_changed = True
+
+    def touch_natpolicy(self, natpolicy_uuid):
+        """
+        Record a change of a NAT policy made outside the handler
+        """
+        with self._lock:
+            self.natpolicies.add(natpolicy_uuid)
+
+    @property
+    def pending(self):
+        """
+        True if changes were recorded since the last deployment
+        """
+        return bool(self.natpolicies) or self.objects_changed
+
+    def affected_devices(self, deployable):
+        """
+        param:: deployable: devices FMC lists as deployable.
+        The ones the recorded changes apply to: every deployable device once
+        a shared object changed, else those the changed NAT policies are
+        assigned to.
+        """
+        if self.objects_changed:
+            return list(deployable)
+        assigned = set()
+        for devices in self.fmc.get_policy_devices(self.natpolicies).values():
+            assigned.update(devices)
+        return [device for device in deployable if device["device"]["id"] in assigned]
+
+    def deploy(self, wait=True):
+        """
+        Deploy the recorded changes: one request per group of devices at the
+        same version. Returns the DeploymentTasks (also kept in self.tasks).
+        """
+        if not self.pending:
+            _LOG("No changes to deploy.")
+            return []
+        devices = self.affected_devices(self.fmc.get_deployable_devices())
+        with self._lock:
+            self.natpolicies = set()
+            self.objects_changed = False
+        if not devices:
+            _LOG("No device needs a deployment.")
+            return []
+        groups = {}
+        for device in devices:
+            groups.setdefault(device.get("version"), []).append(device)
+        tasks = []
+        for version in sorted(groups, key=str):
+            task = DeploymentTask(groups[version], version)
+            rcode, rval = self.fmc.create_deployment(
+                [device["device"]["id"] for device in task.devices], version, self.force)
+            if rcode == 202:
+                task.task_id = rval["metadata"]["task"]["id"]
+                task.status = "Queued"
+            else:
+                task.status = "Failed: {} {}".format(rcode, rval)
+                _LOG("Deployment to {} failed: {} {}".format(", ".join(task.device_names),
+                                                             rcode, rval), "warning")
+            tasks.append(task)
+        self.tasks.extend(tasks)
+        if wait:
+            self.wait(tasks)
+        return tasks
+
+    def wait(self, tasks):
+        """
+        Poll the tasks until they are over or timeout expires, logging each
+        status change. The interval grows while nothing changes and drops
+        back to poll_interval when a task moves.
+        """
+        interval = self.poll_interval
+        deadline = time.time() + self.timeout
+        while True:
+            pending = [task for task in tasks if not task.done]
+            if not pending:
+                break
+            if time.time() >= deadline:
+                _LOG("{} deployments still running after {}s.".format(len(pending),
+                                                                     self.timeout), "warning")
+                break
+            time.sleep(min(interval, max(0, deadline - time.time())))
+            moved = False
+            for task in pending:
+                rcode, rval = self.fmc.get_task_status(task.task_id)
+                task.elapsed = time.time() - task.started
+                if rcode != 200:
+                    continue
+                status = rval.get("status")
+                if status != task.status:
+                    moved = True
+                    task.status = status
+                    _LOG("Deployment {} to {}: {} ({:.0f}s)".format(
+                        task.task_id, ", ".join(task.device_names), status, task.elapsed))
+            interval = self.poll_interval if moved else \
+                min(interval * POLL_BACKOFF, self.max_poll_interval)
+        failed = sum(1 for task in tasks if not task.ok)
+        _LOG("{} deployments done, {} failed or unfinished.".format(len(tasks) - failed, failed))
+        return tasks
@@ -0,0 +1,37 @@
+class FmcError(Exception):
+    """
+    Base of the errors raised by the API handlers.
+    retriable tells whether the same call may succeed if tried again.
+    """
+    retriable = False
+
+
+class FmcConnectionError(FmcError):
+    """
+    FMC could not be reached or did not answer
+    """
+    retriable = True
+
+
+class FmcAuthError(FmcError):
+    """
+    FMC did not return a token, or the configured domain does not exist
+    """
+
+
+class FmcNotFoundError(FmcError, LookupError):
+    """
+    A NAT policy, object or other item referenced by name does not exist
+    """
+
+
+class UnsupportedObjectTypeError(FmcError, ValueError):
+    """
+    The object type is not one of OBJECTS_TYPE_ALLOWED
+    """
+
+
+class UnsupportedReferenceError(FmcError, ValueError):
+    """
+    A payload references an item in a way the handler cannot resolve
+    """
@@ -0,0 +1,326 @@
+import csv
+import json
+import os
+import tempfile
+from collections import OrderedDict
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:
+    pyarrow = None
+
+from fmc_auto_modules.exceptions import FmcError
+from fmc_auto_modules.fastjson import dumps
+from fmc_auto_modules.fmc_baseapi import (
+    AUTONATRULE_INTERFACE_TYPE,
+    NATPOLICY_INDEX,
+    NETWORK_TYPE_NAMES,
+    OBJECTS_TYPE_ALLOWED,
+    _LOG
+)
+from fmc_auto_modules.snapshot import (
+    AUTONATRULES,
+    SnapshotStore
+)
+
+EXPORT_FORMATS = ('csv', 'parquet')
+# Rows per file; the only rows held in memory are those of the Parquet chunk being filled
+DEFAULT_CHUNK_ROWS = 50000
+# Progress of the export, kept in the output directory
+PROGRESS_FILE = 'export-progress.json'
+# Names of referenced items kept in memory, the least recently used are dropped
+DEFAULT_REFERENCE_NAMES = 10000
+
+# Collections exported by default, in this order
+EXPORT_COLLECTIONS = tuple(OBJECTS_TYPE_ALLOWED) + (AUTONATRULE_INTERFACE_TYPE, NATPOLICY_INDEX,
+                                                     AUTONATRULES)
+
+OBJECT_COLUMNS = ('id', 'name', 'type', 'value', 'description', 'overridable', 'dnsResolution',
+                  'interfaceMode', 'lastUser', 'timestamp', 'domain')
+NATPOLICY_COLUMNS = ('id', 'name', 'type', 'description', 'lastUser', 'timestamp', 'domain')
+AUTONATRULE_COLUMNS = ('natPolicy', 'natPolicyId', 'id', 'type', 'natType', 'sourceInterface',
+                       'destinationInterface', 'originalNetwork', 'translatedNetwork',
+                       'serviceProtocol', 'originalPort', 'translatedPort',
+                       'interfaceInTranslatedNetwork', 'interfaceIpv6', 'fallThrough', 'dns',
+                       'routeLookup', 'noProxyArp', 'netToNet', 'description', 'lastUser',
+                       'timestamp')
+# Reference fields of auto NAT rules, exported as the name of the item they point to
+AUTONATRULE_REFERENCES = ('sourceInterface', 'destinationInterface', 'originalNetwork',
+                          'translatedNetwork')
+
+# Object type holding the items of each reference type
+REFERENCE_TYPES = dict((name, objtype) for objtype, name in NETWORK_TYPE_NAMES.items())
+REFERENCE_TYPES.update({
+    'SecurityZone': AUTONATRULE_INTERFACE_TYPE,
+    'InterfaceGroup': AUTONATRULE_INTERFACE_TYPE,
+})
+
+
+def cell(value):
+    """
+    Text of a field in a row: booleans as true/false, lists and
+    dictionaries as JSON, None for a missing field.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (dict, list)):
+        return dumps(value)
+    return str(value)
+
+
+def _metadata_fields(item):
+    metadata = item.get('metadata') or {}
+    return {
+        'lastUser': (metadata.get('lastUser') or {}).get('name'),
+        'timestamp': metadata.get('timestamp'),
+        'domain': (metadata.get('domain') or {}).get('name'),
+    }
+
+
+def flatten(item, columns, fields=None):
+    """
+    Row of item in columns order. fields overrides or adds fields of the item.
+    """
+    values = _metadata_fields(item)
+    values.update(item)
+    values.update(fields or {})
+    return tuple(cell(values.get(column)) for column in columns)
+
+
+class ReferenceNames(object):
+    """
+    Names of the items auto NAT rules reference, by UUID. FMC may give
+    references with type and id only; the name of such an item is looked up
+    in the handler's snapshot if it has one, else fetched from FMC. Only the
+    max_names most recently used names are kept, so memory does not grow
+    with the number of objects.
+    """
+    def __init__(self, fmc, max_names=DEFAULT_REFERENCE_NAMES):
+        self.fmc = fmc
+        self.max_names = max_names
+        self.names = OrderedDict()
+
+    def name(self, reference):
+        if not reference:
+            return None
+        if reference.get('name'):
+            return reference['name']
+        uuid = reference.get('id')
+        objtype = REFERENCE_TYPES.get(reference.get('type'))
+        if objtype is None:
+            return uuid
+        if uuid in self.names:
+            self.names.move_to_end(uuid)
+            return self.names[uuid]
+        items = self._lookup(objtype, uuid)
+        self.names[uuid] = (items[0].get('name') if items else None) or uuid
+        if len(self.names) > self.max_names:
+            self.names.popitem(last=False)
+        return self.names[uuid]
+
+    def _lookup(self, objtype, uuid):
+        snapshot = getattr(self.fmc, 'snapshot', None)
+        if snapshot is not None:
+            items = snapshot.find(self.fmc.snapshot_scope, uuid=uuid, collection=objtype)
+            if items:
+                return items
+        return self.fmc.expand_objects(objtype, [uuid])
+
+
+class _CsvChunk(object):
+    """
+    CSV file being written, renamed into place once complete
+    """
+    extension = 'csv'
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.rows = 0
+        self.fd = open(path + '.partial', 'w', newline='')
+        self.writer = csv.writer(self.fd)
+        self.writer.writerow(columns)
+
+    def write(self, row):
+        self.writer.writerow(row)
+        self.rows += 1
+
+    def close(self):
+        self.fd.flush()
+        os.fsync(self.fd.fileno())
+        self.fd.close()
+        os.replace(self.path + '.partial', self.path)
+
+
+class _ParquetChunk(object):
+    """
+    Parquet file of string columns, written when complete
+    """
+    extension = 'parquet'
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+        self.buffer = []
+        self.rows = 0
+
+    def write(self, row):
+        self.buffer.append(row)
+        self.rows += 1
+
+    def close(self):
+        values = list(zip(*self.buffer)) if self.buffer else [()] * len(self.columns)
+        table = pyarrow.table(dict(
+            (column, pyarrow.array(column_values, type=pyarrow.string()))
+            for column, column_values in zip(self.columns, values)))
+        self.buffer = []
+        parquet.write_table(table, self.path + '.partial')
+        os.replace(self.path + '.partial', self.path)
+
+
+CHUNK_WRITERS = {
+    'csv': _CsvChunk,
+    'parquet': _ParquetChunk,
+}
+
+
+class Exporter(object):
+    """
+    Exports objects, NAT policies and auto NAT rules to CSV or Parquet
+    files of at most chunk_rows rows each, e.g. hosts-00000.csv,
+    autonatrules-00003.parquet. Listings are read page by page and rows
+    are written as they come, so memory does not grow with the domain.
+    After each chunk the position reached is saved in the progress file of
+    the directory; an interrupted export started again with the same
+    directory carries on from the last complete chunk.
+
+        Exporter(fmc, '/tmp/export').export()
+    """
+    def __init__(self, fmc, directory, fmt='csv', chunk_rows=DEFAULT_CHUNK_ROWS, restart=False):
+        """
+        param:: fmc: FmcApiHandler the items are read with.
+        param:: fmt: csv or parquet (needs pyarrow).
+        param:: restart: ignore the progress of a previous export to directory.
+        """
+        if fmt not in CHUNK_WRITERS:
+            raise ValueError("Unsupported export format {}.".format(fmt))
+        if fmt == 'parquet' and pyarrow is None:
+            raise FmcError("Parquet export needs pyarrow (pip install pyarrow).")
+        self.fmc = fmc
+        self.directory = directory
+        self.fmt = fmt
+        self.chunk_rows = chunk_rows
+        self.names = ReferenceNames(fmc)
+        self.progress_path = os.path.join(directory, PROGRESS_FILE)
+        scope = SnapshotStore.scope(fmc.fmcserver, fmc.domain)
+        progress = None if restart else self._read()
+        if progress and (progress['scope'], progress['format'], progress['chunk_rows']) != \
+                (scope, fmt, chunk_rows):
+            raise FmcError("{} holds an export of {} ({}, {} rows per chunk); use another "
+                           "directory or restart it.".format(directory, progress['scope'],
+                                                             progress['format'],
+                                                             progress['chunk_rows']))
+        self.progress = progress or {'scope': scope, 'format': fmt, 'chunk_rows': chunk_rows,
+                                     'collections': {}}
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+
+    def _read(self):
+        try:
+            with open(self.progress_path) as fd:
+                return json.load(fd)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _save(self):
+        fd, tmppath = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, 'w') as tmpfd:
+                json.dump(self.progress, tmpfd, indent=2)
+            os.replace(tmppath, self.progress_path)
+        except Exception:
+            os.unlink(tmppath)
+            raise
+
+    def chunk_path(self, collection, index):
+        return os.path.join(self.directory, '{}-{:05d}.{}'.format(
+            collection, index, CHUNK_WRITERS[self.fmt].extension))
+
+    def export(self, collections=EXPORT_COLLECTIONS):
+        """
+        Export the collections (object types, 'ftdnatpolicies', 'autonatrules')
+        not completed yet. Returns collection -> progress (rows, chunks, done).
+        """
+        for collection in collections:
+            self.export_collection(collection)
+        return dict((collection, self.progress['collections'][collection])
+                    for collection in collections)
+
+    def export_collection(self, collection):
+        state = self.progress['collections'].setdefault(
+            collection, {'rows': 0, 'chunks': 0, 'position': None, 'done': False})
+        if state['done']:
+            _LOG("{} already exported ({} rows).".format(collection, state['rows']))
+            return state
+        if state['rows']:
+            _LOG("Resuming the export of {} after {} rows.".format(collection, state['rows']))
+        columns, rows = self._rows(collection, state)
+        chunk, position = None, state['position']
+        for row, position in rows:
+            if chunk is None:
+                chunk = CHUNK_WRITERS[self.fmt](self.chunk_path(collection, state['chunks']),
+                                                columns)
+            chunk.write(row)
+            if chunk.rows >= self.chunk_rows:
+                self._close_chunk(chunk, state, position)
+                chunk = None
+        if chunk is not None:
+            self._close_chunk(chunk, state, position)
+        state['done'] = True
+        self._save()
+        _LOG("Exported {} rows of {} in {} files.".format(state['rows'], collection,
+                                                         state['chunks']))
+        return state
+
+    def _close_chunk(self, chunk, state, position):
+        chunk.close()
+        state['rows'] += chunk.rows
+        state['chunks'] += 1
+        state['position'] = position
+        self._save()
+
+    def _rows(self, collection, state):
+        """
+        Columns of a collection and its (row, position) pairs from where
+        the export stopped. position is what the next run resumes from.
+        """
+        if collection == AUTONATRULES:
+            return AUTONATRULE_COLUMNS, self._autonatrule_rows(state['position'])
+        if collection == NATPOLICY_INDEX:
+            natpolicies = self.fmc.get_ftdnatpolicies(expanded=True)[state['rows']:]
+            return NATPOLICY_COLUMNS, ((flatten(natpolicy, NATPOLICY_COLUMNS), None)
+                                       for natpolicy in natpolicies)
+        objects = self.fmc.iter_objects(collection, expanded=True, offset=state['rows'],
+                                        strict=True)
+        return OBJECT_COLUMNS, ((flatten(item, OBJECT_COLUMNS), None) for item in objects)
+
+    def _autonatrule_rows(self, position):
+        natpolicies = self.fmc.get_ftdnatpolicies()
+        start, offset = 0, 0
+        if position:
+            natpolicy_uuids = [natpolicy['id'] for natpolicy in natpolicies]
+            if position['natpolicy'] not in natpolicy_uuids:
+                raise FmcError("NAT policy {} of the interrupted export no longer exists; "
+                               "restart the export.".format(position['natpolicy']))
+            start, offset = natpolicy_uuids.index(position['natpolicy']), position['offset']
+        for natpolicy in natpolicies[start:]:
+            rules = self.fmc.iter_autonatrules(natpolicy['name'], expanded=True, offset=offset,
+                                               strict=True)
+            for index, rule in enumerate(rules, offset + 1):
+                fields = dict((field, self.names.name(rule.get(field)))
+                              for field in AUTONATRULE_REFERENCES)
+                fields.update(natPolicy=natpolicy['name'], natPolicyId=natpolicy['id'])
+                yield (flatten(rule, AUTONATRULE_COLUMNS, fields),
+                       {'natpolicy': natpolicy['id'], 'offset': index})
+            offset = 0
@@ -0,0 +1,118 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fmc_auto_modules.fmc_baseapi import (
+    FmcApiHandler,
+    _LOG
+)
+
+# Targets worked on at once, overall and per FMC host
+DEFAULT_FANOUT_WORKERS = 8
+DEFAULT_PER_HOST = 2
+
+
+class FanoutTarget(object):
+    """
+    One FMC host and domain to run an operation against
+    param:: options: extra FmcApiHandler arguments (sslverify, token_store...).
+    """
+    def __init__(self, fmchost, domain='Global', username=None, password=None, **options):
+        self.fmchost = fmchost
+        self.domain = domain
+        self.username = username
+        self.password = password
+        self.options = options
+
+    @property
+    def label(self):
+        return '{}/{}'.format(self.fmchost, self.domain)
+
+
+class FanoutResult(object):
+    """
+    Outcome of an operation on one target: value or error, and the time it took
+    """
+    def __init__(self, target, value=None, error=None, elapsed=0.0):
+        self.target = target
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def as_dict(self):
+        return {
+            'target': self.target.label,
+            'ok': self.ok,
+            'value': self.value,
+            'error': None if self.ok else str(self.error),
+            'elapsed': round(self.elapsed, 3),
+        }
+
+
+class FanoutExecutor(object):
+    """
+    Run the same operation against many FMC hosts/domains in a worker pool.
+    Every target gets its own handler; at most per_host targets of the
+    same FMC run at once, on top of the host's shared rate limiter.
+    """
+    def __init__(self, max_workers=DEFAULT_FANOUT_WORKERS, per_host=DEFAULT_PER_HOST,
+                 handler_class=FmcApiHandler, **handler_options):
+        """
+        param:: handler_options: FmcApiHandler arguments common to every target,
+                a target's own options take precedence.
+        """
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.handler_class = handler_class
+        self.handler_options = handler_options
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    def _slot(self, fmchost):
+        with self._lock:
+            if fmchost not in self._host_slots:
+                self._host_slots[fmchost] = threading.BoundedSemaphore(self.per_host)
+            return self._host_slots[fmchost]
+
+    def _run_one(self, target, operation):
+        started = time.perf_counter()
+        with self._slot(target.fmchost):
+            try:
+                options = dict(self.handler_options, **target.options)
+                with self.handler_class(target.fmchost, target.username, target.password,
+                                        target.domain, **options) as fmc:
+                    value = operation(fmc)
+            # One target failing does not stop the others
+            except Exception as exp:
+                _LOG("{}: {!r}".format(target.label, exp), "error")
+                return FanoutResult(target, error=exp, elapsed=time.perf_counter() - started)
+        return FanoutResult(target, value=value, elapsed=time.perf_counter() - started)
+
+    def run(self, targets, operation):
+        """
+        param:: operation: callable(handler) returning the value of a target.
+        Returns one FanoutResult per target, in the order of targets.
+        """
+        targets = list(targets)
+        if not targets:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(targets))) as pool:
+            futures = [pool.submit(self._run_one, target, operation) for target in targets]
+            return [future.result() for future in futures]
+
+
+def targets_from_rows(rows, username=None, password=None, **options):
+    """
+    param:: rows: dictionaries with fmchost and optionally domain, username, password.
+    Targets of rows read from a file, missing credentials taken from the arguments.
+    """
+    targets = []
+    for row in rows:
+        targets.append(FanoutTarget(row['fmchost'], row.get('domain') or 'Global',
+                                    row.get('username') or username,
+                                    row.get('password') or password, **options))
+    return targets
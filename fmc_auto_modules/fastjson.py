@@ -0,0 +1,52 @@
+import json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Name of the JSON backend in use, orjson when installed
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+
+def loads(data):
+    """
+    param:: data: JSON document as bytes or str.
+    Decode with orjson when installed, it is several times faster on large pages.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj, default=None):
+    """
+    Compact JSON encoding of obj as str
+    param:: default: called for the values JSON cannot encode, like json.dumps'.
+    """
+    if orjson is not None:
+        # orjson's bytes keep their whole write buffer, the str is sized exactly
+        return orjson.dumps(obj, default=default).decode()
+    return json.dumps(obj, separators=(',', ':'), default=default)
+
+
+def _to_dict(obj):
+    # Models (see models.FmcModel) within the records
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    raise TypeError("{} is not JSON serializable".format(type(obj).__name__))
+
+
+def write_ndjson(records, fd):
+    """
+    param:: records: iterable of dictionaries or models, e.g. a listing
+            being fetched page by page.
+    param:: fd: text file open for writing.
+    Write each record on its own line as soon as it comes, so the records
+    are never all held nor encoded at once. Returns the number written.
+    """
+    count = 0
+    for record in records:
+        fd.write(dumps(record, default=_to_dict))
+        fd.write('\n')
+        count += 1
+    return count
@@ -0,0 +1,494 @@
+import asyncio
+import json
+import ssl
+import time
+from contextlib import asynccontextmanager
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+from fmc_auto_modules.exceptions import (
+    FmcAuthError,
+    FmcConnectionError,
+    FmcNotFoundError,
+    UnsupportedObjectTypeError,
+    UnsupportedReferenceError
+)
+from fmc_auto_modules.fmc_baseapi import (
+    _LOG,
+    AUTONATRULE_INTERFACE_TYPE,
+    AUTONATRULE_NETWORK_FIELDS,
+    AUTONATRULE_NETWORK_TYPES,
+    DEFAULT_PAGE_SIZE,
+    NATPOLICY_INDEX,
+    OBJECTS_TYPE_ALLOWED,
+    REFRESH_TOKEN_URI,
+    SERVER_VERSION_URI,
+    TOKEN_URI,
+    FmcApiBase,
+    literal_object
+)
+from fmc_auto_modules.fastjson import loads
+from fmc_auto_modules.models import (
+    AutoNatRule,
+    NatPolicy
+)
+from fmc_auto_modules.object_index import DEFAULT_OBJECT_INDEX_TTL
+from fmc_auto_modules.ratelimit import DEFAULT_THROTTLE_RETRIES
+from fmc_auto_modules.token_store import (
+    token_is_fresh,
+    token_is_refreshable
+)
+
+# Requests in flight at once per handler
+DEFAULT_CONCURRENCY = 10
+
+
+class AsyncFmcApiHandler(FmcApiBase):
+    """
+    Asynchronous counterpart of FmcApiHandler for operations that fan out,
+    e.g. resolving several object types or listing rules of many policies:
+
+        async with AsyncFmcApiHandler(host, user, password) as fmc:
+            hosts, zones = await fmc.get_objects_many(["hosts", "interfaceobjects"])
+
+    At most `concurrency` requests are in flight at once. Payload building and
+    response parsing are shared with FmcApiHandler through FmcApiBase.
+    """
+    def __init__(self, fmcserver, username, password, domain='Global', sslverify=False,
+                 concurrency=DEFAULT_CONCURRENCY, token_store=None,
+                 object_index_ttl=DEFAULT_OBJECT_INDEX_TTL, object_index_ttls=None,
+                 page_size=DEFAULT_PAGE_SIZE, scheme='https', rate_limiter=None,
+                 throttle_retries=DEFAULT_THROTTLE_RETRIES):
+        if aiohttp is None:
+            raise ImportError("aiohttp is required - pip install fmc_auto_modules[async]")
+        super().__init__(fmcserver, username, password, domain, sslverify,
+                         token_store=token_store, object_index_ttl=object_index_ttl,
+                         object_index_ttls=object_index_ttls, page_size=page_size,
+                         scheme=scheme, rate_limiter=rate_limiter,
+                         throttle_retries=throttle_retries)
+        self.concurrency = concurrency
+        self.session = None
+        self._semaphore = None
+        self._auth_lock = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def open(self):
+        """
+        Open the connection pool and authenticate
+        """
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._auth_lock = asyncio.Lock()
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ssl=self._ssl_context())
+        self.session = aiohttp.ClientSession(connector=connector)
+        await self._authenticate()
+
+    async def close(self):
+        """
+        Close pooled connections
+        """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _ssl_context(self):
+        if not self.sslverify:
+            return False
+        if isinstance(self.sslverify, str):
+            return ssl.create_default_context(cafile=self.sslverify)
+        return None
+
+    async def _send(self, method, uri, params=None, data=None, headers=None, auth=None):
+        """
+        Send a request through the pooled session, paced by the host's rate
+        limiter and replayed with backoff when FMC answers 429.
+        Returns (status_code, response headers, body) with the body decoded
+        from JSON when possible.
+        """
+        url = self._url(uri)
+        attempt = 0
+        while True:
+            await self.rate_limiter.wait_async()
+            async with self._semaphore:
+                started = time.perf_counter()
+                try:
+                    async with self.session.request(
+                            method, url, params=params, data=data,
+                            headers=headers or self.headers, auth=auth) as resp:
+                        raw = await resp.read()
+                except aiohttp.ClientError:
+                    self._emit_request(method, url, None, time.perf_counter() - started,
+                                       data, 0)
+                    raise
+                self._emit_request(method, str(resp.url), resp.status,
+                                   time.perf_counter() - started, data, len(raw))
+            if self._throttle_delay(attempt, resp.status, resp.headers) is None:
+                break
+            attempt += 1
+        started = time.perf_counter()
+        try:
+            body = loads(raw) if raw else {}
+        except ValueError:
+            body = raw.decode(errors='replace')
+        self.metrics.record_parse(method, url, time.perf_counter() - started)
+        return resp.status, resp.headers, body
+
+    async def _request(self, method, uri, **kwargs):
+        """
+        Send an authenticated request.
+        The token is refreshed before it expires and, if FMC still answers
+        401, the handler re-authenticates and replays the request once.
+        Returns (status_code, body).
+        """
+        if not token_is_fresh(self.token_entry):
+            await self._authenticate()
+        token = self.token
+        status, resp_headers, body = await self._send(method, uri, **kwargs)
+        if status == 401:
+            _LOG("Token rejected by FMC. Re-authenticating.", "warning")
+            await self._authenticate(rejected=token)
+            status, resp_headers, body = await self._send(method, uri, **kwargs)
+        return status, body
+
+    async def _authenticate(self, rejected=None):
+        """
+        Reuse a cached token if still valid, refresh it if it is about to
+        expire, otherwise generate a new one.
+        param:: rejected: token FMC answered 401 to. Concurrent requests that
+                were rejected with the same token share one re-authentication.
+        """
+        async with self._auth_lock:
+            if rejected is not None and self.token != rejected:
+                return
+            if rejected is None and self.token_entry and token_is_fresh(self.token_entry):
+                return
+            if self.token_store is None:
+                entry = await self._renew_token(None if rejected else self.token_entry)
+            else:
+                async with self._token_store_lock():
+                    entry = self.token_store.load(self.fmcserver, self.username, self.domain)
+                    if rejected and entry and entry['token'] == rejected:
+                        self.token_store.delete(self.fmcserver, self.username, self.domain)
+                        entry = None
+                    entry = await self._renew_token(entry)
+                    self.token_store.save(self.fmcserver, self.username, self.domain, entry)
+            self._apply_token(entry)
+
+    @asynccontextmanager
+    async def _token_store_lock(self):
+        """
+        The token store's file lock, waited for in a thread so the other
+        coroutines keep running while another process holds it.
+        """
+        lock = self.token_store.lock()
+        acquired = asyncio.get_event_loop().run_in_executor(None, lock.__enter__)
+        try:
+            await asyncio.shield(acquired)
+        except asyncio.CancelledError:
+            # Release the lock once the thread gets it
+            acquired.add_done_callback(
+                lambda future: future.exception() or lock.__exit__(None, None, None))
+            raise
+        try:
+            yield
+        finally:
+            lock.__exit__(None, None, None)
+
+    async def _renew_token(self, entry):
+        """
+        Return a usable token entry derived from the given (possibly None) one.
+        """
+        if entry and token_is_fresh(entry):
+            return entry
+        if entry and token_is_refreshable(entry):
+            refreshed = await self.refresh_token(entry)
+            if refreshed:
+                return refreshed
+        return await self.get_token()
+
+    async def get_token(self):
+        """
+        Get token
+        """
+        try:
+            with self.metrics.operation('token_generate'):
+                status, resp_headers, body = await self._send(
+                    'POST', TOKEN_URI,
+                    auth=aiohttp.BasicAuth(self.username, self.password)
+                )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exp:
+            raise FmcConnectionError("Token request to {} failed: {}".format(self.fmcserver, exp))
+        entry = self._parse_token(resp_headers)
+        if entry == None:
+            raise FmcAuthError("Token not found ({}).".format(status))
+        if entry['domain_uuid'] == None:
+            raise FmcAuthError("Domain {} not found.".format(self.domain))
+        return entry
+
+    async def refresh_token(self, entry):
+        """
+        Exchange the refresh token for a new access token.
+        Returns the new token entry, or None if FMC refused to refresh it.
+        """
+        try:
+            with self.metrics.operation('token_refresh'):
+                status, resp_headers, body = await self._send(
+                    'POST', REFRESH_TOKEN_URI, headers=self._refresh_headers(entry))
+        except aiohttp.ClientError as exp:
+            _LOG(exp, "warning")
+            return None
+        if status >= 400:
+            return None
+        return self._parse_token(resp_headers, previous=entry)
+
+    async def get_version(self):
+        """
+        Get FMC server version
+        """
+        try:
+            status, body = await self._request('GET', SERVER_VERSION_URI)
+        except aiohttp.ClientError as exp:
+            _LOG(exp)
+            return None
+        return body['items'][0]['serverVersion']
+
+    async def get_ftdnatpolicies(self, expanded=False, natpolicies=None, models=False):
+        """
+        GET FTD NAT policies.
+        param:: natpolicies: names of the policies wanted, all of them by default.
+        See FmcApiHandler.get_ftdnatpolicies.
+        """
+        if natpolicies is not None:
+            if expanded:
+                items = await self.expand_ftdnatpolicies(natpolicies)
+            else:
+                await self.get_natpolicy_uuids()
+                items = [self.object_index.item(NATPOLICY_INDEX, name) for name in natpolicies
+                         if self.object_index.item(NATPOLICY_INDEX, name)]
+        else:
+            items = [item async for item in self.iter_pages(self._natpolicies_uri(),
+                                                            expanded=expanded)]
+            self._index_natpolicies(items)
+        return NatPolicy.from_items(items) if models else items
+
+    async def get_natpolicy_uuids(self):
+        """
+        Name -> UUID mapping of the FTD NAT policies, from the policy index
+        """
+        if self.object_index.is_stale(NATPOLICY_INDEX):
+            await self.get_ftdnatpolicies()
+        return self.object_index.table(NATPOLICY_INDEX)
+
+    async def _get_concurrently(self, uris):
+        """
+        GET several resources concurrently.
+        Returns the decoded bodies in order, None for those that failed.
+        """
+        async def fetch(uri):
+            try:
+                status, body = await self._request('GET', uri)
+            except aiohttp.ClientError as exp:
+                _LOG(exp)
+                return None
+            if status != 200:
+                _LOG("GET {} failed with {}".format(uri, status), "warning")
+                return None
+            return body
+        return await asyncio.gather(*[fetch(uri) for uri in uris])
+
+    async def expand_ftdnatpolicies(self, natpolicies):
+        """
+        param:: natpolicies: names of NAT policies.
+        Fetch the details of the selected policies concurrently.
+        """
+        natpolicy_uuids = await self.get_natpolicy_uuids()
+        for natpolicy in natpolicies:
+            if natpolicy not in natpolicy_uuids:
+                _LOG("NatPolicy {} was not found.".format(natpolicy))
+        uris = [self._natpolicy_uri(natpolicy_uuids[natpolicy])
+                for natpolicy in natpolicies if natpolicy in natpolicy_uuids]
+        return [body for body in await self._get_concurrently(uris) if body]
+
+    async def get_autonatrules(self, natpolicy, expanded=False, rule_ids=None, models=False):
+        """
+        param:: ftdnatpolicy: the name of NAT policy.
+        param:: rule_ids: with expanded, fetch only these rules in detail.
+        param:: models: return AutoNatRule models instead of dictionaries.
+        """
+        natpolicy_uuid = (await self.get_natpolicy_uuids()).get(natpolicy)
+        if not natpolicy_uuid:
+            raise FmcNotFoundError("NatPolicy {} was not found.".format(natpolicy))
+        if expanded and rule_ids is not None:
+            rules = await self.expand_autonatrules(natpolicy_uuid, rule_ids)
+            return AutoNatRule.from_items(rules) if models else rules
+        return [item async for item in self.iter_pages(
+            self._autonatrules_uri(natpolicy_uuid), expanded=expanded,
+            model=AutoNatRule if models else None)]
+
+    async def expand_autonatrules(self, natpolicy_uuid, rule_ids):
+        """
+        Fetch the details of the selected auto NAT rules of a policy concurrently.
+        """
+        uris = [self._autonatrule_uri(natpolicy_uuid, rule_id) for rule_id in rule_ids]
+        return [body for body in await self._get_concurrently(uris) if body]
+
+    async def get_autonatrules_many(self, natpolicies, expanded=False):
+        """
+        param:: natpolicies: names of NAT policies.
+        Fetch the rules of several policies concurrently.
+        Returns a mapping of policy name to its rules.
+        """
+        await self.get_natpolicy_uuids()
+        rules = await asyncio.gather(*[
+            self.get_autonatrules(natpolicy, expanded) for natpolicy in natpolicies
+        ])
+        return dict(zip(natpolicies, rules))
+
+    async def iter_pages(self, uri, page_size=None, expanded=False, model=None):
+        """
+        Yield the items of a paginated listing as each page arrives,
+        following the paging.next links returned by FMC.
+        param:: model: FmcModel class the items are yielded as.
+        """
+        params = self._page_params(page_size, expanded)
+        url = uri
+        while url:
+            try:
+                status, page = await self._request('GET', url, params=params)
+            except aiohttp.ClientError as exp:
+                _LOG(exp)
+                return
+            for item in page.get("items", []):
+                yield model(item) if model else item
+            url = self._next_page(page)
+            # next links already carry limit/offset/expanded
+            params = None
+
+    def iter_objects(self, objtype, page_size=None, expanded=False):
+        """
+        param:: objtype: object type in FMC (hosts, networks, interfaceobjects...)
+        Yield objects page by page instead of loading the whole listing at once.
+        """
+        return self.iter_pages(self._objects_uri(objtype), page_size=page_size,
+                               expanded=expanded)
+
+    async def get_objects(self, objtype):
+        """
+        param:: objtype: object type in FMC (hosts, networks, interfaceobjects...)
+        Return a name -> UUID mapping of every object of that type.
+        """
+        with self.metrics.operation('object_index_refresh:{}'.format(objtype)):
+            COLLECTOR = self._name_mapping(
+                [value async for value in self.iter_objects(objtype)])
+        self.object_index.store(objtype, COLLECTOR)
+        if not COLLECTOR:
+            _LOG("Could not retrieve objects - {}".format(objtype))
+            return None
+        return COLLECTOR
+
+    async def get_objects_many(self, objtypes):
+        """
+        Fetch several object types concurrently, in the order given.
+        """
+        return await asyncio.gather(*[self.get_objects(objtype) for objtype in objtypes])
+
+    async def lookup_object_uuid(self, objtype, name):
+        """
+        UUID of an object by name, or None.
+        The object table is fetched only if it is not indexed yet or expired.
+        """
+        if self.object_index.is_stale(objtype):
+            await self.get_objects(objtype)
+        return self.object_index.lookup(objtype, name)
+
+    async def resolve_autonatrule(self, payload, natpolicy_uuids=None):
+        """
+        See FmcApiHandler.resolve_autonatrule. Missing object tables are
+        fetched concurrently. Networks are resolved by name only: addresses
+        and {"name", "value"} objects raise UnsupportedReferenceError (the
+        synchronous handler resolves and provisions them).
+        """
+        for field in AUTONATRULE_NETWORK_FIELDS:
+            value = payload.get(field)
+            if isinstance(value, dict) or literal_object(value):
+                raise UnsupportedReferenceError(
+                    "{} {} must name an object, the async handler does not resolve addresses "
+                    "or create objects.".format(field, value))
+        stale = [objtype for objtype in AUTONATRULE_NETWORK_TYPES + (AUTONATRULE_INTERFACE_TYPE,)
+                 if self.object_index.is_stale(objtype)]
+        if natpolicy_uuids is None:
+            natpolicy_uuids, _ = await asyncio.gather(
+                self.get_natpolicy_uuids(), self.get_objects_many(stale))
+        else:
+            await self.get_objects_many(stale)
+        return self._build_autonatrule(payload, natpolicy_uuids)
+
+    async def create_ftdnatpolicy(self, payload):
+        """
+        Create NAT policy
+        """
+        try:
+            msg = "Creating FTD NAT policy {}".format(payload["name"])
+            _LOG(msg)
+            status, body = await self._request(
+                'POST', self._natpolicies_uri(), data=json.dumps(payload))
+        except aiohttp.ClientError as exp:
+            _LOG(exp)
+            return None, exp
+        if status == 201:
+            self.object_index.add(NATPOLICY_INDEX, body["name"], body["id"], item=body)
+        else:
+            self.object_index.invalidate(NATPOLICY_INDEX)
+        return status, body
+
+    async def create_autonatrule(self, payload):
+        """
+        Create Auto NAT rule in a target NAT policy
+        """
+        natpolicy_uuid, rule, errors = await self.resolve_autonatrule(payload)
+        if errors:
+            return (404, " ".join(errors))
+        try:
+            return await self._request(
+                'POST', self._autonatrules_uri(natpolicy_uuid), data=json.dumps(rule))
+        except aiohttp.ClientError as exp:
+            _LOG(exp)
+            return None, exp
+
+    async def create_object(self, payload):
+        """
+        param:: payload: dictionary of object configuration
+        The real object type in FMC.
+        """
+        if not payload["type"].lower() in OBJECTS_TYPE_ALLOWED:
+            raise UnsupportedObjectTypeError(
+                "{} is not supported object type.".format(payload["type"]))
+        try:
+            msg = "Creating {name} of type={obj_type} with value={value}".format(
+                name=payload["name"],
+                obj_type=payload["type"].lower(),
+                value=payload["value"]
+            )
+            _LOG(msg)
+            status, body = await self._request(
+                'POST', self._objects_uri(payload["type"]), data=json.dumps(payload))
+        except aiohttp.ClientError as exp:
+            _LOG(exp)
+            return None, exp
+        if status == 201:
+            self.object_index.add(payload["type"].lower(), body["name"], body["id"], item=body)
+        return status, body
+
+    async def create_objects(self, payloads):
+        """
+        Create independent objects concurrently.
+        Returns a list of (payload, status_code, result) in input order.
+        """
+        results = await asyncio.gather(*[self.create_object(payload) for payload in payloads])
+        return [(payload, rcode, rval) for payload, (rcode, rval) in zip(payloads, results)]
@@ -1,11 +1,107 @@
+import ipaddress
 import json
-import sys
+import threading
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
-import logging as LOG
+from itertools import islice
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlparse
+from fmc_auto_modules.exceptions import (
+    FmcAuthError,
+    FmcError,
+    FmcConnectionError,
+    FmcNotFoundError,
+    UnsupportedObjectTypeError
+)
+from fmc_auto_modules.fastjson import loads
+from fmc_auto_modules.ipindex import (
+    IP_OBJECT_TYPES,
+    ObjectIpIndex,
+    parse_interval
+)
+from fmc_auto_modules.logsetup import (
+    flush_logging,
+    get_logger
+)
+from fmc_auto_modules.metrics import ApiMetrics
+from fmc_auto_modules.models import (
+    AutoNatRule,
+    NatPolicy,
+    model_for
+)
+from fmc_auto_modules.nat_analyzer import (
+    NatRuleAnalyzer,
+    object_values
+)
+from fmc_auto_modules.object_index import (
+    DEFAULT_OBJECT_INDEX_TTL,
+    ObjectIndex
+)
+from fmc_auto_modules.ratelimit import (
+    DEFAULT_THROTTLE_RETRIES,
+    backoff_delay,
+    rate_limiter_for
+)
+from fmc_auto_modules.response_cache import ResponseCache
+from fmc_auto_modules.snapshot import (
+    AUTONATRULES,
+    SnapshotStore,
+    item_modified
+)
+from fmc_auto_modules.token_store import (
+    token_is_fresh,
+    token_is_refreshable
+)
 requests.packages.urllib3.disable_warnings()
 
-headers = {'Content-Type': 'application/json'}
+# Default headers, every handler works on its own copy
+headers = {'Content-Type': 'application/json', 'Connection': 'keep-alive'}
+
+# Connection pool and retry defaults of the HTTP session
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+RETRY_STATUS_CODES = (502, 503, 504)
+
+# Items requested per page of a listing. FMC does not return more than 1000.
+DEFAULT_PAGE_SIZE = 1000
+
+# Objects sent per bulk request. FMC does not accept more than 1000.
+BULK_CHUNK_SIZE = 1000
+# Statuses of a bulk request rejected because of invalid items, split to find them
+BULK_VALIDATION_STATUS_CODES = (400, 422)
+
+# Values looked up with FMC's value filter rather than by listing every IP object
+EQUAL_OBJECTS_FILTER_MAX = 10
+
+TOKEN_URI = '/api/fmc_platform/v1/auth/generatetoken'
+REFRESH_TOKEN_URI = '/api/fmc_platform/v1/auth/refreshtoken'
+SERVER_VERSION_URI = '/api/fmc_platform/v1/info/serverversion'
+
+# Object index table of the FTD NAT policies
+NATPOLICY_INDEX = 'ftdnatpolicies'
+
+# Object types referenced by name in auto NAT rule payloads
+AUTONATRULE_INTERFACE_TYPE = 'interfaceobjects'
+# Network fields of auto NAT rules are looked up in these types, in this order
+AUTONATRULE_NETWORK_TYPES = ('hosts', 'networks', 'ranges', 'fqdns')
+AUTONATRULE_NETWORK_FIELDS = ('originalNetwork', 'translatedNetwork')
+# Type of the objects of each type in FMC references
+NETWORK_TYPE_NAMES = {
+    'hosts': 'Host',
+    'networks': 'Network',
+    'ranges': 'Range',
+    'fqdns': 'FQDN',
+}
+# Prefix of the names given to objects created for an address, prefix or range
+AUTO_OBJECT_PREFIXES = {
+    'hosts': 'host',
+    'networks': 'net',
+    'ranges': 'range',
+}
 
 # Only allow the following objects
 OBJECTS_TYPE_ALLOWED = [
@@ -15,280 +111,1232 @@ OBJECTS_TYPE_ALLOWED = [
     'ranges',
 ]
 
-HOSTS_OBJECTS_MAPPING = {}
-NETWORKS_OBJECTS_MAPPING = {}
-INTERFACES_OBJECTS_MAPPING = {}
+
+def literal_object(value):
+    """
+    param:: value: address, prefix (a.b.c.d/nn) or range (first-last).
+    Returns (objtype, value) of the object standing for it: a host for an
+    address or a full-length prefix, else a network or a range. None if
+    value is none of them.
+    """
+    if not isinstance(value, str) or parse_interval(value) is None:
+        return None
+    value = value.strip()
+    if '-' in value:
+        return 'ranges', value
+    if '/' in value:
+        network = ipaddress.ip_network(value, strict=False)
+        if network.num_addresses > 1:
+            return 'networks', str(network)
+        value = str(network.network_address)
+    return 'hosts', value
+
+
+def auto_object_name(objtype, value):
+    """
+    Name of the object created for a literal address, prefix or range
+    """
+    return "{}_{}".format(AUTO_OBJECT_PREFIXES[objtype],
+                          value.replace('/', '_').replace(':', '_'))
 
 
 def ConsoleEcho(msg):
+    # Queued log messages come first, as they were logged before
+    flush_logging()
     print(msg)
 
 
-def _LOG(msg, log_level="info", logfile="/var/log/fmc_automation.log"):
+def _LOG(msg, log_level="info", logfile=None):
     """
-    Logging
+    Logging to the console and the log file, written by a background thread
+    (see logsetup.configure_logging).
+    param:: logfile: log file used if logging is not configured yet.
     """
-    # Print it on Console
-    ConsoleEcho(msg)
-    # Logging config
-    LOG.basicConfig(
-        filename=logfile,
-        format='%(asctime)s %(levelname)-8s %(message)s',
-        level=LOG.DEBUG,
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    # Logging
+    logger = get_logger(logfile)
     if log_level.lower() == "debug":
-        LOG.debug(msg)
+        logger.debug(msg)
     elif log_level.lower() == "warning":
-        LOG.warning(msg)
+        logger.warning(msg)
+    elif log_level.lower() == "error":
+        logger.error(msg)
     else:
-        LOG.info(msg)
+        logger.info(msg)
 
 
-class FmcApiHandler(object):
+class FmcApiBase(object):
     """
-    FMC's API handler
+    Endpoints, payload building and response parsing shared by the
+    synchronous and the asynchronous API handlers. Subclasses do the I/O.
     """
-    def __init__(self, fmcserver, username, password, domain='Global', sslverify=False):
+    def __init__(self, fmcserver, username, password, domain='Global', sslverify=False,
+                 token_store=None, object_index_ttl=DEFAULT_OBJECT_INDEX_TTL,
+                 object_index_ttls=None, page_size=DEFAULT_PAGE_SIZE, scheme='https',
+                 rate_limiter=None, throttle_retries=DEFAULT_THROTTLE_RETRIES, snapshot=None):
         self.fmcserver = fmcserver
         self.username = username
         self.password = password
         self.sslverify = sslverify
         self.domain = domain
-        self.baseuri = 'https://{}'.format(fmcserver)
-        token_domain = self.get_token()
-        self.token = token_domain['token']
-        self.domain_uuid = token_domain['domain_uuid']
-        headers['X-auth-access-token'] = self.token
+        self.page_size = page_size
+        self.baseuri = '{}://{}'.format(scheme, fmcserver)
+        self.headers = dict(headers)
+        self.token_store = token_store
+        self.token_entry = None
+        self.token = None
+        self.domain_uuid = None
+        self.object_index = ObjectIndex(object_index_ttl, object_index_ttls)
+        self.rate_limiter = rate_limiter or rate_limiter_for(fmcserver)
+        self.throttle_retries = throttle_retries
+        self.metrics = ApiMetrics()
+        self.request_hooks = [self.metrics.record_request]
+        self.snapshot = snapshot
+        self.snapshot_scope = SnapshotStore.scope(fmcserver, domain)
+        self.offline = False
+
+    def add_request_hook(self, hook):
+        """
+        param:: hook: callable(method, url, status_code, latency, bytes_out, bytes_in)
+        called after every HTTP request; status_code is None if it failed.
+        """
+        self.request_hooks.append(hook)
 
-    def _close_connection(self, resp):
+    def remove_request_hook(self, hook):
+        if hook in self.request_hooks:
+            self.request_hooks.remove(hook)
+
+    def _emit_request(self, method, url, status_code, latency, data, bytes_in):
+        if isinstance(data, str):
+            data = data.encode()
+        bytes_out = len(data) if data else 0
+        for hook in self.request_hooks:
+            hook(method, url, status_code, latency, bytes_out, bytes_in)
+
+    def _throttle_delay(self, attempt, status_code, resp_headers):
+        """
+        Seconds to wait before replaying a request FMC answered 429 to,
+        None if the response is final. Every request to the host is held back
+        for that long, not only the throttled one.
+        """
+        if status_code != 429 or attempt >= self.throttle_retries:
+            return None
+        delay = backoff_delay(attempt, resp_headers.get('Retry-After'))
+        _LOG("FMC throttled the request (429). Retrying in {:.1f}s, {} requests queued.".format(
+            delay, self.rate_limiter.queue_depth), "warning")
+        self.rate_limiter.pause(delay)
+        return delay
+
+    def _url(self, uri):
+        """
+        param:: uri: path relative to baseuri, or a full url (e.g. paging links).
+        """
+        if uri.startswith('http'):
+            return uri
+        return "{baseuri}{uri}".format(baseuri=self.baseuri, uri=uri)
+
+    def _select_domain_uuid(self, domains):
         """
-        Close connection
+        Pick the UUID of the configured domain out of the DOMAINS header
         """
-        resp.connection.close()
+        if len(domains) == 1:
+            return domains[0]["uuid"]
+        for key, value in enumerate(domains):
+            if value['name'] == self.domain:
+                return domains[key]['uuid']
+        return None
+
+    def _parse_token(self, resp_headers, previous=None):
+        """
+        Token entry out of the headers of a generatetoken/refreshtoken
+        response, or None if FMC did not return a token.
+        param:: previous: the entry that was refreshed, if any.
+        """
+        token = resp_headers.get('X-auth-access-token')
+        if token is None:
+            return None
+        if resp_headers.get('DOMAINS'):
+            domains = json.loads(resp_headers.get('DOMAINS'))
+        else:
+            domains = previous['domains']
+        return {
+            'token': token,
+            'refresh_token': resp_headers.get('X-auth-refresh-token',
+                                              previous and previous['refresh_token']),
+            'domains': domains,
+            'domain_uuid': self._select_domain_uuid(domains),
+            'issued_at': time.time(),
+            'refresh_count': previous.get('refresh_count', 0) + 1 if previous else 0
+        }
+
+    def _apply_token(self, entry):
+        """
+        Make a token entry the one used by subsequent requests.
+        Headers are replaced, not updated, so requests in flight keep a
+        consistent copy.
+        """
+        self.token_entry = entry
+        self.token = entry['token']
+        self.domain_uuid = entry['domain_uuid']
+        self.headers = dict(self.headers, **{'X-auth-access-token': self.token})
+
+    def _refresh_headers(self, entry):
+        refresh_headers = dict(self.headers)
+        refresh_headers['X-auth-access-token'] = entry['token']
+        refresh_headers['X-auth-refresh-token'] = entry['refresh_token']
+        return refresh_headers
+
+    def _natpolicies_uri(self):
+        return "/api/fmc_config/v1/domain/{}/policy/ftdnatpolicies".format(self.domain_uuid)
+
+    def _natpolicy_uri(self, natpolicy_uuid):
+        return "{}/{}".format(self._natpolicies_uri(), natpolicy_uuid)
+
+    def _autonatrules_uri(self, natpolicy_uuid):
+        return ("/api/fmc_config/v1/domain/{domain_uuid}/policy/ftdnatpolicies/"
+                "{nat_id}/autonatrules".format(
+                    domain_uuid=self.domain_uuid,
+                    nat_id=natpolicy_uuid)
+            )
+
+    def _autonatrule_uri(self, natpolicy_uuid, rule_uuid):
+        return "{}/{}".format(self._autonatrules_uri(natpolicy_uuid), rule_uuid)
+
+    def _index_natpolicies(self, natpolicies):
+        """
+        Refresh the NAT policy index from a full policy listing
+        """
+        self.object_index.store(NATPOLICY_INDEX, self._name_mapping(natpolicies),
+                                items=dict((value["name"], value) for value in natpolicies))
+
+    def _objects_uri(self, objtype):
+        return "/api/fmc_config/v1/domain/{}/object/{}".format(self.domain_uuid, objtype)
+
+    def _object_uri(self, objtype, object_uuid):
+        return "{}/{}".format(self._objects_uri(objtype), object_uuid)
+
+    def _deployable_devices_uri(self):
+        return "/api/fmc_config/v1/domain/{}/deployment/deployabledevices".format(
+            self.domain_uuid)
+
+    def _deployment_requests_uri(self):
+        return "/api/fmc_config/v1/domain/{}/deployment/deploymentrequests".format(
+            self.domain_uuid)
+
+    def _task_status_uri(self, task_id):
+        return "/api/fmc_config/v1/domain/{}/job/taskstatuses/{}".format(self.domain_uuid,
+                                                                         task_id)
+
+    def _policy_assignment_uri(self, policy_uuid):
+        return "/api/fmc_config/v1/domain/{}/assignment/policyassignments/{}".format(
+            self.domain_uuid, policy_uuid)
+
+    def _audit_records_uri(self):
+        return "/api/fmc_platform/v1/domain/{}/audit/auditrecords".format(self.domain_uuid)
+
+    def _page_params(self, page_size=None, expanded=False, offset=0):
+        params = {'limit': page_size or self.page_size}
+        if expanded:
+            params['expanded'] = 'true'
+        if offset:
+            params['offset'] = offset
+        return params
+
+    @staticmethod
+    def _next_page(page):
+        """
+        Url of the next page of a listing, None on the last page
+        """
+        next_links = page.get("paging", {}).get("next")
+        return next_links[0] if next_links else None
+
+    @staticmethod
+    def _name_mapping(items):
+        """
+        Mapping of object name to uuid
+        """
+        return dict((value["name"], value["id"]) for value in items)
+
+    @staticmethod
+    def _network_name(value):
+        """
+        Name a network field is looked up by: the name of a {"name", "value"}
+        object, else the field itself (a name or a literal address).
+        """
+        if isinstance(value, dict):
+            return value.get("name") or value.get("value")
+        return value
+
+    def _network_reference(self, value, references):
+        """
+        FMC reference of a network field, with the name of the object: from
+        references (name/literal -> reference) or from the first network type
+        whose table holds the name.
+        """
+        name = self._network_name(value)
+        literal = literal_object(name)
+        for key in (name, auto_object_name(*literal) if literal else None):
+            if key in references:
+                return references[key]
+            for objtype in AUTONATRULE_NETWORK_TYPES:
+                uuid = self.object_index.lookup(objtype, key)
+                if uuid:
+                    return {"type": NETWORK_TYPE_NAMES[objtype], "id": uuid, "name": key}
+        return None
+
+    def _network_lookup_names(self, payloads):
+        """
+        Names the network fields of payloads are looked up by, with the
+        names of the objects standing for literal addresses
+        """
+        names = set()
+        for payload in payloads:
+            for field in AUTONATRULE_NETWORK_FIELDS:
+                name = self._network_name(payload.get(field))
+                literal = literal_object(name)
+                if literal:
+                    names.add(auto_object_name(*literal))
+                elif name:
+                    names.add(name)
+        return names
+
+    def _build_autonatrule(self, payload, natpolicy_uuids, references=None):
+        """
+        Replace the names in an auto NAT rule payload with FMC references,
+        using the object index (which must hold the referenced tables).
+        param:: references: name or literal -> reference of the network
+                objects resolved or created beforehand.
+        Returns (natpolicy_uuid, rule, errors).
+        """
+        rule = deepcopy(payload)
+        errors = []
+        natpolicy_uuid = natpolicy_uuids.get(rule.pop("targetNatPolicy", None))
+        if not natpolicy_uuid:
+            errors.append("NatPolicy {} was not found.".format(payload.get("targetNatPolicy")))
+        for field in AUTONATRULE_NETWORK_FIELDS:
+            reference = self._network_reference(rule.get(field), references or {})
+            if reference:
+                rule[field] = reference
+            else:
+                errors.append("UUID of {} not found.".format(self._network_name(rule.get(field))))
+        for field in ("sourceInterface", "destinationInterface"):
+            # An empty interface means any interface
+            if not rule.get(field):
+                rule.pop(field, None)
+                continue
+            uuid = self.object_index.lookup(AUTONATRULE_INTERFACE_TYPE, rule[field])
+            if uuid:
+                rule[field] = {"type": "SecurityZone", "id": uuid}
+            else:
+                errors.append("UUID of {} not found.".format(rule[field]))
+        return natpolicy_uuid, rule, errors
+
+    @staticmethod
+    def _bulk_results(chunk, status_code, body):
+        """
+        Pair each payload of a successful bulk request with its created item.
+        Created items come back in request order.
+        """
+        items = body.get("items", [])
+        results = []
+        for position, payload in enumerate(chunk):
+            if position < len(items):
+                results.append((payload, status_code, items[position]))
+            else:
+                results.append((payload, None, "Missing from bulk response."))
+        return results
+
+
+class FmcApiHandler(FmcApiBase):
+    """
+    FMC's API handler
+    """
+    def __init__(self, fmcserver, username, password, domain='Global', sslverify=False,
+                 pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES, token_store=None,
+                 object_index_ttl=DEFAULT_OBJECT_INDEX_TTL, object_index_ttls=None,
+                 page_size=DEFAULT_PAGE_SIZE, scheme='https', rate_limiter=None,
+                 throttle_retries=DEFAULT_THROTTLE_RETRIES, snapshot=None, offline=False,
+                 response_cache=None):
+        """
+        param:: snapshot: SnapshotStore kept up to date by refresh_snapshot().
+        param:: response_cache: ResponseCache the GETs go through, possibly shared
+                with other handlers. None (the default) sends every GET to FMC.
+        param:: offline: answer listings and lookups from the snapshot without
+                contacting FMC at all. Other calls fail with a ConnectionError.
+        """
+        super().__init__(fmcserver, username, password, domain, sslverify,
+                         token_store=token_store, object_index_ttl=object_index_ttl,
+                         object_index_ttls=object_index_ttls, page_size=page_size,
+                         scheme=scheme, rate_limiter=rate_limiter,
+                         throttle_retries=throttle_retries, snapshot=snapshot)
+        if offline and snapshot is None:
+            raise ValueError("Offline mode needs a snapshot.")
+        self.offline = offline
+        self.response_cache = response_cache or None
+        self.pool_size = pool_size
+        self.session = self._build_session(pool_size, retries)
+        self._auth_lock = threading.Lock()
+        if not offline:
+            self._authenticate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _build_session(self, pool_size, retries):
+        """
+        Build the keep-alive session shared by every request of this handler.
+        Idempotent requests are retried on connection errors and gateway errors;
+        POSTs are only retried when the connection could not be established.
+        """
+        session = requests.Session()
+        retry = Retry(
+            total=retries,
+            backoff_factor=DEFAULT_BACKOFF_FACTOR,
+            status_forcelist=RETRY_STATUS_CODES,
+            raise_on_status=False,
+            # 429s are paced by the rate limiter, see _send()
+            respect_retry_after_header=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=retry
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def close(self):
+        """
+        Close pooled connections
+        """
+        self.session.close()
+
+    def _send(self, method, uri, extra_headers=None, **kwargs):
+        """
+        Send a request through the pooled session, paced by the host's rate
+        limiter and replayed with backoff when FMC answers 429.
+        """
+        kwargs.setdefault('headers', self.headers)
+        if extra_headers:
+            kwargs['headers'] = dict(kwargs['headers'], **extra_headers)
+        kwargs.setdefault('verify', self.sslverify)
+        url = self._url(uri)
+        attempt = 0
+        while True:
+            with self.rate_limiter.slot():
+                started = time.perf_counter()
+                try:
+                    resp = self.session.request(method, url, **kwargs)
+                except requests.exceptions.RequestException:
+                    self._emit_request(method, url, None, time.perf_counter() - started,
+                                       kwargs.get('data'), 0)
+                    raise
+                self._emit_request(method, resp.url, resp.status_code,
+                                   time.perf_counter() - started, kwargs.get('data'),
+                                   len(resp.content))
+            if self._throttle_delay(attempt, resp.status_code, resp.headers) is None:
+                return resp
+            attempt += 1
+
+    def _request(self, method, uri, **kwargs):
+        """
+        Send an authenticated request.
+        GETs go through the response cache, other methods drop the cached
+        responses of the collection they write to.
+        """
+        if self.offline:
+            raise requests.exceptions.ConnectionError(
+                "Offline mode - {} {} was not sent.".format(method, uri))
+        if self.response_cache is None:
+            return self._request_uncached(method, uri, **kwargs)
+        url = self._url(uri)
+        if method == 'GET':
+            url = requests.Request(method, url, params=kwargs.get('params')).prepare().url
+            return self.response_cache.get(
+                ResponseCache.key(self.username, url), url,
+                lambda conditional: self._request_uncached(method, uri,
+                                                           extra_headers=conditional, **kwargs))
+        try:
+            return self._request_uncached(method, uri, **kwargs)
+        finally:
+            self.response_cache.invalidate(urlparse(url).path)
+
+    def _request_uncached(self, method, uri, **kwargs):
+        """
+        The token is refreshed before it expires and, if FMC still answers
+        401, the handler re-authenticates and replays the request once.
+        """
+        if not token_is_fresh(self.token_entry):
+            self._authenticate()
+        token = self.token
+        resp = self._send(method, uri, **kwargs)
+        if resp.status_code == 401:
+            _LOG("Token rejected by FMC. Re-authenticating.", "warning")
+            self._authenticate(rejected=token)
+            resp = self._send(method, uri, **kwargs)
+        return resp
+
+    def _json(self, resp):
+        """
+        Decode a JSON response body, timing it for the metrics
+        """
+        started = time.perf_counter()
+        body = loads(resp.content)
+        self.metrics.record_parse(resp.request.method, resp.url, time.perf_counter() - started)
+        return body
+
+    def _authenticate(self, rejected=None):
+        """
+        Reuse a cached token if still valid, refresh it if it is about to
+        expire, otherwise generate a new one.
+        param:: rejected: token FMC answered 401 to. Threads that were
+                rejected with the same token share one re-authentication.
+        """
+        with self._auth_lock:
+            if rejected is not None and self.token != rejected:
+                return
+            if rejected is None and self.token_entry and token_is_fresh(self.token_entry):
+                return
+            if self.token_store is None:
+                self._apply_token(self._renew_token(None if rejected else self.token_entry))
+                return
+            with self.token_store.lock():
+                entry = self.token_store.load(self.fmcserver, self.username, self.domain)
+                if rejected and entry and entry['token'] == rejected:
+                    # Nobody renewed the rejected token in the meantime. Drop it
+                    # so it is not reused if generating a new one fails.
+                    self.token_store.delete(self.fmcserver, self.username, self.domain)
+                    entry = None
+                entry = self._renew_token(entry)
+                self.token_store.save(self.fmcserver, self.username, self.domain, entry)
+            self._apply_token(entry)
+
+    def _renew_token(self, entry):
+        """
+        Return a usable token entry derived from the given (possibly None) one.
+        """
+        if entry and token_is_fresh(entry):
+            return entry
+        if entry and token_is_refreshable(entry):
+            refreshed = self.refresh_token(entry)
+            if refreshed:
+                return refreshed
+        return self.get_token()
 
     def get_token(self):
         """
         Get token
+        Raises FmcConnectionError if FMC cannot be reached, FmcAuthError if it
+        returns no token or the domain does not exist.
         """
-        url = '{}/api/fmc_platform/v1/auth/generatetoken'.format(self.baseuri)
         try:
-            resp = requests.post(
-                url,
-                headers=headers,
-                auth=requests.auth.HTTPBasicAuth(self.username,self.password),
-                verify=False
-            )
-            token = resp.headers.get('X-auth-access-token', default=None)
-            domains = json.loads(resp.headers.get('DOMAINS'))
-            if len(domains) == 1:
-                domain_uuid = domains[0]["uuid"]
-            elif len(domains) > 1:
-                for key, value in enumerate(domains):
-                    if value['name'] == self.domain:
-                        domain_uuid = domains[key]['uuid']
-            if token == None:
-                _LOG("Token not found. Aborting.")
-                self._close_connection(resp)
-                sys.exit(1)
-        except Exception as exp:
-            _LOG(exp)
-            self._close_connection(resp)
-            sys.exit(1)
-        return {'token': token, 'domain_uuid': domain_uuid}
+            with self.metrics.operation('token_generate'):
+                resp = self._send(
+                    'POST', TOKEN_URI,
+                    auth=requests.auth.HTTPBasicAuth(self.username, self.password)
+                )
+        except requests.exceptions.RequestException as exp:
+            raise FmcConnectionError("Token request to {} failed: {}".format(self.fmcserver, exp))
+        entry = self._parse_token(resp.headers)
+        if entry == None:
+            raise FmcAuthError("Token not found ({} {}).".format(resp.status_code, resp.reason))
+        if entry['domain_uuid'] == None:
+            raise FmcAuthError("Domain {} not found.".format(self.domain))
+        return entry
+
+    def refresh_token(self, entry):
+        """
+        Exchange the refresh token for a new access token.
+        Returns the new token entry, or None if FMC refused to refresh it.
+        """
+        try:
+            with self.metrics.operation('token_refresh'):
+                resp = self._send('POST', REFRESH_TOKEN_URI,
+                                  headers=self._refresh_headers(entry))
+        except requests.exceptions.RequestException as exp:
+            _LOG(exp, "warning")
+            return None
+        if resp.status_code >= 400:
+            return None
+        return self._parse_token(resp.headers, previous=entry)
 
     def get_version(self):
-     """
-     Get FMC server version
-     """
-     url = "{}/api/fmc_platform/v1/info/serverversion".format(self.baseuri)
-     try:
-         resp = requests.get(url, headers=headers, verify=self.sslverify)
-     except requests.exceptions.HTTPError as exp:
-         _LOG(exp)
-     self._close_connection(resp)
-     return resp.json()['items'][0]['serverVersion']
-
-    def get_ftdnatpolicies(self, expanded=False):
         """
-        GET FTD NAT policies.
+        Get FMC server version
         """
-        if expanded:
-            uri = ("/api/fmc_config/v1/domain/{}/policy/"
-                   "ftdnatpolicies?expanded=true".format(self.domain_uuid)
-                  )
-        else:
-            uri = ("/api/fmc_config/v1/domain/{}/policy/"
-                   "ftdnatpolicies".format(self.domain_uuid)
-                  )
-        url = "{baseuri}{uri}".format(baseuri=self.baseuri, uri=uri)
         try:
-            resp = requests.get(url, headers=headers, verify=self.sslverify)
-        except requests.exceptions.HTTPError as exp:
+            resp = self._request('GET', SERVER_VERSION_URI)
+        except requests.exceptions.RequestException as exp:
             _LOG(exp)
-        self._close_connection(resp)
-        return resp.json()["items"]
-    
-    def get_autonatrules(self, natpolicy, expanded=False):
+            return None
+        return self._json(resp)['items'][0]['serverVersion']
+
+    def get_ftdnatpolicies(self, expanded=False, natpolicies=None, models=False):
+        """
+        GET FTD NAT policies.
+        param:: natpolicies: names of the policies wanted, all of them by default.
+        param:: models: return NatPolicy models instead of dictionaries.
+        Selected policies are taken from the policy index and, with expanded,
+        only those are fetched in detail instead of the whole expanded listing.
+        """
+        if self.offline:
+            items = self.snapshot.items(self.snapshot_scope, NATPOLICY_INDEX)
+            self._index_natpolicies(items)
+            if natpolicies is not None:
+                items = [item for item in items if item["name"] in natpolicies]
+        elif natpolicies is not None:
+            if expanded:
+                items = self.expand_ftdnatpolicies(natpolicies)
+            else:
+                self.get_natpolicy_uuids()
+                items = [self.object_index.item(NATPOLICY_INDEX, name) for name in natpolicies
+                         if self.object_index.item(NATPOLICY_INDEX, name)]
+        else:
+            items = list(self.iter_pages(self._natpolicies_uri(), expanded=expanded))
+            self._index_natpolicies(items)
+        return NatPolicy.from_items(items) if models else items
+
+    def get_natpolicy_uuids(self):
+        """
+        Name -> UUID mapping of the FTD NAT policies.
+        Served from the policy index, which is listed only when stale.
+        """
+        if self.object_index.is_stale(NATPOLICY_INDEX):
+            self.get_ftdnatpolicies()
+        return self.object_index.table(NATPOLICY_INDEX)
+
+    def lookup_natpolicy_uuid(self, natpolicy):
+        """
+        UUID of a NAT policy by name, or None
+        """
+        return self.get_natpolicy_uuids().get(natpolicy)
+
+    def _get_concurrently(self, uris):
+        """
+        GET several resources in parallel over the pooled session.
+        Returns the decoded bodies in order, None for those that failed.
+        """
+        def fetch(uri):
+            try:
+                resp = self._request('GET', uri)
+            except requests.exceptions.RequestException as exp:
+                _LOG(exp)
+                return None
+            if resp.status_code != 200:
+                _LOG("GET {} failed with {}".format(uri, resp.status_code), "warning")
+                return None
+            return self._json(resp)
+        if len(uris) < 2:
+            return [fetch(uri) for uri in uris]
+        with ThreadPoolExecutor(max_workers=min(len(uris), self.pool_size)) as pool:
+            return list(pool.map(fetch, uris))
+
+    def expand_ftdnatpolicies(self, natpolicies):
+        """
+        param:: natpolicies: names of NAT policies.
+        Fetch the details of the selected policies concurrently.
+        """
+        natpolicy_uuids = self.get_natpolicy_uuids()
+        for natpolicy in natpolicies:
+            if natpolicy not in natpolicy_uuids:
+                _LOG("NatPolicy {} was not found.".format(natpolicy))
+        uris = [self._natpolicy_uri(natpolicy_uuids[natpolicy])
+                for natpolicy in natpolicies if natpolicy in natpolicy_uuids]
+        return [body for body in self._get_concurrently(uris) if body]
+
+    def get_autonatrules(self, natpolicy, expanded=False, rule_ids=None, models=False):
         """
         param:: ftdnatpolicy: the name of NAT policy.
+        param:: rule_ids: with expanded, fetch only these rules in detail.
+        param:: models: return AutoNatRule models instead of dictionaries,
+                built page by page so the whole listing is never held as dictionaries.
         NAT rules are tied to NAT policy. 
         """
         # Get UUID of natpolicy
-        natpolicy_uuid = None
-        for key, value in enumerate(self.get_ftdnatpolicies()):
-            if value["name"] == natpolicy:
-                natpolicy_uuid = value["id"]
-        # quit if NAT policy was not found
+        natpolicy_uuid = self.lookup_natpolicy_uuid(natpolicy)
         if not natpolicy_uuid:
-            _LOG("NatPolicy {} was not found.".format(natpolicy))
-            sys.exit(1)
-        # format target uri
-        if expanded:
-            uri = ("/api/fmc_config/v1/domain/{domain_uuid}/policy/"
-                   "ftdnatpolicies/{natpolicy_uuid}/autonatrules?expanded=true".format(
-                       domain_uuid=self.domain_uuid,
-                       natpolicy_uuid=natpolicy_uuid)
-                  )
+            raise FmcNotFoundError("NatPolicy {} was not found.".format(natpolicy))
+        if self.offline:
+            rules = self.snapshot.items(self.snapshot_scope, AUTONATRULES, natpolicy_uuid)
+            if expanded and rule_ids is not None:
+                rules = [rule for rule in rules if rule["id"] in rule_ids]
+        elif expanded and rule_ids is not None:
+            rules = self.expand_autonatrules(natpolicy_uuid, rule_ids)
         else:
-            uri = ("/api/fmc_config/v1/domain/{domain_uuid}/policy/"
-                   "ftdnatpolicies/{natpolicy_uuid}/autonatrules".format(
-                       domain_uuid=self.domain_uuid,
-                       natpolicy_uuid=natpolicy_uuid)
-                  )
-        url = "{baseuri}{uri}".format(baseuri=self.baseuri, uri=uri)
-        try:
-            resp = requests.get(url, headers=headers, verify=self.sslverify)
-        except requests.exceptions.HTTPError as exp:
-            _LOG(exp)
-        self._close_connection(resp)
-        return resp.json()["items"]
+            return list(self.iter_pages(self._autonatrules_uri(natpolicy_uuid), expanded=expanded,
+                                        model=AutoNatRule if models else None))
+        return AutoNatRule.from_items(rules) if models else rules
 
-    def get_objects(self, objtype):
+    def iter_autonatrules(self, natpolicy, expanded=False, rule_ids=None, models=False,
+                          offset=0, strict=False):
         """
+        Like get_autonatrules, but the full listing is yielded page by page
+        instead of being collected first.
+        param:: offset, strict: see iter_pages.
+        """
+        if self.offline or (expanded and rule_ids is not None):
+            return islice(self.get_autonatrules(natpolicy, expanded, rule_ids, models),
+                          offset, None)
+        natpolicy_uuid = self.lookup_natpolicy_uuid(natpolicy)
+        if not natpolicy_uuid:
+            raise FmcNotFoundError("NatPolicy {} was not found.".format(natpolicy))
+        return self.iter_pages(self._autonatrules_uri(natpolicy_uuid), expanded=expanded,
+                               model=AutoNatRule if models else None, offset=offset,
+                               strict=strict)
+
+    def expand_autonatrules(self, natpolicy_uuid, rule_ids):
+        """
+        Fetch the details of the selected auto NAT rules of a policy concurrently.
+        """
+        uris = [self._autonatrule_uri(natpolicy_uuid, rule_id) for rule_id in rule_ids]
+        return [body for body in self._get_concurrently(uris) if body]
+
+    def expand_objects(self, objtype, uuids):
+        """
+        Fetch the details of the selected objects of a type concurrently
+        (from the snapshot when offline).
+        """
+        if self.offline:
+            return [item for uuid in uuids
+                    for item in self.snapshot.find(self.snapshot_scope, uuid=uuid,
+                                                   collection=objtype)]
+        uris = ["{}/{}".format(self._objects_uri(objtype), uuid) for uuid in uuids]
+        return [body for body in self._get_concurrently(uris) if body]
+
+    def iter_pages(self, uri, page_size=None, expanded=False, model=None, offset=0,
+                   strict=False, query=None):
+        """
+        Yield the items of a paginated listing as each page arrives,
+        following the paging.next links returned by FMC.
+        param:: page_size: items per request, defaults to the handler's page_size.
+        param:: model: FmcModel class the items are yielded as.
+        param:: offset: number of items of the listing to skip, e.g. to resume it.
+        param:: strict: raise FmcError when a page cannot be fetched instead
+                of ending the listing there.
+        param:: query: other parameters of the listing, e.g. {'filter': ...}.
+        """
+        params = self._page_params(page_size, expanded, offset)
+        params.update(query or {})
+        url = uri
+        while url:
+            try:
+                resp = self._request('GET', url, params=params)
+            except requests.exceptions.RequestException as exp:
+                if strict:
+                    raise FmcConnectionError("GET {} failed: {}".format(url, exp))
+                _LOG(exp)
+                return
+            if strict and resp.status_code != 200:
+                raise FmcError("GET {} failed with {}".format(url, resp.status_code))
+            page = self._json(resp)
+            for item in page.get("items", []):
+                yield model(item) if model else item
+            url = self._next_page(page)
+            # next links already carry limit/offset/expanded
+            params = None
+
+    def iter_objects(self, objtype, page_size=None, expanded=False, models=False, offset=0,
+                     strict=False):
+        """
+        param:: objtype: object type in FMC (hosts, networks, interfaceobjects...)
+        param:: models: yield models (see models.model_for) instead of dictionaries.
+        param:: offset, strict: see iter_pages.
+        Yield objects page by page instead of loading the whole listing at once.
+        In offline mode they come from the snapshot.
+        """
+        model = model_for(objtype) if models else None
+        if self.offline:
+            items = self.snapshot.items(self.snapshot_scope, objtype)[offset:]
+            return iter(model.from_items(items) if model else items)
+        return self.iter_pages(self._objects_uri(objtype), page_size=page_size,
+                               expanded=expanded, model=model, offset=offset, strict=strict)
+
+    def get_objects(self, objtype, expanded=False, models=False):
+        """
+        param:: objtype: object type in FMC (hosts, networks, interfaceobjects...)
+        param:: expanded: also keep the full objects in the index (object_index.items).
+        param:: models: keep them as compact models rather than dictionaries.
+        Return a name -> UUID mapping of every object of that type.
         """
-        # Get object count first so all objects can be retrived at once
-        uri = "/api/fmc_config/v1/domain/{}/object/{}?limit=1".format(
-            self.domain_uuid, objtype)
-        url = "{}{}".format(self.baseuri, uri)
-        try:
-            resp = requests.get(url, headers=headers, verify=self.sslverify)
-        except requests.exceptions.HTTPError as exp:
-            _LOG(exp)
-            return None
-        count = resp.json()["paging"]["count"]
-        uri = "/api/fmc_config/v1/domain/{}/object/{}?limit={}".format(
-            self.domain_uuid, objtype, count)
-        url = "{}{}".format(self.baseuri, uri)
-        try:
-            resp = requests.get(url, headers=headers, verify=self.sslverify)
-        except requests.exceptions.HTTPError as exp:
-            _LOG(exp)
-            return None
-        objects = resp.json()["items"]
-        if not objects:
-            _LOG("Could not retrieve objects - {}".format(objects))
-            return None
         # Collect hosts mapping - a ditionary that mapped host_name to uuid
-        COLLECTOR = {}
-        for key, value in enumerate(objects):
-            COLLECTOR[value["name"]] = value["id"]
-        if objtype == "networks":
-            global NETWORKS_OBJECTS_MAPPING
-            NETWORKS_OBJECTS_MAPPING = COLLECTOR
-        elif objtype == "hosts":
-            global HOSTS_OBJECTS_MAPPING
-            HOSTS_OBJECTS_MAPPING = COLLECTOR
-        elif objtype == "interfaceobjects":
-            global INTERFACES_OBJECTS_MAPPING
-            INTERFACES_OBJECTS_MAPPING = COLLECTOR
+        with self.metrics.operation('object_index_refresh:{}'.format(objtype)):
+            items = list(self.iter_objects(objtype, expanded=expanded, models=models))
+            COLLECTOR = self._name_mapping(items)
+        self.object_index.store(objtype, COLLECTOR,
+                                items=dict((value["name"], value) for value in items)
+                                if expanded else None)
+        if not COLLECTOR:
+            _LOG("Could not retrieve objects - {}".format(objtype))
+            return None
         return COLLECTOR
 
+    def lookup_object_uuid(self, objtype, name):
+        """
+        UUID of an object by name, or None.
+        The object table is fetched only if it is not indexed yet or expired.
+        """
+        if self.object_index.is_stale(objtype):
+            self.get_objects(objtype)
+        return self.object_index.lookup(objtype, name)
+
+    def _refresh_collection(self, uri, collection, parent='', full=False, ids_only=False):
+        """
+        Bring one snapshot collection up to date and return (written, removed).
+        The expanded listing is paged through and the items whose name or
+        metadata timestamp changed are rewritten, every item with full.
+        With ids_only, only ids and names are listed and the details of new or
+        renamed items are fetched concurrently: cheaper, but values edited in
+        place are not seen. The expanded listing is used instead when paging
+        is cheaper than one-by-one GETs.
+        """
+        known = self.snapshot.known(self.snapshot_scope, collection, parent)
+        listing = list(self.iter_pages(uri, expanded=not ids_only))
+        removed = set(known) - set(item["id"] for item in listing)
+        if not ids_only:
+            changed = [item for item in listing if full or item_modified(item) is None or
+                       known.get(item["id"]) != (item.get("name"), item_modified(item))]
+        else:
+            stale = [item["id"] for item in listing
+                     if item["id"] not in known or known[item["id"]][0] != item.get("name")]
+            # One-by-one GETs run pool_size at a time, expanded pages one at a time
+            pages = -(-len(listing) // self.page_size)
+            if len(stale) > pages * self.pool_size:
+                return self._refresh_collection(uri, collection, parent)
+            changed = [body for body in self._get_concurrently(
+                ["{}/{}".format(uri, uuid) for uuid in stale]) if body]
+        self.snapshot.apply(self.snapshot_scope, collection, changed, removed, parent)
+        return len(changed), len(removed)
+
+    def refresh_snapshot(self, objtypes=None, full=False, ids_only=False):
+        """
+        param:: objtypes: object types to store, all supported ones and security
+                zones by default. NAT policies and their auto NAT rules are always stored.
+        param:: full: rewrite every item, not only those whose timestamp changed.
+        param:: ids_only: list only ids and names; new, renamed and deleted items
+                are updated, values edited in place are not.
+        Returns collection -> (written, removed).
+        """
+        if self.snapshot is None:
+            raise ValueError("No snapshot configured.")
+        objtypes = objtypes or OBJECTS_TYPE_ALLOWED + [AUTONATRULE_INTERFACE_TYPE]
+        counts = {}
+        with self.metrics.operation('snapshot_refresh'):
+            for objtype in objtypes:
+                counts[objtype] = self._refresh_collection(self._objects_uri(objtype), objtype,
+                                                           full=full, ids_only=ids_only)
+            before = self.snapshot.known(self.snapshot_scope, NATPOLICY_INDEX)
+            counts[NATPOLICY_INDEX] = self._refresh_collection(
+                self._natpolicies_uri(), NATPOLICY_INDEX, full=full, ids_only=ids_only)
+            natpolicies = self.snapshot.known(self.snapshot_scope, NATPOLICY_INDEX)
+            for natpolicy_uuid in set(before) - set(natpolicies):
+                self.snapshot.drop(self.snapshot_scope, AUTONATRULES, natpolicy_uuid)
+            written, removed = 0, 0
+            for natpolicy_uuid in natpolicies:
+                rules = self._refresh_collection(self._autonatrules_uri(natpolicy_uuid),
+                                                 AUTONATRULES, natpolicy_uuid, full=full,
+                                                 ids_only=ids_only)
+                written, removed = written + rules[0], removed + rules[1]
+            counts[AUTONATRULES] = (written, removed)
+        return counts
+
+    def get_audit_records(self, start_time, end_time=None):
+        """
+        param:: start_time: epoch seconds of the oldest record wanted.
+        Audit records (time, username, subsystem, message...) since start_time.
+        """
+        uri = "{}?starttime={}".format(self._audit_records_uri(), int(start_time))
+        if end_time is not None:
+            uri += "&endtime={}".format(int(end_time))
+        return list(self.iter_pages(uri, expanded=True))
+
+    def _change_targets(self, event):
+        """
+        Object index table and collection path of a changefeed.ChangeEvent
+        """
+        if event.collection == NATPOLICY_INDEX:
+            return NATPOLICY_INDEX, self._natpolicies_uri()
+        if event.collection == AUTONATRULES:
+            # Without the policy, the rules of every policy
+            return None, self._autonatrules_uri(event.parent) if event.parent else \
+                self._natpolicies_uri()
+        return event.collection, self._objects_uri(event.collection)
+
+    def invalidate_changes(self, events):
+        """
+        Forget what the object index and the response cache hold about the
+        collections that changed in FMC (changefeed.ChangeEvents), so the
+        next lookups fetch them again.
+        """
+        for event in events:
+            table, uri = self._change_targets(event)
+            if table:
+                self.object_index.invalidate(table)
+            if self.response_cache is not None:
+                self.response_cache.invalidate(urlparse(self._url(uri)).path)
+
+    def refresh_snapshot_changes(self, events):
+        """
+        Bring the snapshot collections that changed in FMC (changefeed.ChangeEvents)
+        up to date, each once. Returns collection -> (written, removed).
+        """
+        if self.snapshot is None:
+            raise ValueError("No snapshot configured.")
+        self.invalidate_changes(events)
+        collections = set((event.collection, event.parent) for event in events)
+        counts = {}
+        for collection, parent in sorted(collections, key=str):
+            if collection == AUTONATRULES:
+                if (collection, None) in collections and parent is not None:
+                    continue
+                natpolicies = [parent] if parent else \
+                    self.snapshot.known(self.snapshot_scope, NATPOLICY_INDEX)
+                written, removed = counts.get(AUTONATRULES, (0, 0))
+                for natpolicy_uuid in natpolicies:
+                    rules = self._refresh_collection(self._autonatrules_uri(natpolicy_uuid),
+                                                     AUTONATRULES, natpolicy_uuid)
+                    written, removed = written + rules[0], removed + rules[1]
+                counts[AUTONATRULES] = (written, removed)
+            else:
+                uri = self._natpolicies_uri() if collection == NATPOLICY_INDEX else \
+                    self._objects_uri(collection)
+                counts[collection] = self._refresh_collection(uri, collection)
+        return counts
+
+    def find_equal_objects(self, values):
+        """
+        param:: values: addresses, prefixes or ranges.
+        For each value, the host/network/range objects covering exactly the same addresses,
+        or None when the value is not an address, prefix or range.
+        The object index is used when it holds these objects with their values;
+        otherwise a few values are looked up with FMC's value filter instead
+        of listing every host, network and range.
+        """
+        indexed = all(not self.object_index.is_stale(objtype) and
+                      self.object_index.has_items(objtype) for objtype in IP_OBJECT_TYPES)
+        if self.offline or indexed or len(values) > EQUAL_OBJECTS_FILTER_MAX:
+            ip_index = ObjectIpIndex.from_handler(self)
+            return [ip_index.equal(value) for value in values]
+        return [self._filter_equal_objects(value) for value in values]
+
+    def _filter_equal_objects(self, value):
+        """
+        Objects equal to value among those whose name or value holds its
+        first address (filter=nameOrValue), one filtered listing per type
+        """
+        interval = parse_interval(value)
+        if interval is None:
+            return None
+        first = str(ipaddress.ip_address(interval[1]))
+        return [item for objtype in IP_OBJECT_TYPES
+                for item in self.iter_pages(self._objects_uri(objtype), expanded=True,
+                                            query={'filter': 'nameOrValue:{}'.format(first)})
+                if parse_interval(item.get("value") or "") == interval]
+
+    def duplicate_objects(self):
+        """
+        Groups of host/network/range objects covering the same addresses,
+        and the number of objects indexed and not parsed.
+        """
+        ip_index = ObjectIpIndex.from_handler(self)
+        return ip_index.duplicates(), len(ip_index), len(ip_index.unparsed)
+
     def create_ftdnatpolicy(self, payload):
         """
         Create NAT policy
         """
-        uri = "/api/fmc_config/v1/domain/{}/policy/ftdnatpolicies".format(self.domain_uuid)
-        url = "{}{}".format(self.baseuri, uri)
         try:
             msg = "Creating FTD NAT policy {}".format(payload["name"])
             _LOG(msg)
-            resp = requests.post(
-                url, data=json.dumps(payload),
-                headers=headers, verify=self.sslverify
-            )
-        except requests.exceptions.HTTPError as exp:
+            resp = self._request('POST', self._natpolicies_uri(), data=json.dumps(payload))
+        except requests.exceptions.RequestException as exp:
             _LOG(exp)
-            return resp.status_code, exp
-        # close connection before returning
-        self._close_connection(resp)
-        return resp.status_code, resp.json()
+            return None, exp
+        body = self._json(resp)
+        if resp.status_code == 201:
+            self.object_index.add(NATPOLICY_INDEX, body["name"], body["id"], item=body)
+        else:
+            self.object_index.invalidate(NATPOLICY_INDEX)
+        return resp.status_code, body
 
-    def create_autonatrule(self, payload):
+    def update_ftdnatpolicy(self, natpolicy_uuid, payload):
+        """
+        Replace the settings (name, description) of a NAT policy
+        """
+        payload = dict(payload, id=natpolicy_uuid)
+        payload.setdefault("type", "FTDNatPolicy")
+        try:
+            _LOG("Updating FTD NAT policy {}".format(payload["name"]))
+            resp = self._request('PUT', self._natpolicy_uri(natpolicy_uuid),
+                                 data=json.dumps(payload))
+        except requests.exceptions.RequestException as exp:
+            _LOG(exp)
+            return None, exp
+        body = self._json(resp)
+        if resp.status_code == 200:
+            self.object_index.add(NATPOLICY_INDEX, body["name"], body["id"], item=body)
+        return resp.status_code, body
+
+    def delete_ftdnatpolicy(self, natpolicy_uuid):
+        """
+        Delete a NAT policy with its rules
+        """
+        try:
+            _LOG("Deleting FTD NAT policy {}".format(natpolicy_uuid))
+            resp = self._request('DELETE', self._natpolicy_uri(natpolicy_uuid))
+        except requests.exceptions.RequestException as exp:
+            _LOG(exp)
+            return None, exp
+        # Drop the index rather than looking the name up again
+        self.object_index.invalidate(NATPOLICY_INDEX)
+        return resp.status_code, self._json(resp)
+
+    def _load_network_tables(self, names):
+        """
+        Fetch the stale network object tables, in AUTONATRULE_NETWORK_TYPES
+        order, until every name is found
+        """
+        missing = set(names)
+        for objtype in AUTONATRULE_NETWORK_TYPES:
+            if not missing:
+                return
+            if self.object_index.is_stale(objtype):
+                self.get_objects(objtype)
+            missing -= set(self.object_index.table(objtype))
+
+    def network_references(self, payloads):
+        """
+        param:: payloads: auto NAT rules (see create_autonatrule).
+        The network fields of the rules may hold the name of a host, network,
+        range or FQDN object, an address, prefix or range, or an object to
+        create if missing ({"name", "value"[, "type", "description",
+        "dnsResolution"]}). An address, prefix or range stands for an object
+        of exactly that value, found in FMC or to create (named e.g.
+        host_10.1.1.1). Hosts, networks and ranges are listed once, expanded,
+        when a rule holds a literal.
+        Returns (references, missing): name/literal -> FMC reference (with
+        the object name) of the objects given as literals or {"name", "value"}
+        that exist, and object type ->
+        [(name/literal, object payload)] of the objects to create. Names are
+        resolved from the object index.
+        """
+        ip_index = None
+        if any(literal_object(self._network_name(payload.get(field)))
+               for payload in payloads for field in AUTONATRULE_NETWORK_FIELDS):
+            # Also fills the name tables of these types
+            ip_index = ObjectIpIndex.from_handler(self)
+        self._load_network_tables(self._network_lookup_names(payloads))
+        references = {}
+        literals, specs, seen = [], [], set()
+        for payload in payloads:
+            for field in AUTONATRULE_NETWORK_FIELDS:
+                value = payload.get(field)
+                name = self._network_name(value)
+                if not name or name in seen:
+                    continue
+                seen.add(name)
+                reference = self._network_reference(value, references)
+                if reference:
+                    if isinstance(value, dict) or literal_object(name):
+                        references[name] = reference
+                elif isinstance(value, dict) and value.get("name") and value.get("value"):
+                    specs.append(value)
+                elif literal_object(name):
+                    literals.append(name)
+        created = {}
+        for name in literals:
+            objtype, value = literal_object(name)
+            equal = sorted(ip_index.equal(value),
+                           key=lambda item: item["type"] != NETWORK_TYPE_NAMES[objtype])
+            if equal:
+                references[name] = {"type": equal[0]["type"], "id": equal[0]["id"],
+                                    "name": equal[0]["name"]}
+            else:
+                created.setdefault(objtype, []).append((name, {
+                    "name": auto_object_name(objtype, value),
+                    "type": NETWORK_TYPE_NAMES[objtype],
+                    "value": value,
+                    "description": "created by automation script"}))
+        types = dict((typename.lower(), objtype)
+                     for objtype, typename in NETWORK_TYPE_NAMES.items())
+        for spec in specs:
+            literal = literal_object(spec["value"])
+            objtype = spec.get("type", "").lower() or (literal[0] if literal else "fqdns")
+            objtype = types.get(objtype, objtype)
+            object_payload = {"name": spec["name"], "type": NETWORK_TYPE_NAMES.get(objtype),
+                              "value": literal[1] if literal else spec["value"],
+                              "description": spec.get("description",
+                                                      "created by automation script")}
+            if objtype == "fqdns":
+                object_payload["dnsResolution"] = spec.get("dnsResolution", "IPV4_ONLY")
+            created.setdefault(objtype, []).append((spec["name"], object_payload))
+        return references, created
+
+    def resolve_network_references(self, payloads, provision=False):
+        """
+        param:: payloads: auto NAT rules (see create_autonatrule).
+        param:: provision: create the network objects that do not exist, with
+                one bulk request per type.
+        Returns name/literal -> FMC reference of the objects found by value
+        or created (see network_references).
+        """
+        references, missing = self.network_references(payloads)
+        if not provision:
+            return references
+        for objtype, pending in sorted(missing.items()):
+            _LOG("Creating {} missing {} for the auto NAT rules.".format(len(pending), objtype))
+            results = self.create_objects_bulk(objtype, [payload for key, payload in pending])
+            for (key, payload), (_, rcode, rval) in zip(pending, results):
+                if rcode == 201:
+                    references[key] = {"type": NETWORK_TYPE_NAMES[objtype], "id": rval["id"],
+                                       "name": payload["name"]}
+                else:
+                    _LOG("Could not create {}: {} {}".format(payload["name"], rcode, rval),
+                         "warning")
+        return references
+
+    def resolve_autonatrule(self, payload, natpolicy_uuids=None, references=None,
+                            provision=False):
+        """
+        param:: payload: auto NAT rule referencing its policy, networks and
+                security zones by name (see avi-nat --create-autonatrule).
+        param:: natpolicy_uuids: NAT policy name -> UUID mapping, fetched if not given.
+        param:: references: see resolve_network_references, called if not given.
+        param:: provision: create the network objects that do not exist.
+        Returns (natpolicy_uuid, rule, errors) where rule is a copy of the
+        payload in the format FMC REST supports and errors lists every name
+        that could not be resolved.
+        """
+        if natpolicy_uuids is None:
+            natpolicy_uuids = self.get_natpolicy_uuids()
+        if references is None:
+            references = self.resolve_network_references([payload], provision)
+        if self.object_index.is_stale(AUTONATRULE_INTERFACE_TYPE):
+            self.get_objects(AUTONATRULE_INTERFACE_TYPE)
+        return self._build_autonatrule(payload, natpolicy_uuids, references)
+
+    def analyze_autonatrules(self, natpolicy):
+        """
+        param:: natpolicy: the name of NAT policy.
+        Duplicated, conflicting and overlapping auto NAT rules of the policy
+        (see nat_analyzer.NatRuleAnalyzer.conflicts).
+        """
+        return NatRuleAnalyzer.from_handler(self, natpolicy).conflicts()
+
+    def preflight_autonatrule(self, natpolicy, rule):
+        """
+        param:: rule: resolved auto NAT rule (see resolve_autonatrule).
+        Conflicts the rule would introduce in the NAT policy.
+        """
+        values = object_values(self)
+        analyzer = NatRuleAnalyzer(self.get_autonatrules(natpolicy, expanded=True), values)
+        return analyzer.check(rule, values)
+
+    def create_autonatrule(self, payload, preflight=False, provision=False):
         """
         Create Auto NAT rule in a target NAT policy
+        param:: preflight: do not create the rule if it duplicates, conflicts
+                with or overlaps existing rules of the policy (409 and the conflicts).
+        param:: provision: create the missing network objects first (see
+                resolve_network_references).
         """
-        natpolicies = self.get_ftdnatpolicies()
-        for key, value in enumerate(natpolicies):
-            if value["name"] == payload["targetNatPolicy"]:
-                target_natpolicy_uuid = value["id"]
-                del payload["targetNatPolicy"]
-                break
-        # Reformat payload in a way FMC REST supported
-        # Note that get_objects() can/should be made dynamic instead of "hosts" - might
-        # need a new param to specify target object
-        if self.get_objects("hosts"):
-            originalNetwork_uuid = HOSTS_OBJECTS_MAPPING[payload["originalNetwork"]]
-        else:
-            return (404, "UUID of {} not found.".format(payload["originalNetwork"]))
-        if self.get_objects("hosts"):
-            translatedNetwork_uuid =  HOSTS_OBJECTS_MAPPING[payload["translatedNetwork"]]
-        else:
-            return (404, "UUID of {} not found.".format(payload["translatedNetwork"]))
-        if self.get_objects("interfaceobjects"):
-            sourceInterface_uuid = INTERFACES_OBJECTS_MAPPING[payload["sourceInterface"]]
-        else:
-            return (404, "UUID of {} not found.".format(payload["sourceInterface"]))
-        if self.get_objects("interfaceobjects"):
-            destinationInterface_uuid =  INTERFACES_OBJECTS_MAPPING[payload["destinationInterface"]]
-        else:
-            return (404, "UUID of {} not found.".format(payload["destinationInterface"]))
-        payload["originalNetwork"] = {"type": "Host", "id": originalNetwork_uuid}
-        payload["translatedNetwork"] = {"type": "Host", "id": translatedNetwork_uuid}
-        payload["sourceInterface"] = {"type": "SecurityZone", "id": sourceInterface_uuid}
-        payload["destinationInterface"] = {"type": "SecurityZone", "id": destinationInterface_uuid}
-        uri = ("/api/fmc_config/v1/domain/{domain_uuid}/policy/ftdnatpolicies/"
-               "{nat_id}/autonatrules".format(
-                   domain_uuid=self.domain_uuid,
-                   nat_id=target_natpolicy_uuid)
-            )
-        url = "{baseuri}{uri}".format(baseuri=self.baseuri, uri=uri)
+        natpolicy_uuid, rule, errors = self.resolve_autonatrule(payload, provision=provision)
+        if errors:
+            return (404, " ".join(errors))
+        if preflight:
+            conflicts = self.preflight_autonatrule(payload["targetNatPolicy"], rule)
+            if conflicts:
+                return (409, conflicts)
+        uri = self._autonatrules_uri(natpolicy_uuid)
         try:
-            resp = requests.post(
-                url, data=json.dumps(payload),
-                headers=headers, verify=self.sslverify
-            )
-        except requests.exceptions.HTTPError as exp:
+            resp = self._request('POST', uri, data=json.dumps(rule))
+        except requests.exceptions.RequestException as exp:
+            _LOG(exp)
+            return None, exp
+        return resp.status_code, self._json(resp)
+
+    def create_autonatrules_bulk(self, payloads, chunk_size=BULK_CHUNK_SIZE, skip_invalid=False,
+                                 provision=False):
+        """
+        param:: payloads: list of auto NAT rules as accepted by create_autonatrule.
+        param:: skip_invalid: still send the valid rules when some fail to resolve.
+        param:: provision: create the missing network objects of the whole batch
+                first, one bulk request per object type.
+        Policies, networks and security zones are resolved once for the whole
+        batch, then rules are grouped by target policy and sent to the bulk
+        endpoint. Nothing is sent if a rule cannot be resolved, unless
+        skip_invalid is set.
+        Returns a list of (payload, status_code, result) in input order.
+        """
+        natpolicy_uuids = self.get_natpolicy_uuids()
+        references = self.resolve_network_references(payloads, provision)
+        results = [None] * len(payloads)
+        grouped = {}
+        positions = {}
+        for position, payload in enumerate(payloads):
+            natpolicy_uuid, rule, errors = self.resolve_autonatrule(payload, natpolicy_uuids,
+                                                                    references)
+            if errors:
+                results[position] = (payload, 404, " ".join(errors))
+                continue
+            grouped.setdefault(natpolicy_uuid, []).append(rule)
+            positions[id(rule)] = (position, payload)
+        invalid = len(payloads) - len(positions)
+        if invalid and not skip_invalid:
+            _LOG("{} rules could not be resolved. Nothing was sent.".format(invalid), "warning")
+            for position, payload in positions.values():
+                results[position] = (payload, None, "Not sent - batch has unresolved rules.")
+            return results
+        for natpolicy_uuid, rules in grouped.items():
+            uri = self._autonatrules_uri(natpolicy_uuid)
+            posted = []
+            for start in range(0, len(rules), chunk_size):
+                self._post_bulk_chunk(uri, rules[start:start + chunk_size], posted,
+                                      "auto NAT rules")
+            for rule, rcode, rval in posted:
+                position, payload = positions[id(rule)]
+                results[position] = (payload, rcode, rval)
+        return results
+
+    def update_autonatrule(self, natpolicy_uuid, rule_uuid, rule):
+        """
+        param:: rule: auto NAT rule in the format FMC REST supports
+                (see resolve_autonatrule).
+        Replace an existing auto NAT rule.
+        """
+        rule = dict(rule, id=rule_uuid)
+        rule.setdefault("type", "FTDAutoNatRule")
+        try:
+            _LOG("Updating auto NAT rule {}".format(rule_uuid))
+            resp = self._request('PUT', self._autonatrule_uri(natpolicy_uuid, rule_uuid),
+                                 data=json.dumps(rule))
+        except requests.exceptions.RequestException as exp:
+            _LOG(exp)
+            return None, exp
+        return resp.status_code, self._json(resp)
+
+    def delete_autonatrule(self, natpolicy_uuid, rule_uuid):
+        """
+        Delete an auto NAT rule from a NAT policy
+        """
+        try:
+            _LOG("Deleting auto NAT rule {}".format(rule_uuid))
+            resp = self._request('DELETE', self._autonatrule_uri(natpolicy_uuid, rule_uuid))
+        except requests.exceptions.RequestException as exp:
             _LOG(exp)
-            return resp.status_code, exp
-        self._close_connection(resp)
-        return resp.status_code, resp.json()
+            return None, exp
+        return resp.status_code, self._json(resp)
 
     def create_object(self, payload):
         """
         param:: payload: dictionary of object configuration
         The real object type in FMC.
         """
-        # Quit if it's not supported object type
         if not payload["type"].lower() in OBJECTS_TYPE_ALLOWED:
-            _LOG("{} is not supported object type.".format(payload["type"]))
-            sys.exit(1)
-        url = "{baseuri}{uri}{obj_type}".format(
-                baseuri=self.baseuri,
-                uri="/api/fmc_config/v1/domain/{}/object/".format(self.domain_uuid),
-                obj_type=payload["type"]
-            )
+            raise UnsupportedObjectTypeError(
+                "{} is not supported object type.".format(payload["type"]))
+        uri = self._objects_uri(payload["type"])
         try:
             msg = "Creating {name} of type={obj_type} with value={value}".format(
                 name=payload["name"],
@@ -296,13 +1344,156 @@ class FmcApiHandler(object):
                 value=payload["value"]
             )
             _LOG(msg)
-            resp = requests.post(
-                url, data=json.dumps(payload),
-                headers=headers, verify=self.sslverify
-            )
-        except requests.exceptions.HTTPError as exp:
+            resp = self._request('POST', uri, data=json.dumps(payload))
+        except requests.exceptions.RequestException as exp:
+            _LOG(exp)
+            return None, exp
+        if resp.status_code == 201:
+            created = self._json(resp)
+            self.object_index.add(payload["type"].lower(), created["name"], created["id"],
+                                  item=created)
+            return resp.status_code, created
+        return resp.status_code, self._json(resp)
+
+    def create_objects_bulk(self, objtype, payloads, chunk_size=BULK_CHUNK_SIZE):
+        """
+        param:: objtype: hosts, networks, ranges or fqdns.
+        param:: payloads: list of object configurations of that type.
+        Create objects through the ?bulk=true endpoint, chunk_size per request.
+        Returns a list of (payload, status_code, result) in input order.
+        """
+        objtype = objtype.lower()
+        if not objtype in OBJECTS_TYPE_ALLOWED:
+            raise UnsupportedObjectTypeError("{} is not supported object type.".format(objtype))
+        uri = self._objects_uri(objtype)
+        results = []
+        for start in range(0, len(payloads), chunk_size):
+            self._post_bulk_chunk(uri, payloads[start:start + chunk_size], results, objtype)
+        for payload, rcode, rval in results:
+            if rcode == 201:
+                self.object_index.add(objtype, rval["name"], rval["id"], item=rval)
+        return results
+
+    def update_object(self, objtype, object_uuid, payload):
+        """
+        param:: payload: full object configuration (name, value...).
+        Replace an existing object of objtype.
+        """
+        objtype = objtype.lower()
+        payload = dict(payload, id=object_uuid)
+        try:
+            _LOG("Updating {} of type={}".format(payload["name"], objtype))
+            resp = self._request('PUT', self._object_uri(objtype, object_uuid),
+                                 data=json.dumps(payload))
+        except requests.exceptions.RequestException as exp:
+            _LOG(exp)
+            return None, exp
+        body = self._json(resp)
+        if resp.status_code == 200:
+            self.object_index.add(objtype, body["name"], body["id"], item=body)
+        return resp.status_code, body
+
+    def delete_object(self, objtype, object_uuid):
+        """
+        Delete an object of objtype. FMC refuses to delete objects still in use.
+        """
+        objtype = objtype.lower()
+        try:
+            _LOG("Deleting {} of type={}".format(object_uuid, objtype))
+            resp = self._request('DELETE', self._object_uri(objtype, object_uuid))
+        except requests.exceptions.RequestException as exp:
+            _LOG(exp)
+            return None, exp
+        body = self._json(resp)
+        if resp.status_code == 200:
+            self.object_index.remove(objtype, object_uuid)
+        return resp.status_code, body
+
+    def get_deployable_devices(self):
+        """
+        Devices with configuration changes not deployed yet, each with its
+        device reference and the version a deployment request must carry.
+        """
+        return list(self.iter_pages(self._deployable_devices_uri(), expanded=True))
+
+    def get_policy_devices(self, policy_uuids):
+        """
+        param:: policy_uuids: UUIDs of policies (e.g. NAT policies).
+        Policy UUID -> UUIDs of the devices it is assigned to, fetched concurrently.
+        Unassigned policies map to an empty list.
+        """
+        policy_uuids = list(policy_uuids)
+        assignments = self._get_concurrently([self._policy_assignment_uri(policy_uuid)
+                                              for policy_uuid in policy_uuids])
+        return dict((policy_uuid, [target["id"] for target in (body or {}).get("targets", [])])
+                    for policy_uuid, body in zip(policy_uuids, assignments))
+
+    def create_deployment(self, device_uuids, version, force=False):
+        """
+        param:: version: version of the deployable devices (see get_deployable_devices).
+        Request one deployment to several devices. FMC answers 202 and the
+        task to poll in metadata.task.
+        """
+        payload = {
+            "type": "DeploymentRequest",
+            "version": version,
+            "forceDeploy": force,
+            "ignoreWarning": True,
+            "deviceList": list(device_uuids)
+        }
+        try:
+            _LOG("Deploying to {} devices".format(len(payload["deviceList"])))
+            resp = self._request('POST', self._deployment_requests_uri(),
+                                 data=json.dumps(payload))
+        except requests.exceptions.RequestException as exp:
+            _LOG(exp)
+            return None, exp
+        return resp.status_code, self._json(resp)
+
+    def get_task_status(self, task_id):
+        """
+        Status of a background task such as a deployment
+        """
+        try:
+            resp = self._request('GET', self._task_status_uri(task_id))
+        except requests.exceptions.RequestException as exp:
+            _LOG(exp, "warning")
+            return None, exp
+        return resp.status_code, self._json(resp)
+
+    def _post_bulk_chunk(self, uri, chunk, results, label):
+        """
+        POST a chunk of payloads to a ?bulk=true endpoint and append one
+        (payload, status_code, result) per payload to results.
+        FMC rejects a bulk request as a whole when one item is invalid, so a
+        chunk failing validation (400/422) is split in halves until the
+        offending items are isolated and each payload gets its own result.
+        Any other failure (401, 5xx...) is the result of the whole chunk.
+        """
+        if len(chunk) == 1:
+            try:
+                resp = self._request('POST', uri, data=json.dumps(chunk[0]))
+            except requests.exceptions.RequestException as exp:
+                _LOG(exp)
+                results.append((chunk[0], None, exp))
+                return
+            results.append((chunk[0], resp.status_code, self._json(resp)))
+            return
+        _LOG("Creating {} {} in bulk".format(len(chunk), label))
+        try:
+            resp = self._request('POST', uri, params={'bulk': 'true'}, data=json.dumps(chunk))
+        except requests.exceptions.RequestException as exp:
             _LOG(exp)
-            return resp.status_code, exp
-        # close connection before returning
-        self._close_connection(resp)
-        return resp.status_code, resp.json()
+            results.extend((payload, None, exp) for payload in chunk)
+            return
+        if resp.status_code != 201:
+            _LOG("Bulk request failed with {}: {}".format(resp.status_code, resp.text),
+                 "warning")
+            if resp.status_code not in BULK_VALIDATION_STATUS_CODES:
+                results.extend((payload, resp.status_code, resp.text) for payload in chunk)
+                return
+            half = len(chunk) // 2
+            self._post_bulk_chunk(uri, chunk[:half], results, label)
+            self._post_bulk_chunk(uri, chunk[half:], results, label)
+            return
+        results.extend(self._bulk_results(chunk, resp.status_code, self._json(resp)))
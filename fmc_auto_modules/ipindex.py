@@ -0,0 +1,185 @@
+import ipaddress
+from bisect import bisect_left, bisect_right
+
+# Object types whose value is an address, a prefix or an address range
+IP_OBJECT_TYPES = ('hosts', 'networks', 'ranges')
+
+
+def parse_interval(value):
+    """
+    param:: value: address, prefix (a.b.c.d/nn) or range (first-last), IPv4 or IPv6.
+    Returns (version, start, end) as integers, None if value is not one of them.
+    """
+    try:
+        value = value.strip()
+        if '-' in value:
+            first, last = [ipaddress.ip_address(part.strip()) for part in value.split('-', 1)]
+            if first.version != last.version or first > last:
+                return None
+            return first.version, int(first), int(last)
+        if '/' not in value:
+            address = ipaddress.ip_address(value)
+            return address.version, int(address), int(address)
+        network = ipaddress.ip_network(value, strict=False)
+    except (AttributeError, ValueError):
+        return None
+    return network.version, int(network.network_address), int(network.broadcast_address)
+
+
+def load_ip_objects(fmc, objtypes=IP_OBJECT_TYPES):
+    """
+    Host, network and range objects of a handler with their values, fetched
+    expanded (as compact models) unless the object index already holds them.
+    """
+    objects = []
+    for objtype in objtypes:
+        if fmc.object_index.is_stale(objtype) or not fmc.object_index.has_items(objtype):
+            fmc.get_objects(objtype, expanded=True, models=True)
+        objects.extend(fmc.object_index.items(objtype).values())
+    return objects
+
+
+class IntervalIndex(object):
+    """
+    Static set of integer intervals sorted by start, with a max-end tree
+    over them. Equal/containing/overlapping queries take O(log n + k).
+    """
+    def __init__(self, intervals):
+        """
+        param:: intervals: iterable of (start, end, item).
+        """
+        intervals = sorted(intervals, key=lambda interval: (interval[0], interval[1]))
+        self.starts = [interval[0] for interval in intervals]
+        self.ends = [interval[1] for interval in intervals]
+        self.items = [interval[2] for interval in intervals]
+        self.size = 1
+        while self.size < len(intervals):
+            self.size *= 2
+        # tree[node] is the largest end below node, leaves start at self.size
+        self.tree = [-1] * (2 * self.size)
+        self.tree[self.size:self.size + len(self.ends)] = self.ends
+        for node in range(self.size - 1, 0, -1):
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _ending_after(self, count, bound):
+        """
+        Positions among the first count intervals whose end is >= bound
+        """
+        found = []
+        stack = [(1, 0, self.size)]
+        while stack:
+            node, low, high = stack.pop()
+            if low >= count or self.tree[node] < bound:
+                continue
+            if node >= self.size:
+                found.append(low)
+                continue
+            middle = (low + high) // 2
+            stack.append((2 * node + 1, middle, high))
+            stack.append((2 * node, low, middle))
+        return found
+
+    def containing(self, start, end):
+        """
+        Items whose interval contains [start, end]
+        """
+        count = bisect_right(self.starts, start)
+        return [self.items[pos] for pos in self._ending_after(count, end)]
+
+    def overlapping(self, start, end):
+        """
+        Items whose interval shares at least one address with [start, end]
+        """
+        count = bisect_right(self.starts, end)
+        return [self.items[pos] for pos in self._ending_after(count, start)]
+
+    def equal(self, start, end):
+        """
+        Items whose interval is exactly [start, end]
+        """
+        return [self.items[pos] for pos in range(bisect_left(self.starts, start),
+                                                 bisect_right(self.starts, start))
+                if self.ends[pos] == end]
+
+
+class ObjectIpIndex(object):
+    """
+    Interval index of host, network and range objects, one per IP version,
+    to find existing objects equivalent to, containing or overlapping a value.
+    """
+    def __init__(self, objects):
+        """
+        param:: objects: FMC objects with at least name, type and value.
+        Objects whose value cannot be parsed are listed in self.unparsed.
+        """
+        intervals = {4: [], 6: []}
+        self.unparsed = []
+        for item in objects:
+            interval = parse_interval(item.get('value'))
+            if interval is None:
+                self.unparsed.append(item)
+                continue
+            version, start, end = interval
+            intervals[version].append((start, end, item))
+        self.indexes = dict((version, IntervalIndex(items))
+                            for version, items in intervals.items())
+
+    @classmethod
+    def from_handler(cls, fmc, objtypes=IP_OBJECT_TYPES):
+        """
+        Build the index from the objects of a handler (fetched with values
+        unless the object index already holds them).
+        """
+        return cls(load_ip_objects(fmc, objtypes))
+
+    def __len__(self):
+        return sum(len(index) for index in self.indexes.values())
+
+    def _query(self, method, value):
+        interval = parse_interval(value)
+        if interval is None:
+            return None
+        version, start, end = interval
+        return getattr(self.indexes[version], method)(start, end)
+
+    def equal(self, value):
+        """
+        Objects covering exactly the addresses of value, None when value is
+        not an address, prefix or range (likewise for the other lookups)
+        """
+        return self._query('equal', value)
+
+    def containing(self, value):
+        """
+        Objects covering every address of value
+        """
+        return self._query('containing', value)
+
+    def overlapping(self, value):
+        """
+        Objects covering at least one address of value
+        """
+        return self._query('overlapping', value)
+
+    def duplicates(self):
+        """
+        Groups of two or more objects covering exactly the same addresses,
+        as a list of lists ordered by address.
+        """
+        groups = []
+        for version in sorted(self.indexes):
+            index = self.indexes[version]
+            group = []
+            for pos in range(len(index)):
+                if group and (index.starts[pos], index.ends[pos]) != \
+                        (index.starts[group[0]], index.ends[group[0]]):
+                    if len(group) > 1:
+                        groups.append([index.items[member] for member in group])
+                    group = []
+                group.append(pos)
+            if len(group) > 1:
+                groups.append([index.items[member] for member in group])
+        return groups
@@ -0,0 +1,249 @@
+import hashlib
+import json
+import os
+import time
+
+from fmc_auto_modules.exceptions import FmcError
+from fmc_auto_modules.fmc_baseapi import (
+    BULK_CHUNK_SIZE,
+    _LOG
+)
+from fmc_auto_modules.ratelimit import backoff_delay
+
+# States of a batch item
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+# Extra rounds given to the items that failed with a transient error
+DEFAULT_BATCH_RETRIES = 3
+RETRIABLE_STATUS_CODES = (401, 408, 429, 500, 502, 503, 504)
+
+# Fields telling whether an existing auto NAT rule is the one a payload creates
+RULE_IDENTITY_REFERENCES = ("originalNetwork", "translatedNetwork", "sourceInterface",
+                            "destinationInterface")
+RULE_IDENTITY_FIELDS = ("serviceProtocol", "originalPort", "translatedPort")
+
+
+def is_retriable(status_code, result):
+    """
+    True if an item that failed with this (status_code, result) may succeed
+    when sent again. status_code is None when the request itself failed.
+    """
+    if status_code is None:
+        return isinstance(result, Exception) and getattr(result, 'retriable', True)
+    return status_code in RETRIABLE_STATUS_CODES
+
+
+class BatchJournal(object):
+    """
+    Write-ahead journal of batch runs, one JSON record per line.
+    Items are recorded as pending before they are sent and as done (with
+    the UUID FMC returned) or failed once answered, so a rerun knows what
+    was completed without asking FMC. The last record of an item wins and
+    a line torn by a crash is ignored.
+    """
+    def __init__(self, path, scope=''):
+        """
+        param:: scope: FMC host and domain the batch runs against, part of the
+                item keys so a journal is not replayed against another FMC.
+        """
+        self.path = path
+        self.scope = scope
+        self.entries = {}
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname, mode=0o700, exist_ok=True)
+        if os.path.exists(path):
+            self._load()
+        self.fd = open(path, 'a')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.fd.close()
+
+    def _load(self):
+        with open(self.path) as fd:
+            for line in fd:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self.entries[record['key']] = record
+
+    def key(self, kind, payload):
+        """
+        Key of an item: digest of the scope, its kind and its payload
+        """
+        document = json.dumps([self.scope, kind, payload], sort_keys=True, default=str)
+        return hashlib.sha256(document.encode()).hexdigest()
+
+    def entry(self, kind, payload):
+        """
+        Last record of an item, None if it was never journaled
+        """
+        return self.entries.get(self.key(kind, payload))
+
+    def completed(self, kind, payload):
+        entry = self.entry(kind, payload)
+        return entry is not None and entry['state'] == DONE
+
+    def record(self, records):
+        """
+        Append records and flush them to disk before returning
+        """
+        if not records:
+            return
+        self.fd.write(''.join(json.dumps(record, default=str) + '\n' for record in records))
+        self.fd.flush()
+        os.fsync(self.fd.fileno())
+        for record in records:
+            self.entries[record['key']] = record
+
+    def counts(self):
+        """
+        State -> number of items
+        """
+        counts = {}
+        for record in self.entries.values():
+            counts[record['state']] = counts.get(record['state'], 0) + 1
+        return counts
+
+
+def _record(key, kind, payload, state, attempts, status_code=None, result=None):
+    record = {
+        'key': key,
+        'kind': kind,
+        'name': payload.get('name'),
+        'state': state,
+        'attempts': attempts,
+        'status': status_code,
+        'at': time.time(),
+    }
+    if state == DONE:
+        record['uuid'] = result.get('id') if isinstance(result, dict) else result
+    elif state == FAILED:
+        record['error'] = str(result)
+    return record
+
+
+def run_batch(journal, kind, payloads, send, lookup=None, chunk_size=BULK_CHUNK_SIZE,
+              retries=DEFAULT_BATCH_RETRIES):
+    """
+    param:: kind: object type or 'autonatrule', part of the item keys.
+    param:: send: callable(payloads) returning one (payload, status_code, result)
+            per payload in order, e.g. a bound create_objects_bulk.
+    param:: lookup: callable(payload) returning the UUID of the item if it
+            already exists in FMC. Asked for the items a previous run left
+            pending (sent, answer unknown) instead of creating them twice.
+    Items the journal has as done are skipped without contacting FMC. The
+    others are sent chunk_size at a time and those failing with a transient
+    error are sent again with backoff, up to retries more times. Failed items
+    are retried by the next run.
+    Returns a list of (payload, status_code, result) in input order; skipped
+    items get their journaled status and {'id', 'name', 'journaled'} as result.
+    """
+    results = [None] * len(payloads)
+    positions = {}
+    for position, payload in enumerate(payloads):
+        positions.setdefault(journal.key(kind, payload), []).append(position)
+
+    def settle(key, status_code, result):
+        for position in positions[key]:
+            results[position] = (payloads[position], status_code, result)
+
+    todo = []
+    attempts = {}
+    resolved = []
+    for key, keyed in positions.items():
+        entry = journal.entries.get(key)
+        attempts[key] = entry['attempts'] if entry else 0
+        payload = payloads[keyed[0]]
+        if entry and entry['state'] == PENDING and lookup is not None:
+            uuid = lookup(payload)
+            if uuid:
+                _LOG("{} was created by an interrupted run.".format(payload.get('name', key)))
+                entry = _record(key, kind, payload, DONE, attempts[key], 200, uuid)
+                resolved.append(entry)
+        if entry and entry['state'] == DONE:
+            settle(key, entry['status'], {'id': entry['uuid'], 'name': entry['name'],
+                                          'journaled': True})
+        else:
+            todo.append(key)
+    journal.record(resolved)
+    if len(todo) < len(positions):
+        _LOG("{} {} items already done according to the journal.".format(
+            len(positions) - len(todo), kind))
+    for attempt in range(retries + 1):
+        retry = []
+        for start in range(0, len(todo), chunk_size):
+            chunk = todo[start:start + chunk_size]
+            for key in chunk:
+                attempts[key] += 1
+            journal.record([_record(key, kind, payloads[positions[key][0]], PENDING,
+                                    attempts[key]) for key in chunk])
+            try:
+                answers = send([payloads[positions[key][0]] for key in chunk])
+            except FmcError as exp:
+                if not exp.retriable:
+                    journal.record([_record(key, kind, payloads[positions[key][0]], FAILED,
+                                            attempts[key], None, exp) for key in chunk])
+                    raise
+                answers = [(payloads[positions[key][0]], None, exp) for key in chunk]
+            records = []
+            for key, (payload, status_code, result) in zip(chunk, answers):
+                settle(key, status_code, result)
+                if status_code in (200, 201):
+                    records.append(_record(key, kind, payload, DONE, attempts[key],
+                                           status_code, result))
+                    continue
+                records.append(_record(key, kind, payload, FAILED, attempts[key],
+                                       status_code, result))
+                if is_retriable(status_code, result):
+                    retry.append(key)
+            journal.record(records)
+        if not retry or attempt == retries:
+            break
+        delay = backoff_delay(attempt)
+        _LOG("Retrying {} {} items in {:.1f}s.".format(len(retry), kind, delay), "warning")
+        time.sleep(delay)
+        todo = retry
+    return results
+
+
+def object_lookup(fmc):
+    """
+    lookup of run_batch for objects: UUID of the object of that name
+    """
+    def lookup(payload):
+        return fmc.lookup_object_uuid(payload["type"].lower(), payload["name"])
+    return lookup
+
+
+def autonatrule_lookup(fmc):
+    """
+    lookup of run_batch for auto NAT rules: UUID of a rule of the target
+    policy with the same networks, interfaces, protocol and ports.
+    The rules of a policy are fetched once.
+    """
+    rules = {}
+
+    def identity(rule):
+        return tuple((rule.get(field) or {}).get("id") for field in RULE_IDENTITY_REFERENCES) + \
+            tuple(rule.get(field) for field in RULE_IDENTITY_FIELDS)
+
+    def lookup(payload):
+        natpolicy_uuid, rule, errors = fmc.resolve_autonatrule(payload)
+        if errors:
+            return None
+        if natpolicy_uuid not in rules:
+            rules[natpolicy_uuid] = dict(
+                (identity(existing), existing["id"])
+                for existing in fmc.get_autonatrules(payload["targetNatPolicy"], expanded=True))
+        return rules[natpolicy_uuid].get(identity(rule))
+    return lookup
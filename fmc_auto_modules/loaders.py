@@ -0,0 +1,77 @@
+import csv
+import json
+import os
+
+
+def _load_csv(path):
+    with open(path, newline='') as fd:
+        for row in csv.DictReader(fd):
+            # Drop empty cells so optional columns fall back to defaults
+            yield dict((key, value) for key, value in row.items() if value not in (None, ''))
+
+
+def _load_jsonl(path):
+    with open(path) as fd:
+        for line in fd:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def _load_yaml(path):
+    try:
+        import yaml
+    except ImportError:
+        raise ValueError("PyYAML is required to read {} - "
+                         "pip install fmc_auto_modules[yaml]".format(path))
+    with open(path) as fd:
+        data = yaml.safe_load(fd) or []
+    if isinstance(data, dict):
+        raise ValueError("{} must contain a list of rows.".format(path))
+    for row in data:
+        yield row
+
+
+LOADERS = {
+    '.csv': _load_csv,
+    '.jsonl': _load_jsonl,
+    '.ndjson': _load_jsonl,
+    '.yaml': _load_yaml,
+    '.yml': _load_yaml,
+}
+
+
+def load_rows(path):
+    """
+    param:: path: CSV, JSONL/NDJSON or YAML file.
+    Return the rows of the file as a list of dictionaries.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in LOADERS:
+        raise ValueError("Unsupported file type {} - expected one of {}".format(
+            ext, ", ".join(sorted(LOADERS))))
+    return list(LOADERS[ext](path))
+
+
+def load_document(path):
+    """
+    param:: path: JSON or YAML file holding a single mapping.
+    Return the mapping, e.g. a desired state for avi-sync.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.json':
+        with open(path) as fd:
+            data = json.load(fd)
+    elif ext in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("PyYAML is required to read {} - "
+                             "pip install fmc_auto_modules[yaml]".format(path))
+        with open(path) as fd:
+            data = yaml.safe_load(fd) or {}
+    else:
+        raise ValueError("Unsupported file type {} - expected .json, .yaml or .yml".format(ext))
+    if not isinstance(data, dict):
+        raise ValueError("{} must contain a mapping.".format(path))
+    return data
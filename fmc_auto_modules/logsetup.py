@@ -0,0 +1,101 @@
+import atexit
+import logging
+import os
+import queue
+import sys
+import threading
+from logging.handlers import (
+    QueueHandler,
+    QueueListener
+)
+
+# Destination and level used unless configure_logging says otherwise
+DEFAULT_LOGFILE = os.environ.get('FMC_LOG_FILE', '/var/log/fmc_automation.log')
+DEFAULT_LOG_LEVEL = os.environ.get('FMC_LOG_LEVEL', 'debug')
+LOGGER_NAME = 'fmc_automation'
+LOG_FORMAT = '%(asctime)s %(levelname)-8s %(message)s'
+LOG_DATEFMT = '%Y-%m-%d %H:%M:%S'
+LOG_LEVELS = ('debug', 'info', 'warning', 'error')
+
+_lock = threading.Lock()
+_logger = None
+_listener = None
+
+
+class _QueueHandler(QueueHandler):
+    """
+    Hands the records over as they are: the listener thread formats them,
+    and no other process reads the queue.
+    """
+    def prepare(self, record):
+        return record
+
+
+def configure_logging(logfile=DEFAULT_LOGFILE, level=DEFAULT_LOG_LEVEL, console=True,
+                      console_stream=None):
+    """
+    param:: logfile: file the records are appended to, None for none.
+    param:: level: lowest level logged (debug, info, warning, error).
+    param:: console: also print the messages, on console_stream (stdout by default).
+    Records are put on a queue and written by a background thread, so logging
+    does not wait for the console or the disk. Configures the logger once;
+    later calls replace the destinations.
+    """
+    global _logger, _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+        handlers = []
+        if console:
+            console_handler = logging.StreamHandler(console_stream or sys.stdout)
+            console_handler.setFormatter(logging.Formatter('%(message)s'))
+            handlers.append(console_handler)
+        if logfile:
+            try:
+                file_handler = logging.FileHandler(logfile)
+            except (IOError, OSError) as exp:
+                sys.stderr.write("Not logging to {}: {}\n".format(logfile, exp))
+            else:
+                file_handler.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATEFMT))
+                handlers.append(file_handler)
+        records = queue.Queue()
+        logger = logging.getLogger(LOGGER_NAME)
+        logger.handlers = [_QueueHandler(records)]
+        logger.setLevel(getattr(logging, level.upper()))
+        logger.propagate = False
+        _listener = QueueListener(records, *handlers)
+        _listener.start()
+        if _logger is None:
+            atexit.register(shutdown_logging)
+        _logger = logger
+        return logger
+
+
+def get_logger(logfile=None):
+    """
+    The logger, configured with the defaults (or logfile) on first use
+    """
+    if _logger is None:
+        configure_logging(logfile or DEFAULT_LOGFILE)
+    return _logger
+
+
+def flush_logging():
+    """
+    Wait until the queued records are written, e.g. before printing to
+    the same console.
+    """
+    listener = _listener
+    if listener is not None:
+        listener.queue.join()
+
+
+def shutdown_logging():
+    """
+    Write the queued records and stop the background thread
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
@@ -0,0 +1,199 @@
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+UUID_RE = re.compile(r'/[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-'
+                     r'[0-9a-fA-F]{12}(?=/|$)')
+DOMAIN_RE = re.compile(r'/domain/[^/]+')
+
+
+def endpoint_template(url):
+    """
+    Endpoint of a request url with ids replaced by placeholders, e.g.
+    /api/fmc_config/v1/domain/{domain}/policy/ftdnatpolicies/{id}/autonatrules
+    """
+    path = urlparse(url).path
+    path = DOMAIN_RE.sub('/domain/{domain}', path)
+    return UUID_RE.sub('/{id}', path)
+
+
+class EndpointStats(object):
+    """
+    Counters of one endpoint template
+    """
+    def __init__(self):
+        self.count = 0
+        self.statuses = {}
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.parse_count = 0
+        self.parse_time = 0.0
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'statuses': dict(self.statuses),
+            'latency_sum': round(self.latency_sum, 6),
+            'latency_buckets': dict(zip([str(b) for b in LATENCY_BUCKETS] + ['+Inf'],
+                                        self.buckets)),
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'parse_count': self.parse_count,
+            'parse_time': round(self.parse_time, 6),
+        }
+
+
+class ApiMetrics(object):
+    """
+    Per-endpoint request statistics and timings of named operations
+    (token generation, object index refreshes...) of an API handler.
+    Register it with handler.add_request_hook(metrics.record_request).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = {}
+        self.operations = {}
+
+    def _endpoint(self, method, template):
+        key = '{} {}'.format(method, template)
+        if key not in self.endpoints:
+            self.endpoints[key] = EndpointStats()
+        return self.endpoints[key]
+
+    def record_request(self, method, url, status, latency, bytes_out, bytes_in):
+        """
+        Request hook: status is None when no response was received.
+        """
+        with self._lock:
+            stats = self._endpoint(method, endpoint_template(url))
+            stats.count += 1
+            status = str(status) if status is not None else 'error'
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.latency_sum += latency
+            for position, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    stats.buckets[position] += 1
+                    break
+            else:
+                stats.buckets[-1] += 1
+            stats.bytes_out += bytes_out
+            stats.bytes_in += bytes_in
+
+    def record_parse(self, method, url, seconds):
+        """
+        Time spent decoding a JSON response body
+        """
+        with self._lock:
+            stats = self._endpoint(method, endpoint_template(url))
+            stats.parse_count += 1
+            stats.parse_time += seconds
+
+    @contextmanager
+    def operation(self, name):
+        """
+        Count and time a named operation
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                stats = self.operations.setdefault(name, {'count': 0, 'time': 0.0})
+                stats['count'] += 1
+                stats['time'] += elapsed
+
+    def snapshot(self):
+        """
+        All collected statistics as a JSON-serializable dictionary
+        """
+        with self._lock:
+            return {
+                'endpoints': dict((key, stats.as_dict())
+                                  for key, stats in self.endpoints.items()),
+                'operations': dict((key, {'count': stats['count'],
+                                          'time': round(stats['time'], 6)})
+                                   for key, stats in self.operations.items()),
+            }
+
+    def summary(self):
+        """
+        Human readable table of the collected statistics
+        """
+        snapshot = self.snapshot()
+        lines = ["{:<90} {:>6} {:>9} {:>9} {:>11} {:>11} {:<}".format(
+            "endpoint", "count", "avg ms", "parse ms", "bytes in", "bytes out", "statuses")]
+        for key, stats in sorted(snapshot['endpoints'].items()):
+            lines.append("{:<90} {:>6} {:>9.1f} {:>9.1f} {:>11} {:>11} {:<}".format(
+                key, stats['count'],
+                1000 * stats['latency_sum'] / stats['count'] if stats['count'] else 0,
+                1000 * stats['parse_time'],
+                stats['bytes_in'], stats['bytes_out'],
+                " ".join("{}={}".format(code, count)
+                         for code, count in sorted(stats['statuses'].items()))))
+        for key, stats in sorted(snapshot['operations'].items()):
+            lines.append("operation {:<80} {:>6} {:>9.1f}".format(
+                key, stats['count'], 1000 * stats['time'] / stats['count']))
+        return "\n".join(lines)
+
+    def to_prometheus(self):
+        """
+        Statistics in the Prometheus text exposition format (textfile collector)
+        """
+        snapshot = self.snapshot()
+        families = [
+            ('fmc_api_requests_total', 'counter'),
+            ('fmc_api_request_duration_seconds', 'histogram'),
+            ('fmc_api_bytes_in_total', 'counter'),
+            ('fmc_api_bytes_out_total', 'counter'),
+            ('fmc_api_json_parse_seconds_total', 'counter'),
+            ('fmc_api_operations_total', 'counter'),
+            ('fmc_api_operation_seconds_total', 'counter'),
+        ]
+        samples = dict((name, []) for name, kind in families)
+        for key, stats in sorted(snapshot['endpoints'].items()):
+            method, template = key.split(' ', 1)
+            labels = 'method="{}",endpoint="{}"'.format(method, template)
+            for status, count in sorted(stats['statuses'].items()):
+                samples['fmc_api_requests_total'].append(
+                    '{{{},status="{}"}} {}'.format(labels, status, count))
+            histogram = samples['fmc_api_request_duration_seconds']
+            cumulative = 0
+            for bound, count in stats['latency_buckets'].items():
+                cumulative += count
+                histogram.append('_bucket{{{},le="{}"}} {}'.format(labels, bound, cumulative))
+            histogram.append('_sum{{{}}} {}'.format(labels, stats['latency_sum']))
+            histogram.append('_count{{{}}} {}'.format(labels, stats['count']))
+            samples['fmc_api_bytes_in_total'].append('{{{}}} {}'.format(labels, stats['bytes_in']))
+            samples['fmc_api_bytes_out_total'].append(
+                '{{{}}} {}'.format(labels, stats['bytes_out']))
+            samples['fmc_api_json_parse_seconds_total'].append(
+                '{{{}}} {}'.format(labels, stats['parse_time']))
+        for name, stats in sorted(snapshot['operations'].items()):
+            samples['fmc_api_operations_total'].append(
+                '{{operation="{}"}} {}'.format(name, stats['count']))
+            samples['fmc_api_operation_seconds_total'].append(
+                '{{operation="{}"}} {}'.format(name, stats['time']))
+        lines = []
+        for name, kind in families:
+            lines.append('# TYPE {} {}'.format(name, kind))
+            lines.extend(name + sample for sample in samples[name])
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        Dump the statistics to a file, Prometheus format for *.prom and JSON otherwise
+        """
+        with open(path, 'w') as fd:
+            if path.endswith('.prom'):
+                fd.write(self.to_prometheus())
+            else:
+                json.dump(self.snapshot(), fd, indent=2)
@@ -0,0 +1,628 @@
+"""
+Local stand-in for the FMC REST API endpoints used by FmcApiHandler, for
+benchmarks and development without a live FMC:
+
+    with MockFmcServer(dataset_size=50000, latency=0.05) as fmc:
+        handler = FmcApiHandler(fmc.address, 'admin', 'admin', scheme='http')
+
+or from a shell: python -m fmc_auto_modules.mockfmc --port 8080
+"""
+import argparse
+import base64
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlparse
+
+DOMAIN_NAME = 'Global'
+DOMAIN_UUID = 'e276abec-e0f2-11e3-8169-6d9ed49b625f'
+SERVER_VERSION = '6.6.0 (build 90)'
+MAX_PAGE_SIZE = 1000
+DEFAULT_PAGE_SIZE = 25
+
+# FMC "type" of each object listing
+OBJECT_TYPES = OrderedDict([
+    ('hosts', 'Host'),
+    ('networks', 'Network'),
+    ('ranges', 'Range'),
+    ('fqdns', 'FQDN'),
+    ('interfaceobjects', 'SecurityZone'),
+])
+
+# Fields of an auto NAT rule referencing objects
+RULE_REFERENCES = ('originalNetwork', 'translatedNetwork', 'sourceInterface',
+                   'destinationInterface')
+
+# Not part of FMC: request counters of the mock itself
+STATS_PATH = '/_mock/stats'
+
+ROUTES = [
+    ('token', re.compile(r'^/api/fmc_platform/v1/auth/generatetoken$')),
+    ('refresh', re.compile(r'^/api/fmc_platform/v1/auth/refreshtoken$')),
+    ('version', re.compile(r'^/api/fmc_platform/v1/info/serverversion$')),
+    ('autonatrule', re.compile(
+        r'^/api/fmc_config/v1/domain/(?P<domain>[^/]+)/policy/ftdnatpolicies/'
+        r'(?P<policy>[^/]+)/autonatrules/(?P<rule>[^/]+)$')),
+    ('autonatrules', re.compile(
+        r'^/api/fmc_config/v1/domain/(?P<domain>[^/]+)/policy/ftdnatpolicies/'
+        r'(?P<policy>[^/]+)/autonatrules$')),
+    ('natpolicy', re.compile(
+        r'^/api/fmc_config/v1/domain/(?P<domain>[^/]+)/policy/ftdnatpolicies/'
+        r'(?P<policy>[^/]+)$')),
+    ('natpolicies', re.compile(
+        r'^/api/fmc_config/v1/domain/(?P<domain>[^/]+)/policy/ftdnatpolicies$')),
+    ('object', re.compile(
+        r'^/api/fmc_config/v1/domain/(?P<domain>[^/]+)/object/(?P<objtype>[a-z]+)/'
+        r'(?P<uuid>[^/]+)$')),
+    ('objects', re.compile(
+        r'^/api/fmc_config/v1/domain/(?P<domain>[^/]+)/object/(?P<objtype>[a-z]+)$')),
+    ('deployabledevices', re.compile(
+        r'^/api/fmc_config/v1/domain/(?P<domain>[^/]+)/deployment/deployabledevices$')),
+    ('deploymentrequests', re.compile(
+        r'^/api/fmc_config/v1/domain/(?P<domain>[^/]+)/deployment/deploymentrequests$')),
+    ('taskstatus', re.compile(
+        r'^/api/fmc_config/v1/domain/(?P<domain>[^/]+)/job/taskstatuses/(?P<task>[^/]+)$')),
+    ('auditrecords', re.compile(
+        r'^/api/fmc_platform/v1/domain/(?P<domain>[^/]+)/audit/auditrecords$')),
+    ('policyassignment', re.compile(
+        r'^/api/fmc_config/v1/domain/(?P<domain>[^/]+)/assignment/policyassignments/'
+        r'(?P<policy>[^/]+)$')),
+]
+
+
+class MockFmcState(object):
+    """
+    In-memory FMC configuration and request accounting
+    """
+    def __init__(self, dataset_size=0, natpolicies=1, rules_per_policy=0,
+                 username='admin', password='admin', devices=2, deploy_time=1.0):
+        """
+        param:: devices: FTDs, assigned to the NAT policies in turn.
+        param:: deploy_time: seconds a deployment task runs.
+        """
+        self.username = username
+        self.password = password
+        self.lock = threading.Lock()
+        self.tokens = {}
+        self.refresh_tokens = {}
+        self.objects = dict((objtype, OrderedDict()) for objtype in OBJECT_TYPES)
+        self.natpolicies = OrderedDict()
+        self.autonatrules = {}
+        self.devices = OrderedDict()
+        self.assignments = {}
+        self.undeployed = set()
+        self.tasks = {}
+        self.audit_records = []
+        self.deploy_time = deploy_time
+        self.version = str(int(time.time() * 1000))
+        self.requests = {}
+        self.seed(dataset_size, natpolicies, rules_per_policy)
+        self.seed_devices(devices)
+
+    def _new_object(self, objtype, item):
+        item = dict(item)
+        item['id'] = str(uuid.uuid4())
+        item['type'] = OBJECT_TYPES[objtype]
+        item['metadata'] = {'lastUser': {'name': self.username},
+                            'timestamp': int(time.time() * 1000),
+                            'domain': {'name': DOMAIN_NAME, 'id': DOMAIN_UUID}}
+        return item
+
+    def seed(self, dataset_size, natpolicies, rules_per_policy):
+        """
+        Fill the configuration with dataset_size hosts, a few networks and
+        zones, and natpolicies policies holding rules_per_policy rules each.
+        """
+        for zone in ('inside-zone', 'outside-zone', 'dmz-zone'):
+            self.add_object('interfaceobjects', {'name': zone})
+        for index in range(dataset_size):
+            self.add_object('hosts', {
+                'name': 'host-{}'.format(index),
+                'value': '10.{}.{}.{}'.format(index >> 16 & 255, index >> 8 & 255, index & 255)
+            })
+        for index in range(max(1, dataset_size // 100)):
+            self.add_object('networks', {
+                'name': 'net-{}'.format(index),
+                'value': '172.{}.{}.0/24'.format(16 + (index >> 8 & 15), index & 255)
+            })
+        hosts = list(self.objects['hosts'].values())
+        zones = list(self.objects['interfaceobjects'].values())
+        for index in range(natpolicies):
+            policy = self.add_natpolicy({'name': 'nat-policy-{}'.format(index),
+                                         'type': 'FTDNatPolicy'})
+            for rule_index in range(min(rules_per_policy, len(hosts))):
+                host = hosts[rule_index]
+                self.add_autonatrule(policy['id'], {
+                    'type': 'FTDAutoNatRule',
+                    'natType': 'STATIC',
+                    'originalNetwork': {'type': 'Host', 'id': host['id']},
+                    'translatedNetwork': {'type': 'Host', 'id': host['id']},
+                    'sourceInterface': {'type': 'SecurityZone', 'id': zones[0]['id']},
+                    'destinationInterface': {'type': 'SecurityZone', 'id': zones[1]['id']},
+                })
+
+    def seed_devices(self, devices):
+        policies = list(self.natpolicies)
+        for index in range(devices):
+            device = {'id': str(uuid.uuid4()), 'name': 'ftd-{}'.format(index), 'type': 'Device'}
+            self.devices[device['id']] = device
+            if policies:
+                policy = policies[index % len(policies)]
+                self.assignments.setdefault(policy, []).append(device['id'])
+
+    def changed(self, policy=None):
+        """
+        Flag the devices a NAT policy is assigned to (every device if None)
+        as having changes to deploy
+        """
+        devices = self.devices if policy is None else self.assignments.get(policy, [])
+        self.undeployed.update(devices)
+        self.version = str(int(time.time() * 1000))
+
+    def audit(self, message, subsystem='API', username=None):
+        """
+        Append an audit record, e.g. to stand for a change made in the GUI
+        """
+        self.audit_records.append({'id': str(uuid.uuid4()), 'type': 'AuditRecord',
+                                   'time': int(time.time()), 'username': username or self.username,
+                                   'subsystem': subsystem, 'source': 'Default',
+                                   'message': message})
+
+    def add_object(self, objtype, item):
+        item = self._new_object(objtype, item)
+        self.objects[objtype][item['id']] = item
+        return item
+
+    def add_natpolicy(self, item):
+        item = dict(item, id=str(uuid.uuid4()), type='FTDNatPolicy')
+        self.natpolicies[item['id']] = item
+        self.autonatrules[item['id']] = OrderedDict()
+        return item
+
+    def add_autonatrule(self, policy_uuid, item):
+        item = dict(item, id=str(uuid.uuid4()), type='FTDAutoNatRule')
+        self.autonatrules[policy_uuid][item['id']] = item
+        return item
+
+    def count(self, method, route):
+        key = '{} {}'.format(method, route)
+        with self.lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    @property
+    def total_requests(self):
+        return sum(self.requests.values())
+
+
+class MockFmcRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the FMC endpoints out of server.state
+    """
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, avoid delayed-ACK stalls
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _reply(self, status, body=None, extra_headers=None):
+        data = json.dumps(body).encode() if body is not None else b''
+        if self.command == 'GET' and status == 200:
+            # Conditional GETs like FMC's, on a digest of the body
+            etag = '"{}"'.format(hashlib.md5(data).hexdigest())
+            extra_headers = dict(extra_headers or {}, ETag=etag)
+            if self.headers.get('If-None-Match') == etag:
+                status, data = 304, b''
+        if self.command in ('POST', 'PUT', 'DELETE') and status < 300 and \
+                self.path.startswith('/api/fmc_config/'):
+            with self.state.lock:
+                self.state.audit('{} {} Success'.format(self.command, self.path))
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (extra_headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status, description, extra_headers=None):
+        self._reply(status, {'error': {'category': 'FRAMEWORK', 'severity': 'ERROR',
+                                       'messages': [{'description': description}]}},
+                    extra_headers)
+
+    def _body(self):
+        return json.loads(self.raw_body) if self.raw_body else None
+
+    def _throttled(self):
+        """
+        Answer 429 when the client exceeds the configured requests per minute
+        """
+        limit = self.server.rate_limit
+        if not limit:
+            return False
+        now = time.monotonic()
+        with self.state.lock:
+            window = self.server.window
+            while window and now - window[0] > 60:
+                window.popleft()
+            if len(window) >= limit:
+                retry_after = int(60 - (now - window[0])) + 1
+                throttled = True
+            else:
+                window.append(now)
+                throttled = False
+        if throttled:
+            self._error(429, 'Too many requests', {'Retry-After': str(retry_after)})
+        return throttled
+
+    def _dispatch(self, method):
+        # Always drain the body so the keep-alive connection stays usable
+        self.raw_body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        url = urlparse(self.path)
+        query = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+        if url.path == STATS_PATH:
+            return self._mock_stats(method)
+        for route, pattern in ROUTES:
+            match = pattern.match(url.path)
+            if match:
+                break
+        else:
+            route, match = None, None
+        self.state.count(method, route or 'unknown')
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self._throttled():
+            return
+        if route is None:
+            return self._error(404, 'Unknown endpoint {}'.format(url.path))
+        if route not in ('token', 'refresh') and \
+                self.headers.get('X-auth-access-token') not in self.state.tokens:
+            return self._error(401, 'Access token invalid.')
+        handler = getattr(self, '_{}_{}'.format(method.lower(), route), None)
+        if handler is None:
+            return self._error(405, 'Method not allowed')
+        params = match.groupdict()
+        if params.get('domain', DOMAIN_UUID) != DOMAIN_UUID:
+            return self._error(404, 'Unknown domain')
+        handler(query, **params)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _mock_stats(self, method):
+        """
+        GET returns the request counters, POST also resets them
+        """
+        with self.state.lock:
+            stats = {'total': sum(self.state.requests.values()),
+                     'requests': dict(self.state.requests)}
+            if method == 'POST':
+                self.state.requests.clear()
+        self._reply(200, stats)
+
+    def _issue_token(self):
+        token, refresh = str(uuid.uuid4()), str(uuid.uuid4())
+        with self.state.lock:
+            self.state.tokens[token] = time.time()
+            self.state.refresh_tokens[refresh] = token
+        self._reply(204, None, {
+            'X-auth-access-token': token,
+            'X-auth-refresh-token': refresh,
+            'DOMAIN_UUID': DOMAIN_UUID,
+            'DOMAINS': json.dumps([{'name': DOMAIN_NAME, 'uuid': DOMAIN_UUID}])
+        })
+
+    def _post_token(self, query):
+        expected = 'Basic ' + base64.b64encode('{}:{}'.format(
+            self.state.username, self.state.password).encode()).decode()
+        if self.headers.get('Authorization') != expected:
+            return self._error(401, 'Invalid credentials')
+        self._issue_token()
+
+    def _post_refresh(self, query):
+        refresh = self.headers.get('X-auth-refresh-token')
+        if self.state.refresh_tokens.get(refresh) != self.headers.get('X-auth-access-token'):
+            return self._error(401, 'Invalid refresh token')
+        self._issue_token()
+
+    def _get_version(self, query):
+        self._reply(200, {'items': [{'serverVersion': SERVER_VERSION, 'type': 'ServerVersion'}],
+                          'paging': {'offset': 0, 'limit': 1, 'count': 1, 'pages': 1}})
+
+    def _listing(self, query, items):
+        """
+        Page through items the way FMC does (offset/limit/expanded, next links)
+        """
+        offset = int(query.get('offset', 0))
+        limit = min(int(query.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        expanded = query.get('expanded') == 'true'
+        page = items[offset:offset + limit]
+        if not expanded:
+            page = [{'id': item['id'], 'name': item.get('name'), 'type': item['type']}
+                    for item in page]
+        paging = {'offset': offset, 'limit': limit, 'count': len(items),
+                  'pages': (len(items) + limit - 1) // limit if limit else 0}
+        if offset + limit < len(items):
+            nextquery = 'offset={}&limit={}'.format(offset + limit, limit)
+            if expanded:
+                nextquery += '&expanded=true'
+            if query.get('filter'):
+                nextquery += '&filter={}'.format(quote(query['filter']))
+            paging['next'] = ['http://{}{}?{}'.format(
+                self.headers.get('Host'), urlparse(self.path).path, nextquery)]
+        self._reply(200, {'items': page, 'paging': paging})
+
+    def _get_auditrecords(self, query, domain):
+        start = int(query.get('starttime', 0))
+        end = int(query.get('endtime', 2 ** 31))
+        self._listing(query, [record for record in self.state.audit_records
+                              if start <= record['time'] <= end])
+
+    def _get_natpolicies(self, query, domain):
+        self._listing(query, list(self.state.natpolicies.values()))
+
+    def _post_natpolicies(self, query, domain):
+        body = self._body()
+        if any(p['name'] == body.get('name') for p in self.state.natpolicies.values()):
+            return self._error(400, 'Duplicate name {}'.format(body.get('name')))
+        with self.state.lock:
+            item = self.state.add_natpolicy(body)
+        self._reply(201, item)
+
+    def _get_natpolicy(self, query, domain, policy):
+        if policy not in self.state.natpolicies:
+            return self._error(404, 'Unknown NAT policy')
+        self._reply(200, self.state.natpolicies[policy])
+
+    def _put_natpolicy(self, query, domain, policy):
+        if policy not in self.state.natpolicies:
+            return self._error(404, 'Unknown NAT policy')
+        with self.state.lock:
+            item = dict(self._body(), id=policy, type='FTDNatPolicy')
+            self.state.natpolicies[policy] = item
+            self.state.changed(policy)
+        self._reply(200, item)
+
+    def _delete_natpolicy(self, query, domain, policy):
+        with self.state.lock:
+            item = self.state.natpolicies.pop(policy, None)
+            self.state.autonatrules.pop(policy, None)
+        if item is None:
+            return self._error(404, 'Unknown NAT policy')
+        self._reply(200, item)
+
+    def _get_autonatrules(self, query, domain, policy):
+        if policy not in self.state.autonatrules:
+            return self._error(404, 'Unknown NAT policy')
+        self._listing(query, list(self.state.autonatrules[policy].values()))
+
+    def _get_autonatrule(self, query, domain, policy, rule):
+        item = self.state.autonatrules.get(policy, {}).get(rule)
+        if item is None:
+            return self._error(404, 'Unknown auto NAT rule')
+        self._reply(200, item)
+
+    def _put_autonatrule(self, query, domain, policy, rule):
+        if rule not in self.state.autonatrules.get(policy, {}):
+            return self._error(404, 'Unknown auto NAT rule')
+        with self.state.lock:
+            item = dict(self._body(), id=rule, type='FTDAutoNatRule')
+            self.state.autonatrules[policy][rule] = item
+            self.state.changed(policy)
+        self._reply(200, item)
+
+    def _delete_autonatrule(self, query, domain, policy, rule):
+        with self.state.lock:
+            item = self.state.autonatrules.get(policy, {}).pop(rule, None)
+            if item is not None:
+                self.state.changed(policy)
+        if item is None:
+            return self._error(404, 'Unknown auto NAT rule')
+        self._reply(200, item)
+
+    def _post_autonatrules(self, query, domain, policy):
+        if policy not in self.state.autonatrules:
+            return self._error(404, 'Unknown NAT policy')
+        body = self._body()
+        items = body if query.get('bulk') == 'true' else [body]
+        if not isinstance(items, list) or len(items) > MAX_PAGE_SIZE:
+            return self._error(400, 'Invalid bulk payload')
+        with self.state.lock:
+            created = [self.state.add_autonatrule(policy, item) for item in items]
+            self.state.changed(policy)
+        self._reply(201, {'items': created} if query.get('bulk') == 'true' else created[0])
+
+    def _get_objects(self, query, domain, objtype):
+        if objtype not in OBJECT_TYPES:
+            return self._error(404, 'Unknown object type {}'.format(objtype))
+        items = list(self.state.objects[objtype].values())
+        term = query.get('filter', '')
+        if term.startswith('nameOrValue:'):
+            term = term[len('nameOrValue:'):].lower()
+            items = [item for item in items if term in item.get('name', '').lower() or
+                     term in str(item.get('value', '')).lower()]
+        self._listing(query, items)
+
+    def _get_object(self, query, domain, objtype, uuid):
+        item = self.state.objects.get(objtype, {}).get(uuid)
+        if item is None:
+            return self._error(404, 'Unknown object')
+        self._reply(200, item)
+
+    def _put_object(self, query, domain, objtype, uuid):
+        if uuid not in self.state.objects.get(objtype, {}):
+            return self._error(404, 'Unknown object')
+        body = self._body()
+        with self.state.lock:
+            if any(item['name'] == body.get('name') and item['id'] != uuid
+                   for item in self.state.objects[objtype].values()):
+                return self._error(400, 'Duplicate name {}'.format(body.get('name')))
+            item = dict(self.state.objects[objtype][uuid], **body)
+            item.update(id=uuid, type=OBJECT_TYPES[objtype])
+            item['metadata'] = dict(item['metadata'], timestamp=int(time.time() * 1000))
+            self.state.objects[objtype][uuid] = item
+            self.state.changed()
+        self._reply(200, item)
+
+    def _delete_object(self, query, domain, objtype, uuid):
+        with self.state.lock:
+            in_use = any(uuid in (rule.get(field, {}).get('id') for field in RULE_REFERENCES)
+                         for rules in self.state.autonatrules.values()
+                         for rule in rules.values())
+            item = None if in_use else self.state.objects.get(objtype, {}).pop(uuid, None)
+        if in_use:
+            return self._error(400, 'Object is in use')
+        if item is None:
+            return self._error(404, 'Unknown object')
+        self._reply(200, item)
+
+    def _post_objects(self, query, domain, objtype):
+        if objtype not in OBJECT_TYPES or objtype == 'interfaceobjects':
+            return self._error(404, 'Unknown object type {}'.format(objtype))
+        body = self._body()
+        bulk = query.get('bulk') == 'true'
+        items = body if bulk else [body]
+        if not isinstance(items, list) or len(items) > MAX_PAGE_SIZE:
+            return self._error(400, 'Invalid bulk payload')
+        with self.state.lock:
+            existing = set(item['name'] for item in self.state.objects[objtype].values())
+            for item in items:
+                if not item.get('name') or not item.get('value'):
+                    return self._error(400, 'Name and value are mandatory')
+                if item['name'] in existing:
+                    return self._error(400, 'Duplicate name {}'.format(item['name']))
+                existing.add(item['name'])
+            created = [self.state.add_object(objtype, item) for item in items]
+        self._reply(201, {'items': created} if bulk else created[0])
+
+    def _get_deployabledevices(self, query, domain):
+        with self.state.lock:
+            items = [{'id': device_id, 'name': self.state.devices[device_id]['name'],
+                      'type': 'DeployableDevice', 'version': self.state.version,
+                      'canBeDeployed': True, 'upToDate': False,
+                      'device': dict(self.state.devices[device_id])}
+                     for device_id in self.state.devices if device_id in self.state.undeployed]
+        self._listing(query, items)
+
+    def _post_deploymentrequests(self, query, domain):
+        body = self._body()
+        devices = body.get('deviceList') or []
+        if not devices or any(device not in self.state.devices for device in devices):
+            return self._error(400, 'Invalid device list')
+        task_id = str(uuid.uuid4())
+        with self.state.lock:
+            self.state.tasks[task_id] = (time.time(), devices)
+        self._reply(202, dict(body, metadata={'task': {'id': task_id,
+                                                       'taskType': 'DEVICE_DEPLOYMENT'}}))
+
+    def _get_taskstatus(self, query, domain, task):
+        if task not in self.state.tasks:
+            return self._error(404, 'Unknown task')
+        with self.state.lock:
+            started, devices = self.state.tasks[task]
+            done = time.time() - started >= self.state.deploy_time
+            if done:
+                self.state.undeployed.difference_update(devices)
+        self._reply(200, {'id': task, 'type': 'TaskStatus',
+                          'status': 'Deployed' if done else 'Deploying'})
+
+    def _get_policyassignment(self, query, domain, policy):
+        if policy not in self.state.assignments:
+            return self._error(404, 'Policy is not assigned')
+        self._reply(200, {'id': policy, 'type': 'PolicyAssignment',
+                          'policy': {'id': policy, 'type': 'FTDNatPolicy'},
+                          'targets': [dict(self.state.devices[device_id])
+                                      for device_id in self.state.assignments[policy]]})
+
+
+class MockFmcServer(object):
+    """
+    Threaded mock FMC listening on 127.0.0.1 (plain HTTP).
+    param:: latency: seconds added to every request.
+    param:: rate_limit: requests per minute before answering 429, None for no limit.
+    param:: dataset_size: number of host objects to create up front.
+    param:: devices: number of FTDs, assigned to the NAT policies in turn.
+    param:: deploy_time: seconds a deployment task takes.
+    """
+    def __init__(self, port=0, latency=0.0, rate_limit=None, dataset_size=0,
+                 natpolicies=1, rules_per_policy=0, username='admin', password='admin',
+                 devices=2, deploy_time=1.0):
+        self.state = MockFmcState(dataset_size, natpolicies, rules_per_policy,
+                                  username, password, devices, deploy_time)
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), MockFmcRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = self.state
+        self.httpd.latency = latency
+        self.httpd.rate_limit = rate_limit
+        self.httpd.window = deque()
+        self._thread = None
+
+    @property
+    def address(self):
+        """
+        host:port to hand to FmcApiHandler (with scheme='http')
+        """
+        return '{}:{}'.format(*self.httpd.server_address[:2])
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def main():
+    """
+    Run the mock FMC in the foreground
+    """
+    parser = argparse.ArgumentParser(description="Local mock of the FMC REST API")
+    parser.add_argument('--port', type=int, default=8080, help="Port to listen on")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="Seconds added to every request")
+    parser.add_argument('--rate-limit', type=int, default=None,
+                        help="Requests per minute before answering 429")
+    parser.add_argument('--dataset-size', type=int, default=1000,
+                        help="Number of host objects to create")
+    parser.add_argument('--natpolicies', type=int, default=1, help="Number of NAT policies")
+    parser.add_argument('--rules-per-policy', type=int, default=0,
+                        help="Auto NAT rules per policy")
+    parser.add_argument('--devices', type=int, default=2, help="Number of FTD devices")
+    args = parser.parse_args()
+    server = MockFmcServer(args.port, args.latency, args.rate_limit, args.dataset_size,
+                           args.natpolicies, args.rules_per_policy, devices=args.devices)
+    print("Mock FMC listening on http://{} (admin/admin)".format(server.address))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import sys
+from collections.abc import Mapping
+
+from fmc_auto_modules.fastjson import (
+    dumps,
+    loads
+)
+
+
+class FmcModel(Mapping):
+    """
+    Compact read-only FMC item. The fields in FIELDS live in slots, the
+    rest (metadata, links and anything rarely read) is kept JSON encoded
+    and decoded on access. Items still read like the dictionaries FMC
+    returns (item["name"], item.get("value")...); fields FMC sends as null
+    are left out. to_dict() gives the plain dictionary back.
+    """
+    __slots__ = ('id', 'name', 'type', '_extra')
+    FIELDS = ('id', 'name', 'type')
+    # Fields holding references to other items
+    REFERENCES = ()
+
+    def __init__(self, item):
+        extra = dict(item)
+        for field in self.FIELDS:
+            value = extra.pop(field, None)
+            if field in self.REFERENCES and value is not None:
+                value = Reference(value)
+            elif field == 'type' and value is not None:
+                # A handful of distinct types shared by every item
+                value = sys.intern(value)
+            setattr(self, field, value)
+        self._extra = dumps(extra) if extra else None
+
+    @classmethod
+    def from_items(cls, items):
+        return [cls(item) for item in items]
+
+    @property
+    def extra(self):
+        """
+        The fields outside FIELDS, decoded
+        """
+        return loads(self._extra) if self._extra is not None else {}
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            value = getattr(self, key)
+            if value is None:
+                raise KeyError(key)
+            return value
+        return self.extra[key]
+
+    def __iter__(self):
+        for field in self.FIELDS:
+            if getattr(self, field) is not None:
+                yield field
+        for key in self.extra:
+            yield key
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+    def __repr__(self):
+        return '{}(id={!r}, name={!r})'.format(type(self).__name__, self.id, self.name)
+
+    def to_dict(self):
+        item = self.extra
+        for field in self.FIELDS:
+            value = getattr(self, field)
+            if value is not None:
+                item[field] = value.to_dict() if isinstance(value, FmcModel) else value
+        return item
+
+
+class Reference(FmcModel):
+    """
+    Reference to another item (type, id and sometimes name)
+    """
+    __slots__ = ()
+
+
+class NetworkObject(FmcModel):
+    """
+    Host, network, range or FQDN object
+    """
+    __slots__ = ('value', 'description', 'overridable')
+    FIELDS = ('id', 'name', 'type', 'value', 'description', 'overridable')
+
+
+class InterfaceObject(FmcModel):
+    """
+    Security zone or interface group
+    """
+    __slots__ = ('interfaceMode',)
+    FIELDS = ('id', 'name', 'type', 'interfaceMode')
+
+
+class NatPolicy(FmcModel):
+    """
+    FTD NAT policy
+    """
+    __slots__ = ('description',)
+    FIELDS = ('id', 'name', 'type', 'description')
+
+
+class AutoNatRule(FmcModel):
+    """
+    Auto NAT rule, with its network and interface references
+    """
+    __slots__ = ('natType', 'originalNetwork', 'translatedNetwork', 'sourceInterface',
+                 'destinationInterface', 'serviceProtocol', 'originalPort', 'translatedPort')
+    FIELDS = ('id', 'name', 'type', 'natType', 'originalNetwork', 'translatedNetwork',
+              'sourceInterface', 'destinationInterface', 'serviceProtocol', 'originalPort',
+              'translatedPort')
+    REFERENCES = ('originalNetwork', 'translatedNetwork', 'sourceInterface',
+                  'destinationInterface')
+
+
+# Model of the items of each object type
+OBJECT_MODELS = {
+    'hosts': NetworkObject,
+    'networks': NetworkObject,
+    'ranges': NetworkObject,
+    'fqdns': NetworkObject,
+    'interfaceobjects': InterfaceObject,
+}
+
+
+def model_for(objtype):
+    """
+    Model class of an object type, FmcModel for the types without their own
+    """
+    return OBJECT_MODELS.get(objtype, FmcModel)
+
+
+def to_plain(value):
+    """
+    Replace models with dictionaries in value (lists, tuples, dicts), e.g.
+    before encoding it as JSON.
+    """
+    if isinstance(value, FmcModel):
+        return value.to_dict()
+    if isinstance(value, (list, tuple)):
+        return [to_plain(item) for item in value]
+    if isinstance(value, dict):
+        return dict((key, to_plain(item)) for key, item in value.items())
+    return value
@@ -0,0 +1,221 @@
+import heapq
+from itertools import count
+
+from fmc_auto_modules.ipindex import (
+    IntervalIndex,
+    load_ip_objects,
+    parse_interval
+)
+
+# Conflict kinds, from the most to the least severe
+DUPLICATE = 'duplicate'
+CONFLICT = 'conflict'
+TRANSLATED_OVERLAP = 'translated_overlap'
+OVERLAP = 'overlap'
+
+
+class AnalyzedRule(object):
+    """
+    Auto NAT rule reduced to what the analyzer compares: interface pair,
+    service and original/translated address intervals.
+    """
+    def __init__(self, rule, values):
+        """
+        param:: rule: auto NAT rule as returned by FMC (references by id).
+        param:: values: object id -> value (address, prefix or range).
+        """
+        self.rule = rule
+        self.id = rule.get("id")
+        self.source = (rule.get("sourceInterface") or {}).get("id")
+        self.destination = (rule.get("destinationInterface") or {}).get("id")
+        self.static = rule.get("natType", "STATIC") == "STATIC"
+        protocol = rule.get("serviceProtocol")
+        self.service = (protocol, rule.get("originalPort")) if protocol else None
+        self.translated_service = (protocol, rule.get("translatedPort")) if protocol else None
+        self.original = self._interval(rule.get("originalNetwork"), values)
+        self.translated = self._interval(rule.get("translatedNetwork"), values)
+
+    @staticmethod
+    def _interval(reference, values):
+        if not reference:
+            return None
+        return parse_interval(values.get(reference.get("id")))
+
+    def pair_matches(self, source, destination):
+        """
+        True if traffic between the interfaces can hit this rule (None is any)
+        """
+        return (self.source is None or source is None or self.source == source) and \
+            (self.destination is None or destination is None or self.destination == destination)
+
+
+def _overlapping_pairs(entries, interval):
+    """
+    Pairs of entries whose intervals overlap, found by sweeping over the
+    starts with a heap of the intervals still open: O(n log n + pairs).
+    """
+    ordered = sorted(entries, key=lambda entry: interval(entry)[1:])
+    active = []
+    sequence = count()
+    for entry in ordered:
+        version, start, end = interval(entry)
+        while active and active[0][0] < start:
+            heapq.heappop(active)
+        for other_end, position, other in active:
+            yield other, entry
+        heapq.heappush(active, (end, next(sequence), entry))
+
+
+def _conflict(kind, first, second, detail):
+    return {"kind": kind, "rules": [first.id, second.id], "detail": detail}
+
+
+def _classify(first, second):
+    """
+    Conflict between two rules whose original networks overlap
+    """
+    if first.original == second.original:
+        if first.translated == second.translated:
+            return _conflict(DUPLICATE, first, second, "same original and translated network")
+        return _conflict(CONFLICT, first, second,
+                         "same original network translated differently")
+    return _conflict(OVERLAP, first, second, "original networks overlap")
+
+
+class NatRuleAnalyzer(object):
+    """
+    Finds duplicated, conflicting and overlapping auto NAT rules of a policy.
+    Rules are grouped by interface pair, service and IP version, and overlaps
+    are found with sorted sweeps and interval indexes instead of comparing
+    every pair of rules. Rules whose networks have no known value are listed
+    in self.unresolved and ignored.
+    """
+    def __init__(self, rules, values):
+        """
+        param:: rules: auto NAT rules as returned by FMC (expanded).
+        param:: values: object id -> value of the networks they reference.
+        """
+        self.rules = []
+        self.unresolved = []
+        for rule in rules:
+            analyzed = AnalyzedRule(rule, values)
+            if analyzed.original is None:
+                self.unresolved.append(rule)
+            else:
+                self.rules.append(analyzed)
+        self.groups = {}
+        for analyzed in self.rules:
+            self.groups.setdefault(self._group_key(analyzed), []).append(analyzed)
+        self.translated_groups = {}
+        for analyzed in self.rules:
+            if analyzed.static and analyzed.translated is not None:
+                self.translated_groups.setdefault(
+                    self._translated_key(analyzed), []).append(analyzed)
+        self._indexes = {}
+
+    @classmethod
+    def from_handler(cls, fmc, natpolicy):
+        """
+        Analyzer over the rules of a NAT policy, by name
+        """
+        rules = fmc.get_autonatrules(natpolicy, expanded=True)
+        return cls(rules, object_values(fmc))
+
+    @staticmethod
+    def _group_key(analyzed):
+        return (analyzed.source, analyzed.destination, analyzed.service, analyzed.original[0])
+
+    @staticmethod
+    def _translated_key(analyzed):
+        return (analyzed.destination, analyzed.translated_service, analyzed.translated[0])
+
+    def _index(self, key, translated=False):
+        """
+        Interval index of a group, built on first use
+        """
+        cache_key = (translated, key)
+        if cache_key not in self._indexes:
+            if translated:
+                entries = [(item.translated[1], item.translated[2], item)
+                           for item in self.translated_groups[key]]
+            else:
+                entries = [(item.original[1], item.original[2], item)
+                           for item in self.groups[key]]
+            self._indexes[cache_key] = IntervalIndex(entries)
+        return self._indexes[cache_key]
+
+    def _matching_groups(self, key, wildcard_only=False):
+        """
+        Other groups whose rules can match the same traffic as group key.
+        With wildcard_only, only pairs involving an "any" interface are
+        returned, the exact same key is compared by the sweep.
+        """
+        source, destination, service, version = key
+        for other in self.groups:
+            if other == key or other[2] != service or other[3] != version:
+                continue
+            if wildcard_only and None not in (source, destination):
+                continue
+            if (source is None or other[0] is None or source == other[0]) and \
+                    (destination is None or other[1] is None or destination == other[1]):
+                yield other
+
+    def conflicts(self):
+        """
+        Every conflict between the rules, as dictionaries with kind, the two
+        rule ids and a detail message.
+        """
+        found = []
+        for key, entries in self.groups.items():
+            for first, second in _overlapping_pairs(entries, lambda item: item.original):
+                found.append(_classify(first, second))
+        # Rules on "any" interface also meet the rules of the specific pairs
+        seen = set()
+        for key in self.groups:
+            for other in self._matching_groups(key, wildcard_only=True):
+                if (other, key) in seen:
+                    continue
+                seen.add((key, other))
+                index = self._index(other)
+                for first in self.groups[key]:
+                    for second in index.overlapping(first.original[1], first.original[2]):
+                        found.append(_classify(first, second))
+        for key, entries in self.translated_groups.items():
+            for first, second in _overlapping_pairs(entries, lambda item: item.translated):
+                if first.original != second.original:
+                    found.append(_conflict(TRANSLATED_OVERLAP, first, second,
+                                           "static rules translate to overlapping addresses"))
+        return found
+
+    def check(self, rule, values):
+        """
+        param:: rule: a new auto NAT rule (references by id, no id yet).
+        Conflicts the rule would introduce, without comparing it to every rule.
+        """
+        analyzed = AnalyzedRule(rule, values)
+        if analyzed.original is None:
+            return []
+        found = []
+        key = self._group_key(analyzed)
+        keys = ([key] if key in self.groups else []) + list(self._matching_groups(key))
+        for other in keys:
+            for second in self._index(other).overlapping(analyzed.original[1],
+                                                         analyzed.original[2]):
+                found.append(_classify(analyzed, second))
+        if analyzed.static and analyzed.translated is not None:
+            key = self._translated_key(analyzed)
+            if key in self.translated_groups:
+                for second in self._index(key, translated=True).overlapping(
+                        analyzed.translated[1], analyzed.translated[2]):
+                    if second.original != analyzed.original:
+                        found.append(_conflict(TRANSLATED_OVERLAP, analyzed, second,
+                                               "static rules translate to overlapping "
+                                               "addresses"))
+        return found
+
+
+def object_values(fmc):
+    """
+    Object id -> value of the host, network and range objects of a handler
+    """
+    return dict((item["id"], item.get("value")) for item in load_ip_objects(fmc))
@@ -0,0 +1,115 @@
+import threading
+import time
+
+# Seconds an object table stays valid before it is fetched again
+DEFAULT_OBJECT_INDEX_TTL = 300
+
+
+class ObjectIndex(object):
+    """
+    Name to UUID mappings of FMC objects, one table per object type.
+    Each table is filled at most once per TTL and kept up to date in place
+    when objects are created through the handler. Updates are serialized so
+    the threads of one handler can share it.
+    """
+    def __init__(self, ttl=DEFAULT_OBJECT_INDEX_TTL, ttls=None):
+        """
+        param:: ttl: default lifetime of a table in seconds, None never expires.
+        param:: ttls: per object type overrides, e.g. {'interfaceobjects': 3600}.
+        """
+        self.ttl = ttl
+        self.ttls = ttls or {}
+        self._tables = {}
+        self._items = {}
+        self._loaded_at = {}
+        self._lock = threading.Lock()
+
+    def _ttl(self, objtype):
+        return self.ttls.get(objtype, self.ttl)
+
+    def is_stale(self, objtype):
+        """
+        True if the table of objtype has to be (re)loaded
+        """
+        if objtype not in self._tables:
+            return True
+        ttl = self._ttl(objtype)
+        return ttl is not None and time.time() - self._loaded_at[objtype] > ttl
+
+    def store(self, objtype, mapping, items=None):
+        """
+        Replace the table of objtype with a freshly fetched name -> UUID mapping
+        param:: items: optionally the listing entries themselves, by name.
+        """
+        with self._lock:
+            self._tables[objtype] = dict(mapping)
+            if items is not None:
+                self._items[objtype] = dict(items)
+            else:
+                self._items.pop(objtype, None)
+            self._loaded_at[objtype] = time.time()
+
+    def table(self, objtype):
+        """
+        Name -> UUID mapping of objtype, empty if not loaded
+        """
+        return self._tables.get(objtype, {})
+
+    def lookup(self, objtype, name):
+        """
+        UUID of an object or None
+        """
+        return self._tables.get(objtype, {}).get(name)
+
+    def item(self, objtype, name):
+        """
+        Listing entry of an object, if the table was stored with its items
+        """
+        return self._items.get(objtype, {}).get(name)
+
+    def add(self, objtype, name, uuid, item=None):
+        """
+        Record an object created after the table was loaded.
+        Tables that were never loaded are left alone so they are fetched in full.
+        """
+        with self._lock:
+            if objtype in self._tables:
+                self._tables[objtype][name] = uuid
+                if item is not None and objtype in self._items:
+                    self._items[objtype][name] = item
+
+    def items(self, objtype):
+        """
+        Name -> listing entry of objtype, empty if stored without items
+        """
+        return self._items.get(objtype, {})
+
+    def has_items(self, objtype):
+        """
+        True if objtype was stored with its listing entries
+        """
+        return objtype in self._items
+
+    def remove(self, objtype, uuid):
+        """
+        Forget a deleted object
+        """
+        with self._lock:
+            for name, value in list(self._tables.get(objtype, {}).items()):
+                if value == uuid:
+                    del self._tables[objtype][name]
+                    self._items.get(objtype, {}).pop(name, None)
+
+    def invalidate(self, objtype=None):
+        """
+        Drop one table, or every table when objtype is None
+        """
+        with self._lock:
+            if objtype is None:
+                self._tables.clear()
+                self._items.clear()
+                self._loaded_at.clear()
+            else:
+                self._tables.pop(objtype, None)
+                self._items.pop(objtype, None)
+                self._loaded_at.pop(objtype, None)
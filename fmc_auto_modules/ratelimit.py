@@ -0,0 +1,156 @@
+import asyncio
+import random
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+# FMC accepts about 120 requests per minute and 10 concurrent connections
+DEFAULT_REQUESTS_PER_MINUTE = 120
+DEFAULT_BURST = 10
+DEFAULT_MAX_CONCURRENT = 10
+
+# Retries of a request FMC answered 429 to
+DEFAULT_THROTTLE_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+
+class RateLimiter(object):
+    """
+    Token bucket shared by every request sent to one FMC host.
+    Requests take a token (refilled at requests_per_minute) and a connection
+    slot (max_concurrent). When FMC throttles, pause() holds back every
+    request until the server is willing to accept them again.
+    """
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, burst=DEFAULT_BURST,
+                 max_concurrent=DEFAULT_MAX_CONCURRENT):
+        self.rate = requests_per_minute / 60.0
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._not_before = 0.0
+        self._waiting = 0
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+
+    @property
+    def queue_depth(self):
+        """
+        Number of requests waiting for a token or a connection slot
+        """
+        return self._waiting
+
+    def reserve(self):
+        """
+        Take a token and return how many seconds the caller has to wait
+        before sending its request.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._not_before - now)
+
+    def pause(self, seconds):
+        """
+        Hold back every request for the given number of seconds
+        """
+        with self._lock:
+            self._not_before = max(self._not_before, time.monotonic() + seconds)
+
+    def _enter_queue(self):
+        with self._lock:
+            self._waiting += 1
+
+    def _leave_queue(self):
+        with self._lock:
+            self._waiting -= 1
+
+    @contextmanager
+    def slot(self):
+        """
+        Block until the request may be sent and hold a connection slot
+        while it is in flight.
+        """
+        self._enter_queue()
+        try:
+            wait = self.reserve()
+            if wait > 0:
+                time.sleep(wait)
+            self._slots.acquire()
+        finally:
+            self._leave_queue()
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    async def wait_async(self):
+        """
+        Asynchronous counterpart of slot() for the token bucket only;
+        AsyncFmcApiHandler bounds concurrency with its own semaphore.
+        """
+        self._enter_queue()
+        try:
+            wait = self.reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+        finally:
+            self._leave_queue()
+
+
+_LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def configure_rate_limiter(fmcserver, **kwargs):
+    """
+    Set the limits used for an FMC host (see RateLimiter for the arguments).
+    Returns the new limiter; handlers created afterwards share it.
+    """
+    with _LIMITERS_LOCK:
+        _LIMITERS[fmcserver] = RateLimiter(**kwargs)
+        return _LIMITERS[fmcserver]
+
+
+def rate_limiter_for(fmcserver):
+    """
+    Limiter shared by every handler of an FMC host, created with the
+    default limits if the host was not configured.
+    """
+    with _LIMITERS_LOCK:
+        if fmcserver not in _LIMITERS:
+            _LIMITERS[fmcserver] = RateLimiter()
+        return _LIMITERS[fmcserver]
+
+
+def retry_after_seconds(value):
+    """
+    Seconds to wait according to a Retry-After header (delta-seconds or
+    HTTP-date), None if absent or unparsable.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Delay before retrying a throttled request: the server's Retry-After
+    when given, else exponential backoff with full jitter.
+    """
+    delay = retry_after_seconds(retry_after)
+    if delay is not None:
+        return delay
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
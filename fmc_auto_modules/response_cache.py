@@ -0,0 +1,283 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+DEFAULT_RESPONSE_CACHE = os.path.join(
+    os.path.expanduser('~'), '.fmc_automation', 'responses.db')
+
+# Seconds a GET response is served without asking FMC again
+DEFAULT_RESPONSE_CACHE_TTL = 30
+# Per endpoint overrides, by last path segment that is not an id. 0 never caches.
+DEFAULT_ENDPOINT_TTLS = {
+    'taskstatuses': 0,
+    'deployabledevices': 0,
+    'serverversion': 3600,
+    'auditrecords': 0,
+}
+# Memory kept for response bodies before the least recently used are dropped
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Path segments that are ids (UUIDs, task numbers) rather than endpoints
+ID_SEGMENT = re.compile(r'^([0-9]+|[0-9a-fA-F-]{8,})$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    url TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    content BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_path ON responses (path);
+"""
+
+
+def endpoint_of(path):
+    """
+    Endpoint of a path: its last segment that is not an id, e.g. 'autonatrules'
+    for /policy/ftdnatpolicies/<uuid>/autonatrules/<uuid>
+    """
+    for segment in reversed(path.rstrip('/').split('/')):
+        if not ID_SEGMENT.match(segment):
+            return segment
+    return ''
+
+
+def collection_of(path):
+    """
+    Path of the collection a written path belongs to: the path itself for
+    a collection, without the trailing id for an item.
+    """
+    path = path.rstrip('/')
+    head, _, last = path.rpartition('/')
+    return head if ID_SEGMENT.match(last) else path
+
+
+class _CachedEntry(object):
+    __slots__ = ('path', 'url', 'stored_at', 'etag', 'last_modified', 'content', 'response')
+
+    def __init__(self, path, url, stored_at, etag, last_modified, content, response=None):
+        self.path = path
+        self.url = url
+        self.stored_at = stored_at
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content = content
+        self.response = response
+
+    def to_response(self):
+        """
+        The cached answer as a requests Response, built once
+        """
+        if self.response is None:
+            response = requests.models.Response()
+            response.status_code = 200
+            response._content = self.content
+            response.url = self.url
+            response.encoding = 'utf-8'
+            response.headers = CaseInsensitiveDict({'Content-Type': 'application/json'})
+            response.request = requests.Request('GET', self.url).prepare()
+            self.response = response
+        return self.response
+
+
+class _Flight(object):
+    """
+    A GET being sent, waited for by the other callers of the same URL
+    """
+    __slots__ = ('done', 'response', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class ResponseCache(object):
+    """
+    Cache of FMC GET responses shared by the handlers that use it.
+    Responses are served from memory, then from an optional SQLite file,
+    while younger than the TTL of their endpoint; older ones are revalidated
+    with If-None-Match/If-Modified-Since when FMC gave an ETag/Last-Modified.
+    Concurrent GETs of the same URL are sent once and share the response.
+    Writes through the handler drop the cached responses of their collection.
+    """
+    def __init__(self, ttl=DEFAULT_RESPONSE_CACHE_TTL, ttls=None, path=None,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        """
+        param:: ttl: default lifetime of a response in seconds.
+        param:: ttls: per endpoint overrides, e.g. {'interfaceobjects': 3600}.
+        param:: path: SQLite file keeping the responses across runs, None for memory only.
+        """
+        self.ttl = ttl
+        self.ttls = dict(DEFAULT_ENDPOINT_TTLS)
+        self.ttls.update(ttls or {})
+        self.path = path
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.stats = dict((counter, 0) for counter in (
+            'hits', 'misses', 'revalidated', 'shared', 'invalidated'))
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.db = None
+        if path:
+            dirname = os.path.dirname(path)
+            if dirname and not os.path.isdir(dirname):
+                os.makedirs(dirname, mode=0o700, exist_ok=True)
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.executescript(SCHEMA)
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def ttl_for(self, path):
+        return self.ttls.get(endpoint_of(path), self.ttl)
+
+    @staticmethod
+    def key(scope, url):
+        """
+        param:: scope: who asks (FMC user), cached answers are not shared across users.
+        """
+        return '{} {}'.format(scope, url)
+
+    def _count(self, counter):
+        with self._lock:
+            self.stats[counter] += 1
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+            if self.db is None:
+                return None
+            row = self.db.execute(
+                "SELECT path, url, stored_at, etag, last_modified, content FROM responses "
+                "WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        entry = _CachedEntry(*row)
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous.content)
+            self._entries[key] = entry
+            self.size += len(entry.content)
+            while self.size > self.max_bytes and len(self._entries) > 1:
+                _, dropped = self._entries.popitem(last=False)
+                self.size -= len(dropped.content)
+
+    def _store(self, key, entry):
+        self._remember(key, entry)
+        if self.db is not None:
+            with self._lock:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO responses "
+                    "(key, path, url, stored_at, etag, last_modified, content) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, entry.path, entry.url, entry.stored_at, entry.etag,
+                     entry.last_modified, entry.content))
+                self.db.commit()
+
+    def _touch(self, key, entry):
+        entry.stored_at = time.time()
+        if self.db is not None:
+            with self._lock:
+                self.db.execute("UPDATE responses SET stored_at = ? WHERE key = ?",
+                                (entry.stored_at, key))
+                self.db.commit()
+
+    def get(self, key, url, send):
+        """
+        param:: url: full URL of the GET, query included.
+        param:: send: callable(headers) sending the GET with these extra
+                (conditional) headers and returning the response.
+        Returns a cached or fresh response.
+        """
+        path = urlparse(url).path
+        ttl = self.ttl_for(path)
+        entry = self._lookup(key) if ttl else None
+        if entry is not None and time.time() - entry.stored_at < ttl:
+            self._count('hits')
+            return entry.to_response()
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            self._count('shared')
+            if flight.error is not None:
+                raise flight.error
+            return flight.response
+        try:
+            flight.response = self._fetch(key, url, path, ttl, entry, send)
+            return flight.response
+        except Exception as exp:
+            flight.error = exp
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight.done.set()
+
+    def _fetch(self, key, url, path, ttl, entry, send):
+        conditional = {}
+        if entry is not None:
+            if entry.etag:
+                conditional['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                conditional['If-Modified-Since'] = entry.last_modified
+        resp = send(conditional)
+        if resp.status_code == 304 and entry is not None:
+            self._count('revalidated')
+            self._touch(key, entry)
+            return entry.to_response()
+        self._count('misses')
+        if resp.status_code == 200 and ttl:
+            self._store(key, _CachedEntry(path, url, time.time(), resp.headers.get('ETag'),
+                                          resp.headers.get('Last-Modified'), resp.content,
+                                          resp))
+        return resp
+
+    def invalidate(self, path):
+        """
+        Drop the responses of the collection a written path belongs to,
+        its items and their sub-collections included.
+        """
+        prefix = collection_of(path)
+        with self._lock:
+            for key in [key for key, entry in self._entries.items()
+                        if entry.path == prefix or entry.path.startswith(prefix + '/')]:
+                self.size -= len(self._entries.pop(key).content)
+                self.stats['invalidated'] += 1
+            if self.db is not None:
+                self.db.execute("DELETE FROM responses WHERE path = ? OR substr(path, 1, ?) = ?",
+                                (prefix, len(prefix) + 1, prefix + '/'))
+                self.db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            if self.db is not None:
+                self.db.execute("DELETE FROM responses")
+                self.db.commit()
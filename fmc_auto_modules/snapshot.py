@@ -0,0 +1,151 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from fmc_auto_modules.fastjson import loads
+
+DEFAULT_SNAPSHOT = os.path.join(
+    os.path.expanduser('~'), '.fmc_automation', 'snapshot.db')
+
+# Collections that are not object types
+NATPOLICIES = 'ftdnatpolicies'
+AUTONATRULES = 'autonatrules'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    scope TEXT NOT NULL,
+    collection TEXT NOT NULL,
+    parent TEXT NOT NULL DEFAULT '',
+    uuid TEXT NOT NULL,
+    name TEXT,
+    value TEXT,
+    modified INTEGER,
+    body TEXT NOT NULL,
+    PRIMARY KEY (scope, collection, parent, uuid)
+);
+CREATE INDEX IF NOT EXISTS items_name ON items (scope, collection, name);
+CREATE INDEX IF NOT EXISTS items_value ON items (scope, value);
+CREATE INDEX IF NOT EXISTS items_uuid ON items (uuid);
+CREATE TABLE IF NOT EXISTS refreshes (
+    scope TEXT NOT NULL,
+    collection TEXT NOT NULL,
+    parent TEXT NOT NULL DEFAULT '',
+    refreshed_at REAL NOT NULL,
+    PRIMARY KEY (scope, collection, parent)
+);
+"""
+
+
+def item_modified(item):
+    """
+    Last modification time FMC reports for an item, None if it does not
+    """
+    return (item.get('metadata') or {}).get('timestamp')
+
+
+class SnapshotStore(object):
+    """
+    SQLite copy of FMC objects, NAT policies and auto NAT rules.
+    Rows are scoped by host and domain; a collection is an object type,
+    'ftdnatpolicies' or 'autonatrules' (with the policy UUID as parent).
+    """
+    def __init__(self, path=DEFAULT_SNAPSHOT):
+        self.path = path
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname, mode=0o700, exist_ok=True)
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+
+    @staticmethod
+    def scope(fmcserver, domain):
+        """
+        Scope of the rows of a host and domain
+        """
+        return '{}|{}'.format(fmcserver, domain)
+
+    def close(self):
+        self.db.close()
+
+    def known(self, scope, collection, parent=''):
+        """
+        UUID -> (name, modified) of the stored items of a collection
+        """
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT uuid, name, modified FROM items "
+                "WHERE scope = ? AND collection = ? AND parent = ?",
+                (scope, collection, parent)).fetchall()
+        return dict((uuid, (name, modified)) for uuid, name, modified in rows)
+
+    def apply(self, scope, collection, changed, removed, parent=''):
+        """
+        param:: changed: full items to insert or replace.
+        param:: removed: UUIDs of items that no longer exist.
+        Update a collection and record when it was refreshed.
+        """
+        with self._lock, self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO items "
+                "(scope, collection, parent, uuid, name, value, modified, body) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(scope, collection, parent, item['id'], item.get('name'),
+                  item.get('value'), item_modified(item), json.dumps(item))
+                 for item in changed])
+            self.db.executemany(
+                "DELETE FROM items WHERE scope = ? AND collection = ? AND parent = ? "
+                "AND uuid = ?", [(scope, collection, parent, uuid) for uuid in removed])
+            self.db.execute(
+                "INSERT OR REPLACE INTO refreshes (scope, collection, parent, refreshed_at) "
+                "VALUES (?, ?, ?, ?)", (scope, collection, parent, time.time()))
+
+    def drop(self, scope, collection, parent=''):
+        """
+        Forget a collection, e.g. the rules of a deleted policy
+        """
+        with self._lock, self.db:
+            self.db.execute("DELETE FROM items WHERE scope = ? AND collection = ? "
+                            "AND parent = ?", (scope, collection, parent))
+            self.db.execute("DELETE FROM refreshes WHERE scope = ? AND collection = ? "
+                            "AND parent = ?", (scope, collection, parent))
+
+    def refreshed_at(self, scope, collection, parent=''):
+        """
+        Time of the last refresh of a collection, None if never stored
+        """
+        with self._lock:
+            row = self.db.execute(
+                "SELECT refreshed_at FROM refreshes "
+                "WHERE scope = ? AND collection = ? AND parent = ?",
+                (scope, collection, parent)).fetchone()
+        return row[0] if row else None
+
+    def items(self, scope, collection, parent=''):
+        """
+        Stored items of a collection ordered by name
+        """
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT body FROM items WHERE scope = ? AND collection = ? AND parent = ? "
+                "ORDER BY name, uuid", (scope, collection, parent)).fetchall()
+        return [loads(body) for body, in rows]
+
+    def find(self, scope, name=None, value=None, uuid=None, collection=None):
+        """
+        Stored items matching every given criterion, across collections
+        unless one is given.
+        """
+        clauses = ["scope = ?"]
+        params = [scope]
+        for column, param in (('name', name), ('value', value), ('uuid', uuid),
+                              ('collection', collection)):
+            if param is not None:
+                clauses.append("{} = ?".format(column))
+                params.append(param)
+        with self._lock:
+            rows = self.db.execute("SELECT body FROM items WHERE " + " AND ".join(clauses),
+                                   params).fetchall()
+        return [loads(body) for body, in rows]
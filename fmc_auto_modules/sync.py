@@ -0,0 +1,345 @@
+from collections import OrderedDict
+
+from fmc_auto_modules.fmc_baseapi import (
+    AUTONATRULE_INTERFACE_TYPE,
+    AUTONATRULE_NETWORK_FIELDS,
+    AUTONATRULE_NETWORK_TYPES,
+    BULK_CHUNK_SIZE,
+    NATPOLICY_INDEX,
+    OBJECTS_TYPE_ALLOWED,
+    _LOG
+)
+from fmc_auto_modules.loaders import load_document
+
+CREATE = 'create'
+UPDATE = 'update'
+DELETE = 'delete'
+
+# Fields of an auto NAT rule referencing objects by name
+RULE_REFERENCES = ("originalNetwork", "translatedNetwork", "sourceInterface",
+                   "destinationInterface")
+
+# Fields that are not compared when diffing (FMC spells the types differently)
+IGNORED_FIELDS = ("name", "type", "targetNatPolicy")
+
+
+class SyncAction(object):
+    """
+    One API call of a sync plan
+    param:: kind: object, natpolicy or autonatrule.
+    param:: key: (objtype, name), policy name or (policy name, originalNetwork).
+    """
+    MARKS = {CREATE: '+', UPDATE: '~', DELETE: '-'}
+
+    def __init__(self, action, kind, key, payload=None, current=None, changes=None):
+        self.action = action
+        self.kind = kind
+        self.key = key
+        self.payload = payload
+        self.current = current
+        self.changes = changes or []
+
+    def describe(self):
+        key = "/".join(self.key) if isinstance(self.key, tuple) else self.key
+        line = "{} {} {}".format(self.MARKS[self.action], self.kind, key)
+        if self.changes:
+            line += " ({})".format(", ".join(self.changes))
+        return line
+
+
+class SyncPlan(object):
+    """
+    Create/update/delete calls needed to reach a desired state.
+    errors lists what prevents the plan from being applied.
+    """
+    def __init__(self):
+        self.actions = []
+        self.errors = []
+
+    def __len__(self):
+        return len(self.actions)
+
+    def add(self, *args, **kwargs):
+        self.actions.append(SyncAction(*args, **kwargs))
+
+    def select(self, action, kind):
+        return [item for item in self.actions if item.action == action and item.kind == kind]
+
+    def counts(self):
+        """
+        Number of actions by action type
+        """
+        counts = OrderedDict((action, 0) for action in (CREATE, UPDATE, DELETE))
+        for item in self.actions:
+            counts[item.action] += 1
+        return counts
+
+    def describe(self):
+        """
+        Human readable plan, one line per action
+        """
+        lines = [item.describe() for item in self.actions]
+        lines.extend("! {}".format(error) for error in self.errors)
+        lines.append("Plan: {create} to create, {update} to update, {delete} to delete.".format(
+            **self.counts()))
+        return "\n".join(lines)
+
+
+def _network_key(value):
+    """
+    Name a network field of a desired rule is keyed by: the name of a
+    {"name", "value"} object, else the field itself (a name or an address).
+    """
+    if isinstance(value, dict):
+        return value.get("name") or value.get("value")
+    return value
+
+
+def _unique(items, key, section, path):
+    mapping = OrderedDict()
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError("{}: entries of {} must be mappings.".format(path, section))
+        try:
+            item_key = key(item)
+        except KeyError as exp:
+            raise ValueError("{}: {} entry without {}: {}".format(path, section, exp, item))
+        if item_key in mapping:
+            raise ValueError("{}: duplicate {} entry {}".format(path, section, item_key))
+        mapping[item_key] = item
+    return mapping
+
+
+def load_desired_state(path):
+    """
+    param:: path: JSON/YAML file with any of the sections
+        objects: [{name, type, value[, description, dnsResolution]}]
+        natpolicies: [{name[, description]}]
+        autonatrules: [{targetNatPolicy, originalNetwork, ...}] (see avi-nat)
+    Returns a dictionary of the sections keyed the way they are diffed.
+    Sections missing from the file are None and left untouched, even when pruning.
+    """
+    document = load_document(path)
+    unknown = set(document) - set(("objects", "natpolicies", "autonatrules"))
+    if unknown:
+        raise ValueError("{}: unknown sections {}".format(path, ", ".join(sorted(unknown))))
+    desired = dict.fromkeys(("objects", "natpolicies", "autonatrules"))
+    if document.get("objects") is not None:
+        objects = [dict(item, type=str(item.get("type", "")).lower())
+                   for item in document["objects"]]
+        for item in objects:
+            if item["type"] not in OBJECTS_TYPE_ALLOWED:
+                raise ValueError("{}: {} is not supported object type.".format(
+                    path, item["type"]))
+        desired["objects"] = _unique(objects, lambda item: (item["type"], item["name"]),
+                                     "objects", path)
+    if document.get("natpolicies") is not None:
+        desired["natpolicies"] = _unique(document["natpolicies"], lambda item: item["name"],
+                                         "natpolicies", path)
+    if document.get("autonatrules") is not None:
+        desired["autonatrules"] = _unique(
+            document["autonatrules"],
+            lambda item: (item["targetNatPolicy"], _network_key(item["originalNetwork"])),
+            "autonatrules", path)
+    return desired
+
+
+def _changes(payload, current):
+    """
+    Fields of payload whose value differs in current
+    """
+    return [field for field in payload
+            if field not in IGNORED_FIELDS and payload[field] != current.get(field)]
+
+
+def _rule_changes(payload, current, names):
+    """
+    Fields of a desired auto NAT rule (names) that differ in a current one (references)
+    """
+    changes = []
+    for field in RULE_REFERENCES:
+        reference = current.get(field) or {}
+        current_name = reference.get("name") or names.get(reference.get("id"))
+        # An empty interface means any interface
+        if (payload.get(field) or None) != current_name:
+            changes.append(field)
+    for field in payload:
+        if field not in IGNORED_FIELDS and field not in RULE_REFERENCES and \
+                payload[field] != current.get(field):
+            changes.append(field)
+    return changes
+
+
+def _plan_natpolicies(fmc, desired, plan, prune):
+    fmc.get_ftdnatpolicies(expanded=True)
+    current_policies = fmc.object_index.items(NATPOLICY_INDEX)
+    wanted = desired["natpolicies"]
+    if wanted is None:
+        return
+    for name, payload in wanted.items():
+        current = current_policies.get(name)
+        if current is None:
+            plan.add(CREATE, "natpolicy", name, payload)
+        else:
+            changes = _changes(payload, current)
+            if changes:
+                plan.add(UPDATE, "natpolicy", name, payload, current, changes)
+    if prune:
+        for name in sorted(set(current_policies) - set(wanted)):
+            plan.add(DELETE, "natpolicy", name, current=current_policies[name])
+
+
+def _plan_objects(fmc, desired, plan, prune):
+    wanted = desired["objects"]
+    if wanted is None:
+        return
+    for objtype in sorted(set(objtype for objtype, name in wanted)):
+        fmc.get_objects(objtype, expanded=True)
+    for (objtype, name), payload in wanted.items():
+        current = fmc.object_index.items(objtype).get(name)
+        if current is None:
+            plan.add(CREATE, "object", (objtype, name), payload)
+        else:
+            changes = _changes(payload, current)
+            if changes:
+                plan.add(UPDATE, "object", (objtype, name), payload, current, changes)
+    if prune:
+        for objtype in sorted(set(objtype for objtype, name in wanted)):
+            for name, current in sorted(fmc.object_index.items(objtype).items()):
+                if (objtype, name) not in wanted:
+                    plan.add(DELETE, "object", (objtype, name), current=current)
+
+
+def _name_networks(fmc, wanted, plan):
+    """
+    Replace the addresses and {"name", "value"} objects in the network fields
+    of the desired rules with the names of the objects standing for them:
+    existing objects of that value, or objects planned for creation. Rules
+    are then diffed by name like the others.
+    Returns the rules keyed again by policy and network name.
+    """
+    references, missing = fmc.network_references(list(wanted.values()))
+    names = dict((key, reference["name"]) for key, reference in references.items())
+    planned = set(item.key for item in plan.select(CREATE, "object"))
+    for objtype, pending in sorted(missing.items()):
+        for key, payload in pending:
+            names[key] = payload["name"]
+            if (objtype, payload["name"]) not in planned:
+                planned.add((objtype, payload["name"]))
+                plan.add(CREATE, "object", (objtype, payload["name"]), payload)
+    named = OrderedDict()
+    for payload in wanted.values():
+        payload = dict(payload)
+        for field in AUTONATRULE_NETWORK_FIELDS:
+            key = _network_key(payload.get(field))
+            if key in names:
+                payload[field] = names[key]
+        key = (payload["targetNatPolicy"], payload["originalNetwork"])
+        if key in named:
+            plan.errors.append("Several auto NAT rules of {} translate {}.".format(*key))
+        named[key] = payload
+    return named
+
+
+def _plan_autonatrules(fmc, desired, plan, prune):
+    wanted = desired["autonatrules"]
+    if wanted is None:
+        return
+    wanted = _name_networks(fmc, wanted, plan)
+    natpolicy_uuids = fmc.get_natpolicy_uuids()
+    creating = set(item.key for item in plan.select(CREATE, "natpolicy"))
+    deleting = set(item.key for item in plan.select(DELETE, "natpolicy"))
+    for objtype in AUTONATRULE_NETWORK_TYPES + (AUTONATRULE_INTERFACE_TYPE,):
+        if fmc.object_index.is_stale(objtype):
+            fmc.get_objects(objtype)
+    names = {}
+    for objtype in set(AUTONATRULE_NETWORK_TYPES + (AUTONATRULE_INTERFACE_TYPE,)) | \
+            set(OBJECTS_TYPE_ALLOWED):
+        names.update((uuid, name) for name, uuid in fmc.object_index.table(objtype).items())
+    natpolicies = set(natpolicy for natpolicy, network in wanted)
+    if prune and desired["natpolicies"] is not None:
+        natpolicies |= set(desired["natpolicies"])
+    current_rules = {}
+    for natpolicy in sorted(natpolicies - deleting):
+        if natpolicy in natpolicy_uuids:
+            for rule in fmc.get_autonatrules(natpolicy, expanded=True):
+                reference = rule.get("originalNetwork") or {}
+                network = reference.get("name") or names.get(reference.get("id"))
+                current_rules[(natpolicy, network)] = rule
+        elif natpolicy not in creating:
+            plan.errors.append("NatPolicy {} was not found.".format(natpolicy))
+    for key, payload in wanted.items():
+        current = current_rules.get(key)
+        if current is None:
+            plan.add(CREATE, "autonatrule", key, payload)
+        else:
+            changes = _rule_changes(payload, current, names)
+            if changes:
+                plan.add(UPDATE, "autonatrule", key, payload, current, changes)
+    if prune:
+        for key in sorted(set(current_rules) - set(wanted), key=str):
+            plan.add(DELETE, "autonatrule", key, current=current_rules[key])
+
+
+def plan_sync(fmc, desired, prune=False):
+    """
+    param:: fmc: FmcApiHandler.
+    param:: desired: desired state as returned by load_desired_state.
+    param:: prune: also delete what the sections of the desired state do not list.
+    Fetch the current state once (listings only) and diff it against desired.
+    """
+    plan = SyncPlan()
+    _plan_natpolicies(fmc, desired, plan, prune)
+    _plan_objects(fmc, desired, plan, prune)
+    _plan_autonatrules(fmc, desired, plan, prune)
+    return plan
+
+
+def apply_plan(fmc, plan, chunk_size=BULK_CHUNK_SIZE):
+    """
+    Issue the calls of a plan: policies and objects first, then rules, and
+    deletions of objects and policies last so rules no longer use them.
+    Returns a list of (action, status_code, result).
+    """
+    results = []
+    for item in plan.select(CREATE, "natpolicy"):
+        payload = dict(item.payload)
+        payload.setdefault("type", "FTDNatPolicy")
+        results.append((item,) + tuple(fmc.create_ftdnatpolicy(payload)))
+    for item in plan.select(UPDATE, "natpolicy"):
+        results.append((item,) + tuple(fmc.update_ftdnatpolicy(item.current["id"],
+                                                               item.payload)))
+    creates = plan.select(CREATE, "object")
+    for objtype in sorted(set(item.key[0] for item in creates)):
+        batch = [item for item in creates if item.key[0] == objtype]
+        created = fmc.create_objects_bulk(objtype, [item.payload for item in batch],
+                                          chunk_size=chunk_size)
+        results.extend((item, rcode, rval) for item, (payload, rcode, rval)
+                       in zip(batch, created))
+    for item in plan.select(UPDATE, "object"):
+        results.append((item,) + tuple(fmc.update_object(item.key[0], item.current["id"],
+                                                         item.payload)))
+    for item in plan.select(DELETE, "autonatrule"):
+        natpolicy_uuid = fmc.lookup_natpolicy_uuid(item.key[0])
+        results.append((item,) + tuple(fmc.delete_autonatrule(natpolicy_uuid,
+                                                              item.current["id"])))
+    for item in plan.select(UPDATE, "autonatrule"):
+        natpolicy_uuid, rule, errors = fmc.resolve_autonatrule(item.payload)
+        if errors:
+            results.append((item, 404, " ".join(errors)))
+            continue
+        results.append((item,) + tuple(fmc.update_autonatrule(natpolicy_uuid,
+                                                              item.current["id"], rule)))
+    creates = plan.select(CREATE, "autonatrule")
+    if creates:
+        created = fmc.create_autonatrules_bulk([item.payload for item in creates],
+                                               chunk_size=chunk_size, skip_invalid=True)
+        results.extend((item, rcode, rval) for item, (payload, rcode, rval)
+                       in zip(creates, created))
+    for item in plan.select(DELETE, "object"):
+        results.append((item,) + tuple(fmc.delete_object(item.key[0], item.current["id"])))
+    for item in plan.select(DELETE, "natpolicy"):
+        results.append((item,) + tuple(fmc.delete_ftdnatpolicy(item.current["id"])))
+    failed = sum(1 for item, rcode, rval in results if rcode not in (200, 201))
+    _LOG("Applied {} changes, {} failed.".format(len(results) - failed, failed))
+    return results
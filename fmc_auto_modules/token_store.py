@@ -0,0 +1,109 @@
+import fcntl
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+DEFAULT_TOKEN_STORE = os.path.join(
+    os.path.expanduser('~'), '.fmc_automation', 'tokens.json')
+
+# FMC access tokens are valid for 30 minutes and can be refreshed 3 times
+TOKEN_LIFETIME = 30 * 60
+TOKEN_REFRESH_MARGIN = 5 * 60
+TOKEN_MAX_REFRESH = 3
+
+
+class TokenStore(object):
+    """
+    On-disk cache of FMC tokens shared across CLI invocations.
+    Entries are keyed by host, user and domain and hold the access token,
+    the refresh token, the parsed DOMAINS header and the time it was issued.
+    """
+    def __init__(self, path=DEFAULT_TOKEN_STORE):
+        self.path = path
+        self.lockfile = '{}.lock'.format(path)
+
+    @staticmethod
+    def key(fmcserver, username, domain):
+        """
+        Key of a token entry
+        """
+        return '{}|{}|{}'.format(fmcserver, username, domain)
+
+    @contextmanager
+    def lock(self):
+        """
+        Exclusive lock so concurrent processes authenticate only once.
+        """
+        self._ensure_dir()
+        with open(self.lockfile, 'a') as lockfd:
+            fcntl.flock(lockfd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lockfd, fcntl.LOCK_UN)
+
+    def _ensure_dir(self):
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname, mode=0o700, exist_ok=True)
+
+    def _read(self):
+        try:
+            with open(self.path) as fd:
+                return json.load(fd)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _write(self, entries):
+        self._ensure_dir()
+        fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(self.path) or '.')
+        try:
+            os.fchmod(fd, 0o600)
+            with os.fdopen(fd, 'w') as tmpfd:
+                json.dump(entries, tmpfd)
+            os.replace(tmppath, self.path)
+        except Exception:
+            os.unlink(tmppath)
+            raise
+
+    def load(self, fmcserver, username, domain):
+        """
+        Return the cached entry or None
+        """
+        return self._read().get(self.key(fmcserver, username, domain))
+
+    def save(self, fmcserver, username, domain, entry):
+        """
+        Store a token entry
+        """
+        entries = self._read()
+        entries[self.key(fmcserver, username, domain)] = entry
+        self._write(entries)
+
+    def delete(self, fmcserver, username, domain):
+        """
+        Drop a token entry (e.g. after FMC rejected it)
+        """
+        entries = self._read()
+        if entries.pop(self.key(fmcserver, username, domain), None) is not None:
+            self._write(entries)
+
+
+def token_is_fresh(entry, now=None):
+    """
+    True if the access token can be used without refreshing it.
+    """
+    now = now or time.time()
+    return entry['issued_at'] + TOKEN_LIFETIME - TOKEN_REFRESH_MARGIN > now
+
+
+def token_is_refreshable(entry, now=None):
+    """
+    True if the refresh token can still be exchanged for a new access token.
+    """
+    now = now or time.time()
+    return (entry.get('refresh_token') and
+            entry.get('refresh_count', 0) < TOKEN_MAX_REFRESH and
+            entry['issued_at'] + TOKEN_LIFETIME > now)
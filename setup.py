@@ -31,12 +31,19 @@ setup(
     entry_points={
         'console_scripts': [
             'avi-create-object = fmc_auto_modules.cli.create_objects:main',
-            'avi-nat = fmc_auto_modules.cli.config_natrules:main'
+            'avi-nat = fmc_auto_modules.cli.config_natrules:main',
+            'avi-sync = fmc_auto_modules.cli.sync:main',
+            'avi-export = fmc_auto_modules.cli.export:main',
+            'avi-fmc-daemon = fmc_auto_modules.daemon:main'
         ]
     },
     packages=find_packages(),
     extras_require={
-        ':python_version == "3.7"' : ['argparse>=1.2.1']
+        ':python_version == "3.7"' : ['argparse>=1.2.1'],
+        'yaml': ['PyYAML>=5.1'],
+        'async': ['aiohttp>=3.6'],
+        'fast': ['orjson>=3.0'],
+        'parquet': ['pyarrow>=1.0']
     },
     install_requires=[
         'requests>=2.22.0,<3'
@@ -0,0 +1,43 @@
+import pytest
+import requests
+
+from fmc_auto_modules.fmc_baseapi import FmcApiHandler
+from fmc_auto_modules.logsetup import configure_logging
+from fmc_auto_modules.mockfmc import (
+    STATS_PATH,
+    MockFmcServer
+)
+from fmc_auto_modules.ratelimit import configure_rate_limiter
+
+
+@pytest.fixture(scope='session', autouse=True)
+def quiet_logging():
+    configure_logging(None, console=False)
+
+
+@pytest.fixture
+def mock_fmc():
+    """
+    Mock FMC with 50 hosts, a few networks and zones, and two NAT policies
+    of 5 rules each
+    """
+    with MockFmcServer(dataset_size=50, natpolicies=2, rules_per_policy=5) as server:
+        configure_rate_limiter(server.address, requests_per_minute=10 ** 6, burst=1000)
+        yield server
+
+
+@pytest.fixture
+def fmc(mock_fmc):
+    with FmcApiHandler(mock_fmc.address, 'admin', 'admin', scheme='http') as handler:
+        yield handler
+
+
+def request_counts(server, reset=False):
+    """
+    Requests the mock answered by endpoint, e.g. {'POST objects': 1}
+    """
+    url = 'http://{}{}'.format(server.address, STATS_PATH)
+    if reset:
+        requests.post(url)
+        return {}
+    return requests.get(url).json()['requests']
@@ -0,0 +1,66 @@
+import asyncio
+import fcntl
+import threading
+import time
+
+import pytest
+
+from fmc_auto_modules.exceptions import UnsupportedReferenceError
+from fmc_auto_modules.fmc_asyncapi import AsyncFmcApiHandler
+from fmc_auto_modules.token_store import TokenStore
+
+from conftest import request_counts
+
+
+def test_types_are_listed_concurrently(mock_fmc):
+    async def run():
+        async with AsyncFmcApiHandler(mock_fmc.address, 'admin', 'admin',
+                                      scheme='http') as fmc:
+            return await fmc.get_objects_many(['hosts', 'networks', 'interfaceobjects'])
+    request_counts(mock_fmc, reset=True)
+    hosts, networks, zones = asyncio.run(run())
+    assert len(hosts) == 50 and 'net-0' in networks and 'inside-zone' in zones
+    assert request_counts(mock_fmc)['POST token'] == 1
+
+
+def test_token_lock_does_not_block_the_loop(tmp_path, mock_fmc):
+    store = TokenStore(str(tmp_path / 'tokens.json'))
+    holder = open(store.lockfile, 'a')
+    # Another process authenticating
+    fcntl.flock(holder, fcntl.LOCK_EX)
+    released = time.time() + 0.3
+    threading.Timer(0.3, fcntl.flock, (holder, fcntl.LOCK_UN)).start()
+    ticks = []
+
+    async def tick():
+        for _ in range(10):
+            ticks.append(time.time())
+            await asyncio.sleep(0.01)
+
+    async def run():
+        fmc = AsyncFmcApiHandler(mock_fmc.address, 'admin', 'admin', scheme='http',
+                                 token_store=store)
+        ticker = asyncio.ensure_future(tick())
+        await fmc.open()
+        await fmc.close()
+        await ticker
+        return fmc.token
+    try:
+        token = asyncio.run(run())
+    finally:
+        holder.close()
+    # The other coroutines ran while the handler waited for the lock
+    assert len([when for when in ticks if when < released]) == 10
+    assert store.load(mock_fmc.address, 'admin', 'Global')['token'] == token
+
+
+def test_address_networks_are_rejected(mock_fmc):
+    async def run():
+        async with AsyncFmcApiHandler(mock_fmc.address, 'admin', 'admin',
+                                      scheme='http') as fmc:
+            await fmc.resolve_autonatrule({
+                'targetNatPolicy': 'nat-policy-0', 'originalNetwork': '10.0.0.1',
+                'translatedNetwork': 'host-2', 'sourceInterface': 'inside-zone',
+                'destinationInterface': 'outside-zone', 'natType': 'STATIC'})
+    with pytest.raises(UnsupportedReferenceError):
+        asyncio.run(run())
@@ -0,0 +1,35 @@
+import requests
+
+from conftest import request_counts
+
+
+def _hosts(count):
+    return [{'name': 'bulk-{}'.format(index), 'type': 'hosts',
+             'value': '192.0.2.{}'.format(index)} for index in range(count)]
+
+
+def test_invalid_items_are_isolated(mock_fmc, fmc):
+    payloads = _hosts(8)
+    payloads[5]['value'] = ''
+    request_counts(mock_fmc, reset=True)
+    results = fmc.create_objects_bulk('hosts', payloads, chunk_size=8)
+    assert [payload['name'] for payload, rcode, rval in results] == \
+        [payload['name'] for payload in payloads]
+    assert [rcode for payload, rcode, rval in results] == [201] * 5 + [400] + [201] * 2
+    # 8 -> 4 + 4 -> 2 + 2 -> 1 + 1: the valid halves are sent once
+    assert request_counts(mock_fmc)['POST objects'] == 7
+
+
+def test_other_failures_are_not_split(monkeypatch, fmc):
+    sent = []
+
+    def unavailable(method, uri, extra_headers=None, **kwargs):
+        sent.append(method)
+        resp = requests.models.Response()
+        resp.status_code = 503
+        resp._content = b'Service unavailable'
+        return resp
+    monkeypatch.setattr(fmc, '_send', unavailable)
+    results = fmc.create_objects_bulk('hosts', _hosts(8), chunk_size=8)
+    assert sent == ['POST']
+    assert set(rcode for payload, rcode, rval in results) == {503}
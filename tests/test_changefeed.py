@@ -0,0 +1,67 @@
+from fmc_auto_modules.changefeed import (
+    ChangeFeed,
+    events_for
+)
+
+API = 'PUT /api/fmc_config/v1/domain/e276abec-e0f2-11e3-8169-6d9ed49b625f/'
+
+
+def _keys(record):
+    return [event.key() for event in events_for(record)]
+
+
+def test_api_changes_name_the_item():
+    assert _keys({'message': API + 'object/hosts/1234-abcd Success'}) == \
+        [('hosts', None, '1234-abcd')]
+    assert _keys({'message': 'POST /api/fmc_config/v1/domain/d/object/networks?bulk=true'}) == \
+        [('networks', None, None)]
+    assert _keys({'message': API + 'policy/ftdnatpolicies/pol-1/autonatrules/rule-1'}) == \
+        [('autonatrules', 'pol-1', 'rule-1')]
+    assert _keys({'message': API + 'policy/ftdnatpolicies/pol-1'}) == \
+        [('ftdnatpolicies', None, 'pol-1')]
+    assert _keys({'message': API + 'devices/devicerecords/dev-1'}) == []
+
+
+def test_gui_changes_are_mapped_from_words():
+    assert _keys({'subsystem': 'Object', 'message': 'Host web-vip modified'}) == \
+        [('hosts', None, None)]
+    assert _keys({'subsystem': 'Policy', 'message': 'Saved NAT policy TD_nat_policy'}) == \
+        [('ftdnatpolicies', None, None), ('autonatrules', None, None)]
+    assert ('interfaceobjects', None, None) in \
+        _keys({'subsystem': 'Object', 'message': 'Edited security zone inside-zone'})
+    assert len(_keys({'subsystem': 'Object Manager', 'message': 'Objects deleted'})) > 3
+    assert _keys({'subsystem': 'Login', 'message': 'Login Success'}) == []
+    assert _keys({'subsystem': 'Object', 'message': 'Viewed hosts'}) == []
+
+
+class _AuditLog(object):
+    """
+    Stands for the handler: serves the audit records it is given
+    """
+    fmcserver = 'fmc.example.com'
+    domain = 'Global'
+
+    def __init__(self):
+        self.records = []
+
+    def get_audit_records(self, start_time, end_time=None):
+        return [record for record in self.records if int(record['time']) >= start_time]
+
+
+def test_late_records_of_the_mark_second_are_kept():
+    audit = _AuditLog()
+    feed = ChangeFeed(audit, state_path=None, since=1000)
+    audit.records.append({'id': 'a', 'time': 1000.7, 'message': API + 'object/hosts/h1'})
+    assert [event.uuid for event in feed.poll()] == ['h1']
+    # Logged later, earlier in the same second
+    audit.records.append({'id': 'b', 'time': 1000.2, 'message': API + 'object/hosts/h2'})
+    assert [event.uuid for event in feed.poll()] == ['h2']
+    assert feed.poll() == []
+
+
+def test_mark_is_persisted(tmp_path):
+    audit = _AuditLog()
+    path = str(tmp_path / 'changefeed.json')
+    audit.records.append({'id': 'a', 'time': 2000, 'message': API + 'object/hosts/h1'})
+    assert len(ChangeFeed(audit, state_path=path, since=1000).poll()) == 1
+    assert ChangeFeed(audit, state_path=path, since=1000).poll() == []
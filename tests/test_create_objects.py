@@ -0,0 +1,31 @@
+import argparse
+
+import pytest
+
+from fmc_auto_modules.cli.create_objects import create_from_file
+
+from conftest import request_counts
+
+
+def _args(path):
+    return argparse.Namespace(from_file=path, description=None, dnsresolution='IPV4_ONLY',
+                              journal=None, fmchost='mock', domain='Global',
+                              reuse_existing=True, bulk_chunk_size=100, batch_retries=0)
+
+
+@pytest.mark.parametrize('new_hosts', [1, 12])
+def test_unparsable_row_fails_alone(tmpdir, mock_fmc, fmc, new_hosts):
+    # Few values are looked up with FMC's value filter, many with the IP index
+    path = str(tmpdir.join('rows.csv'))
+    with open(path, 'w') as fd:
+        fd.write('name,type,value\n')
+        fd.write('bad,hosts,not-an-ip\n')
+        fd.write('same-as-host-3,hosts,10.0.0.3\n')
+        for index in range(new_hosts):
+            fd.write('new-{0},hosts,192.0.2.{0}\n'.format(index))
+    request_counts(mock_fmc, reset=True)
+    create_from_file(_args(path), fmc)
+    assert request_counts(mock_fmc)['POST objects'] == 1
+    names = fmc.get_objects('hosts')
+    assert all('new-{}'.format(index) in names for index in range(new_hosts))
+    assert 'bad' not in names and 'same-as-host-3' not in names
@@ -0,0 +1,68 @@
+import socket
+import threading
+
+import pytest
+
+from fmc_auto_modules.daemon import (
+    DaemonClient,
+    DaemonError,
+    DaemonHandlerProxy,
+    FmcDaemonServer
+)
+from fmc_auto_modules.exceptions import FmcNotFoundError
+
+from conftest import request_counts
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    server = FmcDaemonServer(str(tmp_path / 'daemon.sock'))
+    thread = threading.Thread(target=server.serve, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+
+
+def test_handler_stays_warm(daemon, mock_fmc):
+    request_counts(mock_fmc, reset=True)
+    for _ in range(3):
+        proxy = DaemonHandlerProxy(mock_fmc.address, 'admin', 'admin', scheme='http',
+                                   socket_path=daemon.socket_path)
+        with proxy:
+            assert len(proxy.get_objects('hosts')) == 50
+            assert proxy.lookup_object_uuid('hosts', 'host-1')
+    # One authentication for the three clients, lookups answered by the object index
+    counts = request_counts(mock_fmc)
+    assert counts['POST token'] == 1 and counts['GET objects'] == 3
+    assert DaemonClient(daemon.socket_path).request('daemon.status')['handlers'] == \
+        ['admin/Global@{}'.format(mock_fmc.address)]
+
+
+def test_remote_errors_keep_their_type(daemon, mock_fmc):
+    proxy = DaemonHandlerProxy(mock_fmc.address, 'admin', 'admin', scheme='http',
+                               socket_path=daemon.socket_path)
+    with pytest.raises(FmcNotFoundError):
+        proxy.get_autonatrules('missing-policy')
+    with pytest.raises(DaemonError):
+        proxy.close_session()
+
+
+def test_running_daemon_keeps_its_socket(daemon):
+    with pytest.raises(DaemonError):
+        FmcDaemonServer(daemon.socket_path)
+    assert DaemonClient(daemon.socket_path).request('daemon.ping') == 'pong'
+
+
+def test_stale_socket_is_replaced(tmp_path):
+    path = str(tmp_path / 'daemon.sock')
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+    server = FmcDaemonServer(path)
+    try:
+        assert server.socket_path == path
+    finally:
+        server.server_close()
+    with pytest.raises(DaemonError):
+        DaemonClient(str(tmp_path / 'missing.sock')).request('daemon.ping')
@@ -0,0 +1,55 @@
+import pytest
+
+from conftest import request_counts
+from fmc_auto_modules.deploy import DeploymentManager
+from fmc_auto_modules.fmc_baseapi import FmcApiHandler
+from fmc_auto_modules.mockfmc import MockFmcServer
+from fmc_auto_modules.ratelimit import configure_rate_limiter
+
+
+@pytest.fixture
+def deploy_fmc():
+    """
+    Mock FMC whose two devices get one NAT policy each, and whose
+    deployments take 0.2s
+    """
+    with MockFmcServer(dataset_size=50, natpolicies=2, rules_per_policy=5,
+                       deploy_time=0.2) as server:
+        configure_rate_limiter(server.address, requests_per_minute=10 ** 6, burst=1000)
+        yield server
+
+
+@pytest.fixture
+def handler(deploy_fmc):
+    with FmcApiHandler(deploy_fmc.address, 'admin', 'admin', scheme='http') as fmc:
+        yield fmc
+
+
+def test_policy_change_deploys_its_devices_once(deploy_fmc, handler):
+    natpolicy_uuid = handler.lookup_natpolicy_uuid('nat-policy-0')
+    rules = handler.get_autonatrules('nat-policy-0')
+    request_counts(deploy_fmc, reset=True)
+    with DeploymentManager(handler, poll_interval=0.05, timeout=10) as deployer:
+        for rule in rules[:3]:
+            handler.delete_autonatrule(natpolicy_uuid, rule['id'])
+    assert len(deployer.tasks) == 1
+    task = deployer.tasks[0]
+    assert task.ok and task.device_names == ['ftd-0']
+    assert request_counts(deploy_fmc)['POST deploymentrequests'] == 1
+    assert not deploy_fmc.state.undeployed and not deployer.pending
+
+
+def test_object_change_deploys_every_device(deploy_fmc, handler):
+    host_uuid = handler.lookup_object_uuid('hosts', 'host-49')
+    with DeploymentManager(handler, poll_interval=0.05, timeout=10) as deployer:
+        handler.update_object('hosts', host_uuid, {'name': 'host-49', 'value': '10.9.9.9'})
+    assert [sorted(task.device_names) for task in deployer.tasks] == [['ftd-0', 'ftd-1']]
+    assert all(task.ok for task in deployer.tasks)
+
+
+def test_nothing_to_deploy(deploy_fmc, handler):
+    request_counts(deploy_fmc, reset=True)
+    with DeploymentManager(handler, poll_interval=0.05, timeout=10) as deployer:
+        handler.get_objects('hosts')
+    assert deployer.tasks == []
+    assert 'POST deploymentrequests' not in request_counts(deploy_fmc)
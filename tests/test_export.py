@@ -0,0 +1,93 @@
+import csv
+import glob
+import os
+
+import pytest
+
+from fmc_auto_modules.exceptions import FmcError
+from fmc_auto_modules.export import (
+    PROGRESS_FILE,
+    Exporter,
+    ReferenceNames
+)
+from fmc_auto_modules.fmc_baseapi import FmcApiHandler
+from fmc_auto_modules.snapshot import SnapshotStore
+
+from conftest import request_counts
+
+
+class Interrupted(Exception):
+    pass
+
+
+def _rows(directory, collection):
+    rows = []
+    for path in sorted(glob.glob(os.path.join(directory, '{}-*.csv'.format(collection)))):
+        with open(path, newline='') as fd:
+            rows.extend(csv.DictReader(fd))
+    return rows
+
+
+def test_export_resumes_after_last_chunk(monkeypatch, tmp_path, mock_fmc, fmc):
+    directory = str(tmp_path)
+    close_chunk = Exporter._close_chunk
+    closed = []
+
+    def interrupting_close(self, chunk, state, position):
+        close_chunk(self, chunk, state, position)
+        closed.append(chunk.path)
+        if 'autonatrules' in chunk.path and len(closed) > 9:
+            raise Interrupted()
+    monkeypatch.setattr(Exporter, '_close_chunk', interrupting_close)
+    with pytest.raises(Interrupted):
+        Exporter(fmc, directory, chunk_rows=4).export()
+    state = Exporter(fmc, directory, chunk_rows=4).progress['collections']['autonatrules']
+    assert not state['done'] and state['rows'] == 4 * state['chunks']
+    monkeypatch.undo()
+
+    request_counts(mock_fmc, reset=True)
+    summary = Exporter(fmc, directory, chunk_rows=4).export()
+    assert summary['hosts'] == {'rows': 50, 'chunks': 13, 'position': None, 'done': True}
+    assert summary['autonatrules']['rows'] == 10
+    # Objects are not exported again and no table is listed for the names of references
+    counts = request_counts(mock_fmc)
+    assert 'GET objects' not in counts
+    # One GET per zone and host referenced by the rules exported after the resume
+    assert counts['GET object'] == 7
+    rules = _rows(directory, 'autonatrules')
+    assert len(rules) == len(set(rule['id'] for rule in rules)) == 10
+    assert set(rule['natPolicy'] for rule in rules) == {'nat-policy-0', 'nat-policy-1'}
+    assert rules[0]['sourceInterface'] == 'inside-zone'
+    assert rules[0]['originalNetwork'] == 'host-0'
+    assert len(_rows(directory, 'hosts')) == 50
+    assert not glob.glob(os.path.join(directory, '*.partial'))
+
+
+def test_progress_of_another_export_is_refused(tmp_path, fmc):
+    Exporter(fmc, str(tmp_path), chunk_rows=4).export(['interfaceobjects'])
+    assert os.path.exists(str(tmp_path / PROGRESS_FILE))
+    with pytest.raises(FmcError):
+        Exporter(fmc, str(tmp_path), chunk_rows=10)
+    Exporter(fmc, str(tmp_path), chunk_rows=10, restart=True)
+
+
+def test_reference_names_come_from_the_snapshot(tmp_path, mock_fmc):
+    store = SnapshotStore(str(tmp_path / 'snapshot.db'))
+    with FmcApiHandler(mock_fmc.address, 'admin', 'admin', scheme='http',
+                       snapshot=store) as fmc:
+        fmc.refresh_snapshot(['hosts', 'interfaceobjects'])
+        request_counts(mock_fmc, reset=True)
+        Exporter(fmc, str(tmp_path / 'export')).export(['autonatrules'])
+    assert 'GET object' not in request_counts(mock_fmc)
+    rules = _rows(str(tmp_path / 'export'), 'autonatrules')
+    assert set(rule['destinationInterface'] for rule in rules) == {'outside-zone'}
+
+
+def test_reference_names_are_bounded(fmc):
+    names = ReferenceNames(fmc, max_names=2)
+    for index in range(5):
+        uuid = fmc.lookup_object_uuid('hosts', 'host-{}'.format(index))
+        assert names.name({'type': 'Host', 'id': uuid}) == 'host-{}'.format(index)
+    assert len(names.names) == 2
+    assert names.name({'type': 'Host', 'id': 'unknown'}) == 'unknown'
+    assert names.name({'type': 'Host', 'id': uuid, 'name': 'given'}) == 'given'
@@ -0,0 +1,20 @@
+import logging
+
+from fmc_auto_modules.fanout import (
+    FanoutExecutor,
+    FanoutTarget
+)
+
+
+def test_failing_target_does_not_stop_the_others(caplog, mock_fmc):
+    targets = [FanoutTarget(mock_fmc.address, username='admin', password='admin'),
+               FanoutTarget(mock_fmc.address, username='admin', password='wrong'),
+               FanoutTarget(mock_fmc.address, username='admin', password='admin')]
+    executor = FanoutExecutor(per_host=1, scheme='http')
+    with caplog.at_level(logging.INFO):
+        results = executor.run(targets, lambda fmc: len(fmc.get_objects('hosts')))
+    assert [result.ok for result in results] == [True, False, True]
+    assert [result.value for result in results] == [50, None, 50]
+    assert results[1].as_dict()['error']
+    assert [record.levelno for record in caplog.records
+            if record.getMessage().startswith(targets[1].label)] == [logging.ERROR]
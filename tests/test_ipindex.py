@@ -0,0 +1,49 @@
+from fmc_auto_modules.ipindex import (
+    ObjectIpIndex,
+    parse_interval
+)
+
+OBJECTS = [
+    {'name': 'web', 'type': 'Host', 'value': '10.1.1.10'},
+    {'name': 'web-32', 'type': 'Network', 'value': '10.1.1.10/32'},
+    {'name': 'web-range', 'type': 'Range', 'value': '10.1.1.10-10.1.1.10'},
+    {'name': 'lan', 'type': 'Network', 'value': '10.1.1.0/24'},
+    {'name': 'lan-hosts', 'type': 'Range', 'value': '10.1.1.1-10.1.1.254'},
+    {'name': 'dmz', 'type': 'Network', 'value': '10.1.2.0/24'},
+    {'name': 'v6', 'type': 'Network', 'value': '2001:db8::/64'},
+    {'name': 'v6-host', 'type': 'Host', 'value': '2001:db8::1'},
+    {'name': 'bad', 'type': 'Host', 'value': 'not-an-address'},
+]
+
+
+def _names(items):
+    return sorted(item['name'] for item in items)
+
+
+def test_parse_interval():
+    assert parse_interval('10.0.0.1') == (4, 167772161, 167772161)
+    assert parse_interval('10.0.0.1/24') == (4, 167772160, 167772415)
+    assert parse_interval('10.0.0.9-10.0.0.1') is None
+    assert parse_interval('10.0.0.1-2001:db8::1') is None
+    assert parse_interval('2001:db8::/127')[0] == 6
+    assert parse_interval('www.example.com') is None
+    assert parse_interval(None) is None
+
+
+def test_equal_containing_overlapping():
+    index = ObjectIpIndex(OBJECTS)
+    assert len(index) == 8 and _names(index.unparsed) == ['bad']
+    assert _names(index.equal('10.1.1.10')) == ['web', 'web-32', 'web-range']
+    assert _names(index.equal('10.1.1.0-10.1.1.255')) == ['lan']
+    assert _names(index.containing('10.1.1.10')) == \
+        ['lan', 'lan-hosts', 'web', 'web-32', 'web-range']
+    assert _names(index.containing('10.1.1.0/25')) == ['lan']
+    assert _names(index.overlapping('10.1.1.255-10.1.2.0')) == ['dmz', 'lan']
+    assert index.overlapping('10.1.3.0/24') == []
+    assert _names(index.containing('2001:db8::1')) == ['v6', 'v6-host']
+    assert _names(index.overlapping('2001:db8:0:1::/64')) == []
+
+
+def test_duplicates():
+    groups = ObjectIpIndex(OBJECTS).duplicates()
+    assert [_names(group) for group in groups] == [['web', 'web-32', 'web-range']]
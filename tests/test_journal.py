@@ -0,0 +1,67 @@
+import pytest
+
+from fmc_auto_modules.exceptions import FmcError
+from fmc_auto_modules.journal import (
+    DONE,
+    PENDING,
+    BatchJournal,
+    object_lookup,
+    run_batch
+)
+
+from conftest import request_counts
+
+
+def _hosts(count):
+    return [{'name': 'batch-{}'.format(index), 'type': 'hosts',
+             'value': '198.51.100.{}'.format(index)} for index in range(count)]
+
+
+def test_rerun_skips_done_items(tmp_path, mock_fmc, fmc):
+    path = str(tmp_path / 'batch.journal')
+    payloads = _hosts(10)
+    chunks = []
+
+    def failing_send(chunk):
+        chunks.append(chunk)
+        if len(chunks) == 2:
+            raise FmcError('FMC went away')
+        return fmc.create_objects_bulk('hosts', chunk)
+    with BatchJournal(path) as journal:
+        with pytest.raises(FmcError):
+            run_batch(journal, 'hosts', payloads, failing_send, chunk_size=5)
+        assert journal.counts() == {DONE: 5, 'failed': 5}
+
+    request_counts(mock_fmc, reset=True)
+    with BatchJournal(path) as journal:
+        results = run_batch(journal, 'hosts', payloads,
+                            lambda chunk: fmc.create_objects_bulk('hosts', chunk), chunk_size=5)
+        assert journal.counts() == {DONE: 10}
+    assert [rcode for payload, rcode, rval in results] == [201] * 10
+    assert [bool(rval.get('journaled')) for payload, rcode, rval in results] == \
+        [True] * 5 + [False] * 5
+    assert request_counts(mock_fmc)['POST objects'] == 1
+
+
+def test_pending_items_are_looked_up(tmp_path, mock_fmc, fmc):
+    path = str(tmp_path / 'batch.journal')
+    payloads = _hosts(4)
+
+    def crashing_send(chunk):
+        # FMC created the objects, the run died before journaling the answer
+        fmc.create_objects_bulk('hosts', chunk)
+        raise KeyboardInterrupt
+    with BatchJournal(path) as journal:
+        with pytest.raises(KeyboardInterrupt):
+            run_batch(journal, 'hosts', payloads, crashing_send)
+        assert journal.counts() == {PENDING: 4}
+
+    request_counts(mock_fmc, reset=True)
+    fmc.object_index.invalidate('hosts')
+    with BatchJournal(path) as journal:
+        results = run_batch(journal, 'hosts', payloads,
+                            lambda chunk: fmc.create_objects_bulk('hosts', chunk),
+                            lookup=object_lookup(fmc))
+        assert journal.counts() == {DONE: 4}
+    assert all(rval.get('journaled') for payload, rcode, rval in results)
+    assert 'POST objects' not in request_counts(mock_fmc)
@@ -0,0 +1,56 @@
+import io
+import threading
+
+import pytest
+
+from fmc_auto_modules.fmc_baseapi import _LOG
+from fmc_auto_modules.logsetup import (
+    configure_logging,
+    flush_logging
+)
+
+
+@pytest.fixture
+def log_to(tmp_path):
+    """
+    Configure logging to a file and a console buffer, quiet again afterwards
+    """
+    console = io.StringIO()
+    logfile = str(tmp_path / 'fmc.log')
+
+    def configure(level):
+        configure_logging(logfile, level=level, console=True, console_stream=console)
+        return logfile, console
+    yield configure
+    configure_logging(None, console=False)
+
+
+def test_handler_calls_are_logged_in_the_background(log_to, fmc):
+    logfile, console = log_to('info')
+    host_uuid = fmc.lookup_object_uuid('hosts', 'host-49')
+    assert fmc.delete_object('hosts', host_uuid)[0] == 200
+    _LOG("Hidden", "debug")
+    _LOG("Shown", "error")
+    flush_logging()
+    lines = open(logfile).read().splitlines()
+    message = "Deleting {} of type=hosts".format(host_uuid)
+    assert any(line.endswith(message) and ' INFO ' in line for line in lines)
+    assert any(line.endswith('Shown') and ' ERROR ' in line for line in lines)
+    assert not any('Hidden' in line for line in lines)
+    assert message in console.getvalue().splitlines()
+
+
+def test_writer_thread_takes_the_records_from_the_callers(log_to, fmc, monkeypatch):
+    logfile, console = log_to('debug')
+    writers = set()
+    write = console.write
+
+    def tracked_write(text):
+        writers.add(threading.current_thread())
+        return write(text)
+    monkeypatch.setattr(console, 'write', tracked_write)
+    fmc.get_objects('hosts')
+    _LOG("Done", "debug")
+    flush_logging()
+    assert 'Done' in console.getvalue().splitlines()
+    assert writers and threading.current_thread() not in writers
@@ -0,0 +1,67 @@
+import argparse
+import json
+
+from fmc_auto_modules.cli import common
+from fmc_auto_modules.cli.common import (
+    add_client_arguments,
+    add_connection_arguments,
+    add_output_arguments,
+    handler_from_args,
+    report_stats
+)
+from fmc_auto_modules.daemon import DaemonHandlerProxy
+
+OBJECTS = 'GET /api/fmc_config/v1/domain/{domain}/object/hosts'
+
+
+def _parse(argv, daemon=False):
+    parser = argparse.ArgumentParser()
+    add_connection_arguments(parser)
+    add_client_arguments(parser, daemon=daemon)
+    add_output_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def test_requests_are_recorded_per_endpoint(fmc):
+    fmc.get_objects('hosts')
+    uuid = fmc.lookup_object_uuid('hosts', 'host-1')
+    fmc.update_object('hosts', uuid, {'name': 'host-1', 'type': 'Host', 'value': '10.0.0.1'})
+    snapshot = fmc.metrics.snapshot()
+    assert snapshot['endpoints'][OBJECTS]['count'] == 1
+    assert snapshot['endpoints'][OBJECTS]['statuses'] == {'200': 1}
+    assert snapshot['endpoints'][OBJECTS]['bytes_in'] > 0
+    assert snapshot['endpoints']['PUT {}/{{id}}'.format(OBJECTS[4:])]['count'] == 1
+    assert snapshot['operations']['token_generate']['count'] == 1
+    assert 'object_index_refresh:hosts' in snapshot['operations']
+
+
+def test_report_stats_writes_metrics_files(tmp_path, fmc):
+    fmc.get_objects('hosts')
+    for name in ('metrics.prom', 'metrics.json'):
+        path = str(tmp_path / name)
+        report_stats(_parse(['--fmchost', 'h', '-u', 'u', '-p', 'p', '--metrics-file', path]),
+                     fmc)
+        with open(path) as fd:
+            content = fd.read()
+        if name.endswith('.prom'):
+            assert 'fmc_api_requests_total{{method="GET",endpoint="{}",status="200"}} 1'.format(
+                OBJECTS[4:]) in content
+        else:
+            assert json.loads(content)['endpoints'][OBJECTS]['count'] == 1
+
+
+def test_handler_from_args(monkeypatch):
+    made = []
+    monkeypatch.setattr(common, 'FAH', lambda *args, **kwargs: made.append((args, kwargs)))
+    handler_from_args(_parse(['--fmchost', 'fmc.example', '-u', 'u', '-p', 'p',
+                              '--no-token-cache', '--response-cache', '--sslverify', 'ca.pem']))
+    handler_from_args(_parse(['--fmchost', 'fmc.example', '-u', 'u', '-p', 'p']))
+    (args, kwargs), (default_args, default_kwargs) = made
+    assert args == ('fmc.example', 'u', 'p', 'Global', 'ca.pem')
+    assert kwargs['token_store'] is None and kwargs['response_cache'].path is None
+    assert default_args[4] is False and default_kwargs['response_cache'] is None
+    assert default_kwargs['token_store'] is not None
+    proxy = handler_from_args(_parse(['--fmchost', 'fmc.example', '-u', 'u', '-p', 'p',
+                                      '--daemon', '/tmp/d.sock'], daemon=True))
+    assert isinstance(proxy, DaemonHandlerProxy) and len(made) == 2
+    assert proxy.client.socket_path == '/tmp/d.sock'
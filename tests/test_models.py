@@ -0,0 +1,38 @@
+import io
+
+from fmc_auto_modules import fastjson
+from fmc_auto_modules.models import (
+    AutoNatRule,
+    NetworkObject,
+    Reference,
+    to_plain
+)
+
+
+def test_object_models_match_the_listing(fmc):
+    plain = list(fmc.iter_objects('hosts', expanded=True))
+    models = list(fmc.iter_objects('hosts', expanded=True, models=True))
+    assert all(isinstance(model, NetworkObject) for model in models)
+    assert [model.to_dict() for model in models] == plain
+    host = models[0]
+    assert host['value'] == plain[0]['value'] and host.get('missing') is None
+    assert dict(host) == plain[0] and len(host) == len(plain[0])
+    assert not hasattr(host, '__dict__')
+
+
+def test_rule_models_keep_their_references(fmc):
+    plain = fmc.get_autonatrules('nat-policy-0', expanded=True)
+    rules = fmc.get_autonatrules('nat-policy-0', expanded=True, models=True)
+    assert all(isinstance(rule, AutoNatRule) for rule in rules)
+    assert isinstance(rules[0].originalNetwork, Reference)
+    assert rules[0]['originalNetwork']['id'] == plain[0]['originalNetwork']['id']
+    assert to_plain({'items': rules}) == {'items': plain}
+
+
+def test_ndjson_streams_models_and_dictionaries(fmc):
+    hosts = fmc.iter_objects('hosts', expanded=True, models=True)
+    fd = io.StringIO()
+    assert fastjson.write_ndjson(hosts, fd) == 50
+    records = [fastjson.loads(line) for line in fd.getvalue().splitlines()]
+    assert records == list(fmc.iter_objects('hosts', expanded=True))
+    assert fastjson.loads(fastjson.dumps({'a': [1, None]}).encode()) == {'a': [1, None]}
@@ -0,0 +1,77 @@
+from fmc_auto_modules.nat_analyzer import (
+    CONFLICT,
+    DUPLICATE,
+    OVERLAP,
+    TRANSLATED_OVERLAP,
+    NatRuleAnalyzer
+)
+
+VALUES = {
+    'web': '10.1.1.10',
+    'web-range': '10.1.1.10-10.1.1.10',
+    'lan': '10.1.1.0/24',
+    'dmz': '10.1.2.0/24',
+    'pub-1': '198.51.100.1',
+    'pub-2': '198.51.100.2',
+    'pub-net': '198.51.100.0/30',
+}
+
+
+def _rule(rule_id, original, translated, source='inside', destination='outside', **fields):
+    rule = {'id': rule_id, 'natType': 'STATIC',
+            'originalNetwork': {'id': original}, 'translatedNetwork': {'id': translated},
+            'sourceInterface': {'id': source} if source else None,
+            'destinationInterface': {'id': destination} if destination else None}
+    rule.update(fields)
+    return rule
+
+
+def _kinds(conflicts):
+    return sorted((conflict['kind'], tuple(sorted(conflict['rules']))) for conflict in conflicts)
+
+
+def test_conflicts():
+    rules = [
+        _rule('r1', 'web', 'pub-1'),
+        _rule('r2', 'web-range', 'pub-1'),      # same addresses as r1
+        _rule('r3', 'web', 'pub-2'),            # same original, other translation
+        _rule('r4', 'lan', 'pub-net'),          # covers web, translated overlaps pub-1/2
+        _rule('r5', 'dmz', 'pub-1', source='dmz'),
+        _rule('r6', 'missing', 'pub-1'),
+    ]
+    analyzer = NatRuleAnalyzer(rules, VALUES)
+    assert [rule['id'] for rule in analyzer.unresolved] == ['r6']
+    kinds = _kinds(analyzer.conflicts())
+    assert (DUPLICATE, ('r1', 'r2')) in kinds
+    assert (CONFLICT, ('r1', 'r3')) in kinds
+    assert (CONFLICT, ('r2', 'r3')) in kinds
+    assert (OVERLAP, ('r1', 'r4')) in kinds
+    assert (TRANSLATED_OVERLAP, ('r1', 'r4')) in kinds
+    assert (TRANSLATED_OVERLAP, ('r1', 'r5')) in kinds
+    # Other interface pair and original network: only the translation meets r1-r4
+    assert not [kind for kind in kinds if kind[0] != TRANSLATED_OVERLAP and 'r5' in kind[1]]
+
+
+def test_any_interface_meets_specific_pairs():
+    rules = [_rule('r1', 'web', 'pub-1'), _rule('r2', 'lan', 'pub-2', source=None)]
+    assert (OVERLAP, ('r1', 'r2')) in _kinds(NatRuleAnalyzer(rules, VALUES).conflicts())
+    rules = [_rule('r1', 'web', 'pub-1'), _rule('r2', 'lan', 'pub-2', source='dmz')]
+    assert _kinds(NatRuleAnalyzer(rules, VALUES).conflicts()) == []
+
+
+def test_services_are_compared_separately():
+    rules = [_rule('r1', 'web', 'pub-1', serviceProtocol='TCP', originalPort=80),
+             _rule('r2', 'web', 'pub-1', serviceProtocol='TCP', originalPort=443)]
+    assert (DUPLICATE, ('r1', 'r2')) not in _kinds(NatRuleAnalyzer(rules, VALUES).conflicts())
+
+
+def test_check_new_rule():
+    analyzer = NatRuleAnalyzer([_rule('r1', 'lan', 'pub-net')], VALUES)
+    new = _rule(None, 'web', 'pub-2')
+    assert sorted(conflict['kind'] for conflict in analyzer.check(new, VALUES)) == \
+        [OVERLAP, TRANSLATED_OVERLAP]
+    # Other interface pair: only the translated addresses are compared
+    assert [conflict['kind'] for conflict in
+            analyzer.check(_rule(None, 'dmz', 'pub-2', source='dmz'), VALUES)] == \
+        [TRANSLATED_OVERLAP]
+    assert analyzer.check(_rule(None, 'missing', 'pub-2'), VALUES) == []
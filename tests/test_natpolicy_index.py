@@ -0,0 +1,28 @@
+from conftest import request_counts
+
+
+def test_policy_lookups_share_one_listing(mock_fmc, fmc):
+    request_counts(mock_fmc, reset=True)
+    uuids = [fmc.lookup_natpolicy_uuid('nat-policy-{}'.format(index)) for index in range(2)]
+    assert all(uuids) and fmc.lookup_natpolicy_uuid('missing') is None
+    assert len(fmc.get_autonatrules('nat-policy-0')) == 5
+    assert request_counts(mock_fmc) == {'GET natpolicies': 1, 'GET autonatrules': 1}
+
+
+def test_selected_policies_are_expanded_alone(mock_fmc, fmc):
+    request_counts(mock_fmc, reset=True)
+    policies = fmc.get_ftdnatpolicies(expanded=True, natpolicies=['nat-policy-1', 'missing'])
+    assert [policy['name'] for policy in policies] == ['nat-policy-1']
+    assert request_counts(mock_fmc) == {'GET natpolicies': 1, 'GET natpolicy': 1}
+    listed = fmc.get_ftdnatpolicies(natpolicies=['nat-policy-0'])
+    assert [policy['name'] for policy in listed] == ['nat-policy-0']
+    assert request_counts(mock_fmc) == {'GET natpolicies': 1, 'GET natpolicy': 1}
+
+
+def test_selected_rules_are_expanded_alone(mock_fmc, fmc):
+    rule_ids = [rule['id'] for rule in fmc.get_autonatrules('nat-policy-0')][:2]
+    request_counts(mock_fmc, reset=True)
+    rules = fmc.get_autonatrules('nat-policy-0', expanded=True, rule_ids=rule_ids)
+    assert [rule['id'] for rule in rules] == rule_ids
+    assert all(rule.get('originalNetwork') for rule in rules)
+    assert request_counts(mock_fmc) == {'GET autonatrule': 2}
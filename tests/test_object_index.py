@@ -0,0 +1,39 @@
+import time
+
+from fmc_auto_modules.fmc_baseapi import FmcApiHandler
+
+from conftest import request_counts
+
+
+def test_lookups_share_one_listing(mock_fmc, fmc):
+    request_counts(mock_fmc, reset=True)
+    uuids = [fmc.lookup_object_uuid('hosts', 'host-{}'.format(index)) for index in range(20)]
+    assert all(uuids) and len(set(uuids)) == 20
+    assert fmc.lookup_object_uuid('hosts', 'missing') is None
+    assert request_counts(mock_fmc) == {'GET objects': 1}
+
+
+def test_writes_keep_the_index_current(mock_fmc, fmc):
+    fmc.lookup_object_uuid('hosts', 'host-0')
+    rcode, created = fmc.create_object({'name': 'indexed', 'type': 'hosts',
+                                        'value': '192.0.2.1'})
+    assert rcode == 201
+    fmc.delete_object('hosts', fmc.lookup_object_uuid('hosts', 'host-49'))
+    request_counts(mock_fmc, reset=True)
+    assert fmc.lookup_object_uuid('hosts', 'indexed') == created['id']
+    assert fmc.lookup_object_uuid('hosts', 'host-49') is None
+    assert 'GET objects' not in request_counts(mock_fmc)
+
+
+def test_tables_expire_per_type(mock_fmc):
+    with FmcApiHandler(mock_fmc.address, 'admin', 'admin', scheme='http',
+                       object_index_ttl=0.05, object_index_ttls={'interfaceobjects': None}) \
+            as fmc:
+        fmc.lookup_object_uuid('hosts', 'host-0')
+        fmc.lookup_object_uuid('interfaceobjects', 'inside-zone')
+        time.sleep(0.1)
+        request_counts(mock_fmc, reset=True)
+        fmc.lookup_object_uuid('hosts', 'host-0')
+        fmc.lookup_object_uuid('interfaceobjects', 'inside-zone')
+        assert request_counts(mock_fmc) == {'GET objects': 1}
+        assert not fmc.object_index.is_stale('interfaceobjects')
@@ -0,0 +1,43 @@
+import pytest
+import requests
+
+from fmc_auto_modules.exceptions import FmcError
+
+from conftest import request_counts
+
+
+def test_pages_are_fetched_as_they_are_consumed(mock_fmc, fmc):
+    request_counts(mock_fmc, reset=True)
+    objects = fmc.iter_objects('hosts', page_size=7, expanded=True)
+    first = next(objects)
+    assert first['name'] == 'host-0' and first['value'] == '10.0.0.0'
+    assert request_counts(mock_fmc) == {'GET objects': 1}
+    names = [first['name']] + [item['name'] for item in objects]
+    assert names == ['host-{}'.format(index) for index in range(50)]
+    assert request_counts(mock_fmc) == {'GET objects': 8}
+
+
+def test_listing_resumes_at_offset(fmc):
+    names = [item['name'] for item in fmc.iter_objects('hosts', page_size=20, offset=45)]
+    assert names == ['host-{}'.format(index) for index in range(45, 50)]
+
+
+def test_failed_page(monkeypatch, fmc):
+    send = fmc._request
+    calls = []
+
+    def failing_second_page(method, uri, **kwargs):
+        calls.append(uri)
+        if len(calls) == 2:
+            resp = requests.models.Response()
+            resp.status_code = 500
+            resp._content = b'{}'
+            resp.url = uri
+            resp.request = requests.Request(method, uri).prepare()
+            return resp
+        return send(method, uri, **kwargs)
+    monkeypatch.setattr(fmc, '_request', failing_second_page)
+    assert len(list(fmc.iter_objects('hosts', page_size=10))) == 10
+    del calls[:]
+    with pytest.raises(FmcError):
+        list(fmc.iter_objects('hosts', page_size=10, strict=True))
@@ -0,0 +1,41 @@
+from conftest import request_counts
+
+
+def rule(original, translated):
+    return {'targetNatPolicy': 'nat-policy-0', 'natType': 'STATIC',
+            'originalNetwork': original, 'translatedNetwork': translated,
+            'sourceInterface': 'inside-zone', 'destinationInterface': 'outside-zone'}
+
+
+def test_rule_reuses_equal_objects_and_creates_the_missing(mock_fmc, fmc):
+    host_uuid = fmc.lookup_object_uuid('hosts', 'host-5')
+    request_counts(mock_fmc, reset=True)
+    rcode, created = fmc.create_autonatrule(rule('10.0.0.5', '192.0.2.10'), provision=True)
+    assert rcode == 201
+    assert created['originalNetwork']['id'] == host_uuid
+    new_uuid = fmc.lookup_object_uuid('hosts', 'host_192.0.2.10')
+    assert new_uuid and created['translatedNetwork']['id'] == new_uuid
+    assert request_counts(mock_fmc)['POST objects'] == 1
+
+
+def test_batch_creates_each_type_in_one_request(mock_fmc, fmc):
+    payloads = [rule('198.51.100.{}'.format(index), {'name': 'web-nat',
+                                                    'value': '203.0.113.0/24'})
+                for index in range(4)]
+    request_counts(mock_fmc, reset=True)
+    results = fmc.create_autonatrules_bulk(payloads, provision=True)
+    assert [rcode for _, rcode, _ in results] == [201] * 4
+    counts = request_counts(mock_fmc)
+    # One request for the hosts, one for the network, one for the rules
+    assert counts['POST objects'] == 2 and counts['POST autonatrules'] == 1
+    assert fmc.lookup_object_uuid('networks', 'web-nat')
+    references = fmc.resolve_network_references(payloads)
+    assert sorted(references) == ['198.51.100.{}'.format(index) for index in range(4)] + \
+        ['web-nat']
+
+
+def test_nothing_is_created_without_provisioning(mock_fmc, fmc):
+    request_counts(mock_fmc, reset=True)
+    rcode, errors = fmc.create_autonatrule(rule('192.0.2.20', 'host-1'))
+    assert rcode == 404 and '192.0.2.20' in errors
+    assert 'POST objects' not in request_counts(mock_fmc)
@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+from fmc_auto_modules.fmc_baseapi import (
+    SERVER_VERSION_URI,
+    FmcApiHandler
+)
+from fmc_auto_modules.mockfmc import MockFmcRequestHandler
+from fmc_auto_modules.ratelimit import (
+    RateLimiter,
+    retry_after_seconds
+)
+
+VERSION = 'GET /api/fmc_platform/v1/info/serverversion'
+
+
+@pytest.fixture
+def throttle(monkeypatch):
+    """
+    Make the mock answer 429 (Retry-After: 0.2) to the next count requests
+    """
+    remaining = []
+
+    def throttled(handler):
+        if remaining:
+            remaining.pop()
+            handler._error(429, 'Too many requests', {'Retry-After': '0.2'})
+            return True
+        return False
+    monkeypatch.setattr(MockFmcRequestHandler, '_throttled', throttled)
+    return lambda count: remaining.extend([None] * count)
+
+
+def test_throttled_requests_are_replayed(throttle, fmc):
+    fmc.get_version()
+    throttle(2)
+    started = time.monotonic()
+    assert fmc.get_version()
+    assert time.monotonic() - started >= 0.4
+    assert fmc.metrics.snapshot()['endpoints'][VERSION]['statuses'] == {'200': 2, '429': 2}
+
+
+def test_retries_are_bounded(throttle, mock_fmc):
+    with FmcApiHandler(mock_fmc.address, 'admin', 'admin', scheme='http',
+                       throttle_retries=1) as fmc:
+        throttle(5)
+        assert fmc._request('GET', SERVER_VERSION_URI).status_code == 429
+        assert fmc.metrics.snapshot()['endpoints'][VERSION]['statuses'] == {'429': 2}
+
+
+def test_token_bucket():
+    limiter = RateLimiter(requests_per_minute=600, burst=2)
+    assert [limiter.reserve() for _ in range(2)] == [0.0, 0.0]
+    assert limiter.reserve() == pytest.approx(0.1, abs=0.02)
+    limiter.pause(5)
+    assert limiter.reserve() > 4
+    assert retry_after_seconds('3') == 3.0 and retry_after_seconds('soon') is None
@@ -0,0 +1,53 @@
+import threading
+import time
+
+from fmc_auto_modules.fmc_baseapi import FmcApiHandler
+from fmc_auto_modules.mockfmc import MockFmcServer
+from fmc_auto_modules.ratelimit import configure_rate_limiter
+from fmc_auto_modules.response_cache import ResponseCache
+
+from conftest import request_counts
+
+
+def test_concurrent_gets_are_sent_once():
+    cache = ResponseCache()
+    with MockFmcServer(dataset_size=10, latency=0.2) as server:
+        configure_rate_limiter(server.address, requests_per_minute=10 ** 6, burst=1000)
+        with FmcApiHandler(server.address, 'admin', 'admin', scheme='http',
+                           response_cache=cache) as fmc:
+            fmc.get_version()
+            request_counts(server, reset=True)
+            cache.stats = dict.fromkeys(cache.stats, 0)
+            names = []
+            threads = [threading.Thread(target=lambda: names.append(fmc.get_objects('hosts')))
+                       for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert request_counts(server)['GET objects'] == 1
+    assert len(names) == 8 and all(len(mapping) == 10 for mapping in names)
+    assert cache.stats['misses'] == 1
+    assert cache.stats['misses'] + cache.stats['shared'] + cache.stats['hits'] == 8
+
+
+def test_expired_response_is_revalidated(mock_fmc):
+    cache = ResponseCache(ttl=0.05)
+    with FmcApiHandler(mock_fmc.address, 'admin', 'admin', scheme='http',
+                       response_cache=cache) as fmc:
+        first = fmc.get_objects('hosts')
+        assert fmc.get_objects('hosts') == first and cache.stats['hits'] == 1
+        time.sleep(0.1)
+        assert fmc.get_objects('hosts') == first
+        assert cache.stats['revalidated'] == 1
+
+
+def test_writes_drop_the_cached_collection(mock_fmc):
+    cache = ResponseCache()
+    with FmcApiHandler(mock_fmc.address, 'admin', 'admin', scheme='http',
+                       response_cache=cache) as fmc:
+        fmc.get_objects('hosts')
+        fmc.create_object({'name': 'cached-host', 'type': 'hosts', 'value': '192.0.2.1'})
+        fmc.object_index.invalidate()
+        assert 'cached-host' in fmc.get_objects('hosts')
+        assert cache.stats['invalidated'] >= 1
@@ -0,0 +1,51 @@
+import time
+
+from fmc_auto_modules.fmc_baseapi import FmcApiHandler
+from fmc_auto_modules.snapshot import SnapshotStore
+
+from conftest import request_counts
+
+
+def _handler(mock_fmc, store, offline=False):
+    return FmcApiHandler(mock_fmc.address, 'admin', 'admin', scheme='http', snapshot=store,
+                         offline=offline)
+
+
+def test_value_edited_in_place_is_refreshed(tmp_path, mock_fmc, fmc):
+    store = SnapshotStore(str(tmp_path / 'snapshot.db'))
+    with _handler(mock_fmc, store) as handler:
+        counts = handler.refresh_snapshot(['hosts'])
+        assert counts['hosts'] == (50, 0) and counts['autonatrules'][0] == 10
+        uuid = handler.lookup_object_uuid('hosts', 'host-1')
+        time.sleep(0.01)
+        fmc.update_object('hosts', uuid, {'name': 'host-1', 'type': 'Host',
+                                          'value': '192.0.2.1'})
+        # The rename-only comparison does not see the new value
+        assert handler.refresh_snapshot(['hosts'], ids_only=True)['hosts'] == (0, 0)
+        assert handler.refresh_snapshot(['hosts'])['hosts'] == (1, 0)
+        assert handler.refresh_snapshot(['hosts'], full=True)['hosts'] == (50, 0)
+    scope = SnapshotStore.scope(mock_fmc.address, 'Global')
+    assert [item['name'] for item in store.find(scope, value='192.0.2.1')] == ['host-1']
+
+
+def test_ids_only_refresh_sees_additions_and_deletions(tmp_path, mock_fmc, fmc):
+    store = SnapshotStore(str(tmp_path / 'snapshot.db'))
+    with _handler(mock_fmc, store) as handler:
+        handler.refresh_snapshot(['hosts'])
+        fmc.create_object({'name': 'added', 'type': 'hosts', 'value': '192.0.2.2'})
+        fmc.delete_object('hosts', fmc.lookup_object_uuid('hosts', 'host-49'))
+        request_counts(mock_fmc, reset=True)
+        assert handler.refresh_snapshot(['hosts'], ids_only=True)['hosts'] == (1, 1)
+        # The new host is fetched alone, not with the expanded listing
+        assert request_counts(mock_fmc)['GET object'] == 1
+
+
+def test_offline_answers_from_the_snapshot(tmp_path, mock_fmc):
+    path = str(tmp_path / 'snapshot.db')
+    with _handler(mock_fmc, SnapshotStore(path)) as handler:
+        handler.refresh_snapshot(['hosts', 'interfaceobjects'])
+    request_counts(mock_fmc, reset=True)
+    with _handler(mock_fmc, SnapshotStore(path), offline=True) as handler:
+        assert len(handler.get_objects('hosts')) == 50
+        assert len(handler.get_autonatrules('nat-policy-1')) == 5
+    assert request_counts(mock_fmc) == {}
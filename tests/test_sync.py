@@ -0,0 +1,66 @@
+import argparse
+import logging
+
+from fmc_auto_modules.cli.sync import sync
+from fmc_auto_modules.sync import (
+    apply_plan,
+    load_desired_state,
+    plan_sync
+)
+
+from conftest import request_counts
+
+DESIRED = """
+objects:
+  - {name: test_avi_vip, type: hosts, value: 1.1.2.2}
+  - {name: host-1, type: hosts, value: 10.0.0.1, description: updated}
+natpolicies:
+  - {name: TD_nat_policy, description: managed by avi-sync}
+autonatrules:
+  - {targetNatPolicy: TD_nat_policy, originalNetwork: test_avi_vip, translatedNetwork: host-2,
+     sourceInterface: inside-zone, destinationInterface: outside-zone, natType: STATIC}
+  - {targetNatPolicy: nat-policy-0, originalNetwork: 7.7.7.7,
+     translatedNetwork: {name: public_vip, value: 198.51.100.9},
+     sourceInterface: inside-zone, destinationInterface: outside-zone, natType: STATIC}
+  - {targetNatPolicy: nat-policy-0, originalNetwork: 10.0.0.5, translatedNetwork: 172.16.0.0/24,
+     sourceInterface: inside-zone, destinationInterface: outside-zone, natType: STATIC}
+"""
+
+
+def test_second_plan_is_empty(tmp_path, mock_fmc, fmc):
+    path = tmp_path / 'desired.yaml'
+    path.write_text(DESIRED)
+    plan = plan_sync(fmc, load_desired_state(str(path)))
+    assert not plan.errors
+    assert dict(plan.counts()) == {'create': 7, 'update': 1, 'delete': 0}
+    results = apply_plan(fmc, plan)
+    assert [rcode for action, rcode, rval in results if rcode not in (200, 201)] == []
+
+    request_counts(mock_fmc, reset=True)
+    plan = plan_sync(fmc, load_desired_state(str(path)))
+    assert len(plan) == 0 and not plan.errors
+    assert not [endpoint for endpoint in request_counts(mock_fmc)
+                if not endpoint.startswith('GET')]
+
+
+def test_address_matches_existing_object(tmp_path, fmc):
+    path = tmp_path / 'desired.yaml'
+    path.write_text(DESIRED)
+    plan = plan_sync(fmc, load_desired_state(str(path)))
+    keys = [action.key for action in plan.select('create', 'autonatrule')]
+    # 10.0.0.5 is host-5 and 172.16.0.0/24 net-0, 7.7.7.7 gets its own host
+    assert ('nat-policy-0', 'host-5') in keys
+    assert ('nat-policy-0', 'host_7.7.7.7') in keys
+    assert ('hosts', 'host_7.7.7.7') in [action.key for action in plan.select('create', 'object')]
+
+
+def test_plan_errors_change_nothing(caplog, tmp_path, mock_fmc, fmc):
+    path = tmp_path / 'desired.yaml'
+    path.write_text(DESIRED.replace('nat-policy-0', 'missing-policy'))
+    request_counts(mock_fmc, reset=True)
+    with caplog.at_level(logging.INFO):
+        assert not sync(argparse.Namespace(prune=False), fmc, load_desired_state(str(path)))
+    assert [record.levelno for record in caplog.records
+            if 'Nothing was changed' in record.getMessage()] == [logging.ERROR]
+    assert not [endpoint for endpoint in request_counts(mock_fmc)
+                if not endpoint.startswith('GET')]
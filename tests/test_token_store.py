@@ -0,0 +1,52 @@
+import os
+import stat
+
+from fmc_auto_modules.fmc_baseapi import FmcApiHandler
+from fmc_auto_modules.token_store import (
+    TOKEN_LIFETIME,
+    TOKEN_REFRESH_MARGIN,
+    TokenStore
+)
+
+from conftest import request_counts
+
+
+def _handler(mock_fmc, store):
+    return FmcApiHandler(mock_fmc.address, 'admin', 'admin', scheme='http', token_store=store)
+
+
+def test_token_is_shared_across_handlers(tmp_path, mock_fmc):
+    store = TokenStore(str(tmp_path / 'tokens.json'))
+    request_counts(mock_fmc, reset=True)
+    for _ in range(3):
+        with _handler(mock_fmc, store) as fmc:
+            assert fmc.get_version()
+    assert request_counts(mock_fmc)['POST token'] == 1
+    assert stat.S_IMODE(os.stat(store.path).st_mode) == 0o600
+
+
+def test_token_about_to_expire_is_refreshed(tmp_path, mock_fmc):
+    store = TokenStore(str(tmp_path / 'tokens.json'))
+    with _handler(mock_fmc, store):
+        pass
+    entry = store.load(mock_fmc.address, 'admin', 'Global')
+    entry['issued_at'] -= TOKEN_LIFETIME - TOKEN_REFRESH_MARGIN + 1
+    store.save(mock_fmc.address, 'admin', 'Global', entry)
+    request_counts(mock_fmc, reset=True)
+    with _handler(mock_fmc, store) as fmc:
+        assert fmc.get_version()
+    assert request_counts(mock_fmc) == {'POST refresh': 1, 'GET version': 1}
+    refreshed = store.load(mock_fmc.address, 'admin', 'Global')
+    assert refreshed['token'] != entry['token'] and refreshed['refresh_count'] == 1
+
+
+def test_rejected_token_is_replaced(tmp_path, mock_fmc):
+    store = TokenStore(str(tmp_path / 'tokens.json'))
+    with _handler(mock_fmc, store) as fmc:
+        rejected = fmc.token
+        # FMC forgets its tokens, e.g. after a restart
+        mock_fmc.state.tokens.clear()
+        request_counts(mock_fmc, reset=True)
+        assert fmc.get_version()
+    assert request_counts(mock_fmc) == {'GET version': 2, 'POST token': 1}
+    assert store.load(mock_fmc.address, 'admin', 'Global')['token'] not in (None, rejected)